@@ -0,0 +1,53 @@
+import argparse
+
+# vseek imports
+from vseek.utils.kmer_index import DEFAULT_SEED_SIZE
+from vseek.utils.reference_catalog import DEFAULT_MERGE_OVERLAP
+from vseek.utils.db_artifacts import artifacts_status, build_artifacts
+
+if __name__ == "__main__":
+
+    # CLI arguments
+    parser = argparse.ArgumentParser(
+        description="Builds the database artifacts loaded by run_vseek.py: "
+        "reference pack, encoded catalog, seed index and sketches"
+    )
+    parser.add_argument(
+        "--merge_overlap",
+        type=int,
+        required=False,
+        default=DEFAULT_MERGE_OVERLAP,
+        help="Overlapping gene annotations sharing at least this many bases are scanned once, 0 disables merging",
+    )
+    parser.add_argument(
+        "--seed_size",
+        type=int,
+        required=False,
+        default=DEFAULT_SEED_SIZE,
+        help="k-mer size of the seed index, 0 skips building it",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=None,
+        help="Number of processes building the artifacts, default uses all cores",
+    )
+    parser.add_argument(
+        "--check",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Only reports whether the artifacts are missing, stale or current",
+    )
+    args = parser.parse_args()
+
+    status = artifacts_status(args.merge_overlap, args.seed_size)
+    print(f"Database artifacts: {status}")
+    if args.check:
+        raise SystemExit(0 if status == "current" else 1)
+
+    stamp = build_artifacts(args.merge_overlap, args.seed_size, workers=args.workers)
+    for name, seconds in stamp["build_seconds"].items():
+        print(f"{name}: {seconds:.2f} s")
+    print("\nprocess complete")
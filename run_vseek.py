@@ -1,7 +1,8 @@
 import json
 import argparse
+from collections import Counter
 from pathlib import Path
-from collections import defaultdict
+from itertools import chain
 
 import numpy as np
 import pandas as pd
@@ -13,10 +14,146 @@ import vseek.common.loader as vloader
 import vseek.common.vseek_paths as vsp
 from vseek.utils.sequence_io import SequenceIO
 from vseek.utils.sra_callers import download_fasta
-from vseek.utils.vseek_analysis import dynamic_hamming
+from vseek.utils.parallel import ParallelClassifier
+from vseek.utils.shared_arrays import prefixed_arrays, unprefixed_arrays
+from vseek.utils.scheduler import TiledScheduler, DEFAULT_TILE_READS
+from vseek.utils.kmer_index import KmerIndex, DEFAULT_SEED_SIZE
+from vseek.utils.reference_catalog import ReferenceCatalog, DEFAULT_MERGE_OVERLAP
+from vseek.utils.sketches import AccessionSketches
+from vseek.utils.db_artifacts import (
+    AUTOTUNE_FILE,
+    artifact_path,
+    artifacts_status,
+    build_artifacts,
+    read_build_stamp,
+)
+from vseek.utils.shared_reference import SharedReference, segment_name
+from vseek.utils.taxonomy_search import TaxonomySearch
+from vseek.utils.vseek_analysis import (
+    SCORING_BACKENDS,
+    THRESHOLD_SCANS,
+    autotune_threshold_scan,
+)
 from vseek.utils.vseek_plots import plot_viral_composition, bat_country_geo_plot
 from vseek.apis.ncbi import get_all_viral_accessions, get_viral_genes, get_viral_genomes
 
+# number of reads screened against the accession sketches at once
+READ_BATCH_SIZE = 1024
+
+
+def check_database_artifacts(
+    merge_overlap: int, seed_size: int, rebuild_db: bool = False
+) -> str:
+    """Makes sure the prebuilt database artifacts (see build_database.py)
+    match the genome database and the run parameters. Missing artifacts are
+    built, stale ones are only rebuilt if asked to
+
+    Parameters
+    ----------
+    merge_overlap : int
+        minimum overlap of merged gene annotations, 0 disables merging
+    seed_size : int
+        k-mer size of the seed index, 0 disables the index
+    rebuild_db : bool, optional
+        rebuilds stale artifacts instead of raising an error, default is
+        False
+
+    Returns
+    -------
+    str
+        inputs hash of the artifacts (see db_artifacts.inputs_hash)
+
+    Raises
+    ------
+    ValueError
+        raised if the artifacts are stale and rebuild_db is False
+    """
+    status = artifacts_status(merge_overlap, seed_size)
+    if status == "stale" and not rebuild_db:
+        raise ValueError(
+            "Database artifacts in db/index do not match the genome database or "
+            "--merge_overlap/--seed_size. Run build_database.py with the same "
+            "parameters or pass --rebuild_db"
+        )
+    if status != "current":
+        print(f"Building database artifacts ({status})")
+        return build_artifacts(merge_overlap, seed_size)["inputs_hash"]
+
+    return read_build_stamp()["inputs_hash"]
+
+
+def load_shared_reference(inputs_hash: str, seed_size: int) -> tuple:
+    """Attaches to the reference catalog and seed index shared by the VSeek
+    runs of this node, publishing them if no run did yet
+
+    Parameters
+    ----------
+    inputs_hash : str
+        inputs hash of the artifacts (see check_database_artifacts), runs
+        using the same artifacts share the segment
+    seed_size : int
+        k-mer size of the seed index, 0 disables the index
+
+    Returns
+    -------
+    tuple
+        SharedReference (to close once classification is done), catalog and
+        seed index (None if seed_size is 0)
+    """
+
+    def build_reference_arrays() -> dict:
+        print("Publishing the shared reference catalog")
+        catalog = ReferenceCatalog.load(artifact_path("catalog"))
+        arrays = prefixed_arrays("catalog", catalog.to_arrays())
+        if seed_size > 0:
+            index = KmerIndex.load(artifact_path("kmer_index"))
+            arrays.update(prefixed_arrays("index", index.to_arrays()))
+
+        return arrays
+
+    shared_reference = SharedReference(
+        segment_name(inputs_hash), build=build_reference_arrays
+    )
+    arrays = shared_reference.open()
+
+    catalog = ReferenceCatalog.from_arrays(unprefixed_arrays("catalog", arrays))
+    index_arrays = unprefixed_arrays("index", arrays)
+    index = KmerIndex.from_arrays(index_arrays) if index_arrays else None
+
+    return (shared_reference, catalog, index)
+
+
+def classifier_options(args: argparse.Namespace) -> dict:
+    """Scoring options of the discovery step shared by TiledScheduler and
+    ParallelClassifier
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        parsed CLI arguments
+
+    Returns
+    -------
+    dict
+        threshold, floor, backend, scoring_mode, exact_match and
+        sample_stride keyword arguments
+    """
+    # the registry backends ignore the threshold and the best score so far,
+    # only the threshold-aware scans prune windows. auto is replaced by the
+    # autotuned scan at startup, unless the sampled estimate is used
+    backend = args.scoring_backend
+    if backend in ("auto", "threshold"):
+        backend = None
+
+    return {
+        "threshold": args.threshold,
+        "floor": args.containment_floor,
+        "backend": backend,
+        "scoring_mode": args.scoring_mode,
+        "exact_match": args.exact_match,
+        "sample_stride": args.sample_stride or None,
+    }
+
 
 def rel_abundance(counts: int, counts_sum: int) -> float:
     """Calculates relative abundance given total sum
@@ -81,6 +218,106 @@ if __name__ == "__main__":
         required=False,
         help="relative abundance cutoff. The smaller the percentage, the noisier the data",
     )
+    parser.add_argument(
+        "--seed_size",
+        default=DEFAULT_SEED_SIZE,
+        type=int,
+        required=False,
+        help="k-mer size used to find candidate windows. 0 scores every window",
+    )
+    parser.add_argument(
+        "--containment_floor",
+        default=0.0,
+        type=float,
+        required=False,
+        help="Minimum estimated k-mer containment of a read in an accession before scoring it. Reads below roughly 85%% identity share almost no k-mers with their reference and are dropped, lowering recall at low --threshold. Reads without any sampled k-mer (shorter than 16 bases or ambiguous) skip the screen. 0 (default) scores every accession",
+    )
+    parser.add_argument(
+        "--taxonomy_search",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Screens reads against viral families, then genera, before the accessions. Requires --containment_floor above 0",
+    )
+    parser.add_argument(
+        "--exact_match",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Resolves reads occurring exactly in a reference gene before any Hamming scoring",
+    )
+    parser.add_argument(
+        "--group_by_length",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Batches reads of the same length together, e.g. for trimmed reads of varying lengths",
+    )
+    parser.add_argument(
+        "--sample_stride",
+        default=0,
+        type=int,
+        required=False,
+        help="Windows are first compared on positions spaced at most this far apart, only the ones that can still reach --threshold are scored. Only used by the threshold-aware scans (--scoring_backend auto, threshold, threshold_numpy or threshold_jit), replacing them. 0 disables the estimate",
+    )
+    parser.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        required=False,
+        help="Number of processes classifying reads. References are shared between them",
+    )
+    parser.add_argument(
+        "--rebuild_db",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Rebuilds the database artifacts of db/index if they are stale instead of stopping. See build_database.py",
+    )
+    parser.add_argument(
+        "--shared_reference",
+        required=False,
+        default=False,
+        action="store_true",
+        help="Attaches to the encoded references published by another VSeek run on this node, or publishes them for later runs",
+    )
+    parser.add_argument(
+        "--block_bases",
+        default=0,
+        type=int,
+        required=False,
+        help="Splits the references into blocks of about this many bases and classifies read batches tile by tile on --workers threads. 0 uses one process per worker instead",
+    )
+    parser.add_argument(
+        "--tile_reads",
+        default=DEFAULT_TILE_READS,
+        type=int,
+        required=False,
+        help="Number of reads per tile, only used with --block_bases",
+    )
+    parser.add_argument(
+        "--scoring_backend",
+        default="auto",
+        type=str,
+        required=False,
+        choices=["auto", "threshold"] + list(THRESHOLD_SCANS) + list(SCORING_BACKENDS),
+        help="Scoring backend used for full gene scans. The threshold-aware scans abandon windows that cannot beat the threshold or the best score so far: threshold_numpy, threshold_jit (compiled, only if numba is installed) and threshold (threshold_jit if numba is installed). auto benchmarks the threshold-aware scans on the read lengths of the first batch and caches the fastest in the database index directory. The other backends score every window in full",
+    )
+    parser.add_argument(
+        "--scoring_mode",
+        default="hamming",
+        type=str,
+        required=False,
+        choices=["hamming", "edit"],
+        help="hamming scores substitutions only, edit also tolerates insertions and deletions",
+    )
+    parser.add_argument(
+        "--merge_overlap",
+        default=DEFAULT_MERGE_OVERLAP,
+        type=int,
+        required=False,
+        help="Overlapping gene annotations sharing at least this many bases are scanned once. Must be at least the longest read length, 0 disables merging",
+    )
     parser.add_argument(
         "--viral_counts",
         default=None,
@@ -112,6 +349,30 @@ if __name__ == "__main__":
         raise ValueError("Similarity threshold must be between 0 <= x > 1.0")
     if args.rel_threshold > 100.0 or args.rel_threshold < 0:
         raise ValueError("Similarity threshold must be beteen 0.0 < x > 100.0")
+    if args.merge_overlap < 0:
+        raise ValueError("Merge overlap must be 0 <= x")
+    if args.seed_size > 32 or args.seed_size < 0:
+        raise ValueError("Seed size must be between 0 <= x <= 32")
+    if args.containment_floor > 1.0 or args.containment_floor < 0:
+        raise ValueError("Containment floor must be between 0 <= x <= 1.0")
+    if args.taxonomy_search and args.containment_floor == 0:
+        raise ValueError(
+            "Taxonomy search screens reads against the containment floor, "
+            "use --containment_floor above 0"
+        )
+    if args.sample_stride < 0:
+        raise ValueError("Sample stride must be 0 <= x")
+    if args.sample_stride > 0 and args.scoring_backend in SCORING_BACKENDS:
+        raise ValueError(
+            "Sample stride is only used by the threshold-aware scans, use "
+            "--scoring_backend auto, threshold or a threshold_ backend"
+        )
+    if args.workers < 1:
+        raise ValueError("At least one worker is required")
+    if args.block_bases < 0:
+        raise ValueError("Block bases must be 0 <= x")
+    if args.tile_reads < 1:
+        raise ValueError("At least one read per tile is required")
 
     # -----------------------
     # step 0. setup and data collection
@@ -162,46 +423,122 @@ if __name__ == "__main__":
         )
         # parameters
         counts_save_path = (
-            Path(results_path) / f"{args.accession}_viral_composition_counts.json"
+            Path(results_path) / f"{args.input[0]}_viral_composition_counts.json"
         )
-        all_accessions = list(vfiles.viral_genome_paths().keys())
         metagenome_path = vfiles.get_meta_genomes_paths()
         reader = SequenceIO(metagenome_path)
-        reads = reader.lazy_load_fasta()
+        read_batches = reader.iter_batches(
+            READ_BATCH_SIZE, group_by_length=args.group_by_length
+        )
         threshold = (
             args.threshold
         )  # threshold between 40% and 80% is enough to get genius level
 
-        counts = defaultdict(lambda: 0)
-        for idx, read in enumerate(reads):
+        # loading the encoded genes and indexes built by build_database.py
+        artifacts_hash = check_database_artifacts(
+            args.merge_overlap, args.seed_size, args.rebuild_db
+        )
+        shared_reference = None
+        if args.shared_reference:
+            shared_reference, catalog, index = load_shared_reference(
+                artifacts_hash, args.seed_size
+            )
+        else:
+            catalog = ReferenceCatalog.load(artifact_path("catalog"))
+            index = None
+            if args.seed_size > 0:
+                index = KmerIndex.load(artifact_path("kmer_index"))
+        print(
+            f"Reference catalog: {catalog.total_length} bases, "
+            f"{catalog.unique_length} unique bases scanned"
+        )
 
-            if idx % 5 == 0:
-                # saving every 5 analyzed reads
+        # accession sketches used to skip reads that do not match any virus
+        sketches = None
+        if args.containment_floor > 0 and args.taxonomy_search:
+            sketches = TaxonomySearch.load(artifact_path("taxonomy_sketches"))
+        elif args.containment_floor > 0:
+            sketches = AccessionSketches.load(artifact_path("accession_sketches"))
+
+        counts = Counter()
+        scan_stats = Counter()
+
+        # checking the read lengths against the merged annotations
+        first_batch = next(read_batches, [])
+        read_batches = chain([first_batch], read_batches) if first_batch else []
+        read_lengths = [len(read) for read in first_batch]
+        longest_read = max(read_lengths, default=0)
+        if 0 < args.merge_overlap < longest_read:
+            print(
+                f"WARNING: reads up to {longest_read} bases are longer than "
+                f"--merge_overlap {args.merge_overlap}, scores may change"
+            )
+
+        # picking the fastest threshold-aware scan for these read lengths
+        if args.scoring_backend == "auto" and args.sample_stride == 0 and read_lengths:
+            args.scoring_backend = autotune_threshold_scan(
+                read_lengths,
+                args.threshold,
+                cache_path=str(Path(vsp.index_db_path()) / AUTOTUNE_FILE),
+            )
+            print(f"Scoring backend: {args.scoring_backend}")
+
+        if args.block_bases > 0:
+            parallel_classifier = TiledScheduler(
+                catalog,
+                workers=args.workers,
+                index=index,
+                sketches=sketches,
+                block_bases=args.block_bases,
+                tile_reads=args.tile_reads,
+                **classifier_options(args),
+            )
+        else:
+            parallel_classifier = ParallelClassifier(
+                catalog,
+                workers=args.workers,
+                index=index,
+                sketches=sketches,
+                **classifier_options(args),
+            )
+        with parallel_classifier:
+            # reads not matching any accession are not counted
+            for batch_no, (batch_counts, batch_stats) in enumerate(
+                parallel_classifier.imap(read_batches)
+            ):
+                counts.update(batch_counts)
+                scan_stats.update(batch_stats)
+
+                # saving after every classified batch
                 with open(counts_save_path, "w") as outfile:
                     json.dump(counts, outfile)
+                print(f"Classified {batch_no + 1} batches, {scan_stats['reads']} reads")
 
-            if idx % 100 == 0:
-                print(f"Currently on read number {idx}")
-
-            read_score = {}
-            for acc_id in all_accessions:
-                # load all the gene sequences
-                gene_sequences = vloader.load_viral_genes(acc_id)
-
-                top_score = 0.0
-                for gene in gene_sequences:
-                    score = dynamic_hamming(read=read.sequence, reference=gene)
-                    if score >= threshold:
-                        if score == 1:
-                            top_score = score
-                            break
-                        elif score > top_score:
-                            top_score = score
+        with open(counts_save_path, "w") as outfile:
+            json.dump(counts, outfile)
+        if shared_reference is not None:
+            shared_reference.close()
 
-                read_score[acc_id] = top_score
-
-            top_score_acc_ids = max(read_score, key=read_score.get)
-            counts[top_score_acc_ids] += 1
+        abandoned = scan_stats["windows_abandoned"]
+        scanned = max(scan_stats["windows_scanned"], 1)
+        print(
+            f"Scanned {scan_stats['windows_scanned']} windows, "
+            f"{abandoned} ({abandoned / scanned:.1%}) abandoned early. "
+            f"{scan_stats['genes_skipped']} genes skipped, "
+            f"{scan_stats['genes_deduplicated']} duplicated genes skipped, "
+            f"{scan_stats['accessions_pruned']} accessions pruned, "
+            f"{scan_stats['screen_comparisons']} screening comparisons, "
+            f"{scan_stats['exact_hits']} exact hits"
+        )
+        if args.sample_stride > 0:
+            sampled = max(scan_stats["windows_sampled"], 1)
+            print(
+                f"Sampled estimate: {scan_stats['windows_sample_passed']} of "
+                f"{scan_stats['windows_sampled']} windows "
+                f"({scan_stats['windows_sample_passed'] / sampled:.1%}) passed"
+            )
+        if args.block_bases > 0:
+            print(parallel_classifier.timing_report())
 
         viral_count_data = vloader.load_viral_counts(counts_save_path)
     else:
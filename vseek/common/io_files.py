@@ -1,6 +1,7 @@
 import os
 import glob
 import json
+import hashlib
 from typing import Union
 from collections import defaultdict
 from pathlib import Path
@@ -9,10 +10,21 @@ import pandas as pd
 # vseek imports
 import vseek.common.vseek_paths as vsp
 import vseek.common.loader as vloader
+import vseek.common.reference_pack as vpack
 import vseek.utils.vseek_plots as vplots
 from vseek.common.errors import *
 from vseek.common.checks import prefetch_dir_exists, metagenome_dir_exists
 
+# version of the genome database manifest format
+MANIFEST_VERSION = 1
+
+# genome database manifest and the paths of the genome database and of the
+# manifest, resolved once per process (see _genome_manifest)
+_MANIFEST = {}
+
+# files of a genome directory described in the manifest
+_GENOME_FILE_PATTERNS = [("fasta", "*.fasta"), ("genes", "*_genes.json")]
+
 
 def genome_dir_paths() -> list[str]:
     """Obtains all viral genome directories in the genome database
@@ -22,13 +34,70 @@ def genome_dir_paths() -> list[str]:
     list[str]
         list of paths to each fasta file in the genome database
     """
-    genome_db_path = vsp.genome_db_path()
-    query = f"{genome_db_path}/*"
-    all_genome_dirs = glob.glob(query)
+    genome_db_path = _database_paths()[0]
+    all_genome_dirs = [
+        str(genome_db_path / genome_id) for genome_id in _genome_manifest()
+    ]
 
     return all_genome_dirs
 
 
+def get_genome_manifest() -> dict:
+    """Returns the manifest of the genome database. It is read once per
+    process from the index directory and rebuilt if genome directories were
+    added or removed since it was written
+
+    Returns
+    -------
+    dict
+        accession id and its "fasta" and "genes" files as key value pairs.
+        Each file is described by its path (relative to the genome database),
+        size, mtime_ns and blake2b checksum, None if the file is missing
+    """
+    return _genome_manifest()
+
+
+def reset_genome_manifest() -> None:
+    """Forgets the manifest and the genome database path resolved by this
+    process, e.g. after changing the working directory. They are resolved
+    again by the next lookup"""
+    _MANIFEST.clear()
+
+
+def refresh_genome_manifest() -> dict:
+    """Checks the size and mtime of every genome file of the manifest and
+    scans again the genome directories whose files changed, e.g. edited in
+    place. Costs one stat per file, files are only read again if changed
+
+    Returns
+    -------
+    dict
+        up to date genome database manifest (see get_genome_manifest)
+    """
+    genome_db_path = _database_paths()[0]
+    for genome_id, genome_files in list(_genome_manifest().items()):
+        for file_type, file_pattern in _GENOME_FILE_PATTERNS:
+            genome_file = genome_files[file_type]
+            if genome_file is None:
+                changed = any((genome_db_path / genome_id).glob(file_pattern))
+            else:
+                try:
+                    file_stat = (genome_db_path / genome_file["path"]).stat()
+                except FileNotFoundError:
+                    changed = True
+                else:
+                    changed = (file_stat.st_size, file_stat.st_mtime_ns) != (
+                        genome_file["size"],
+                        genome_file["mtime_ns"],
+                    )
+
+            if changed:
+                _update_manifest(genome_id)
+                break
+
+    return _genome_manifest()
+
+
 def get_viral_genome_fasta_paths(query=None) -> dict:
     """Retrieves all genome fasta file paths
 
@@ -44,13 +113,12 @@ def get_viral_genome_fasta_paths(query=None) -> dict:
     if query is None:
         return _viral_genome_fasta_path_lookup()
     else:
-        fasta_file_paths = _viral_genome_fasta_path_lookup()
         if not isinstance(query, list):
             query = query.split()
 
         result_query = defaultdict(None)
         for q in query:
-            result = fasta_file_paths[q]
+            result = _manifest_file_path(q, "fasta")
             if result is None:
                 raise FastaFileNotFound(f"{q} does not exist")
             result_query[q] = result
@@ -73,13 +141,12 @@ def get_genome_genes_paths(query=None) -> dict:
     if query is None:
         return _genes_path_lookup()
     else:
-        fasta_file_paths = _genes_path_lookup()
         if not isinstance(query, list):
             query = query.split()
 
         result_query = defaultdict(None)
         for q in query:
-            result = fasta_file_paths[q]
+            result = _manifest_file_path(q, "genes")
             if result is None:
                 raise ProfileNotFound(f"{q} does not exist")
             result_query[q] = result
@@ -178,6 +245,10 @@ def save_genome(accession: str, contents: str) -> None:
     save_path = genome_path / f"{accession}.fasta"
     with open(save_path, "w") as outfile:
         outfile.write(contents)
+    _update_manifest(accession)
+
+    # the packed genome database no longer matches the directories
+    vpack.remove_reference_pack()
 
 
 def save_genes(accession: str, contents: dict) -> None:
@@ -198,9 +269,13 @@ def save_genes(accession: str, contents: dict) -> None:
     json_conts = defaultdict(None).fromkeys([accession])
     json_conts[accession] = contents
 
-    save_path = Path(vsp.genome_db_path()) / accession / f"{accession}_genes.json"
+    save_path = _database_paths()[0] / accession / f"{accession}_genes.json"
     with open(save_path, "w") as infile:
         json.dump(json_conts, infile)
+    _update_manifest(accession)
+
+    # the packed genome database no longer matches the directories
+    vpack.remove_reference_pack()
 
 
 def save_interaction_profiles(ppi_df: pd.DataFrame):
@@ -271,14 +346,15 @@ def clean_all_genes() -> None:
     --------
     None
     """
-    targets = get_genome_genes_paths().values()
+    targets = get_genome_genes_paths()
     if len(targets) == 0:
         print("Warning: There are no gene files")
         return
 
-    for target in targets:
+    for genome_id, target in targets.items():
         if Path(target).is_file():
             os.remove(target)
+            _update_manifest(genome_id)
         else:
             print(f"Warning: {target} is not a file")
 
@@ -294,14 +370,13 @@ def _viral_genome_fasta_path_lookup() -> dict:
     dict
         accession number and path as key value pairs
     """
-    genome_db_paths = genome_dir_paths()
+    genome_db_path = _database_paths()[0]
 
     all_fasta_paths = defaultdict(None)
-    for genome_path in genome_db_paths:
-        genome_id = genome_path.split("/")[-1].split(".")[0]
-        query = f"{genome_path}/*.fasta"
-        fasta_file_path = glob.glob(query)[0]
-        all_fasta_paths[genome_id] = fasta_file_path
+    for genome_id, genome_files in _genome_manifest().items():
+        if genome_files["fasta"] is not None:
+            fasta_file_path = genome_db_path / genome_files["fasta"]["path"]
+            all_fasta_paths[genome_id] = str(fasta_file_path)
 
     return all_fasta_paths
 
@@ -314,17 +389,13 @@ def _genes_path_lookup() -> dict:
     dict
         accession number and profile path as key value pairs
     """
-    genome_db_paths = genome_dir_paths()
+    genome_db_path = _database_paths()[0]
 
     all_genome_profile_paths = defaultdict(None)
-    for genome_path in genome_db_paths:
-        genome_id = genome_path.split("/")[-1]
-        query = f"{genome_path}/*_genes.json"
-        fasta_file_path = glob.glob(query)[0]
-
-        if len(fasta_file_path) == 0:
-            continue
-        all_genome_profile_paths[genome_id] = fasta_file_path
+    for genome_id, genome_files in _genome_manifest().items():
+        if genome_files["genes"] is not None:
+            genes_file_path = genome_db_path / genome_files["genes"]["path"]
+            all_genome_profile_paths[genome_id] = str(genes_file_path)
 
     return all_genome_profile_paths
 
@@ -345,6 +416,176 @@ def _genome_dir_path_lookup() -> dict:
     return all_profiles
 
 
+def _genome_manifest() -> dict:
+    """Loads the genome database manifest once per process. The manifest is
+    rebuilt by scanning the genome directories if it is missing, has another
+    format version or does not list the same genome directories
+
+    Returns
+    -------
+    dict
+        accession id and its genome files as key value pairs (see
+        get_genome_manifest)
+    """
+    if "genome_files" in _MANIFEST:
+        return _MANIFEST["genome_files"]
+
+    # a single directory listing detects genomes added by other means
+    genome_db_path, manifest_path = _database_paths()
+    genome_ids = set()
+    if genome_db_path.is_dir():
+        genome_ids = {
+            entry.name for entry in os.scandir(genome_db_path) if entry.is_dir()
+        }
+
+    genome_files = None
+    if manifest_path.is_file():
+        with open(manifest_path, "r") as infile:
+            manifest = json.load(infile)
+        if manifest.get("version") == MANIFEST_VERSION:
+            genome_files = manifest["genome_files"]
+
+    if genome_files is None or set(genome_files) != genome_ids:
+        genome_files = {
+            genome_id: _scan_genome_dir(genome_db_path / genome_id)
+            for genome_id in sorted(genome_ids)
+        }
+        if len(genome_files) > 0:
+            _write_manifest(genome_files)
+
+    _MANIFEST["genome_files"] = genome_files
+
+    return genome_files
+
+
+def _manifest_file_path(accession: str, file_type: str):
+    """Looks up the path of a genome file in the manifest. Genome
+    directories missing from the manifest, e.g. written by another process,
+    are scanned before giving up
+
+    Parameters
+    ----------
+    accession : str
+        accession id
+    file_type : str
+        "fasta" or "genes"
+
+    Returns
+    -------
+    str, None
+        path to the file, None if it does not exist
+    """
+    genome_files = _genome_manifest().get(accession)
+    if genome_files is None or genome_files[file_type] is None:
+        genome_files = _update_manifest(accession)
+    if genome_files is None or genome_files[file_type] is None:
+        return None
+
+    return str(_database_paths()[0] / genome_files[file_type]["path"])
+
+
+def _update_manifest(accession: str):
+    """Scans the genome directory of one accession again and saves the
+    updated manifest
+
+    Parameters
+    ----------
+    accession : str
+        accession id
+
+    Returns
+    -------
+    dict, None
+        genome files of the accession, None if its directory does not exist
+    """
+    all_genome_files = _genome_manifest()
+
+    genome_dir = _database_paths()[0] / accession
+    genome_files = None
+    if genome_dir.is_dir():
+        genome_files = _scan_genome_dir(genome_dir)
+
+    if genome_files != all_genome_files.get(accession):
+        if genome_files is None:
+            del all_genome_files[accession]
+        else:
+            all_genome_files[accession] = genome_files
+        _write_manifest(all_genome_files)
+
+    return genome_files
+
+
+def _scan_genome_dir(genome_dir: Path) -> dict:
+    """Describes the fasta and genes files of a genome directory
+
+    Parameters
+    ----------
+    genome_dir : Path
+        genome directory of one accession
+
+    Returns
+    -------
+    dict
+        "fasta" and "genes" file descriptions (path relative to the genome
+        database, size, mtime_ns and checksum), None for missing files
+    """
+    genome_files = {}
+    for file_type, file_pattern in _GENOME_FILE_PATTERNS:
+        file_paths = sorted(genome_dir.glob(file_pattern))
+        if len(file_paths) == 0:
+            genome_files[file_type] = None
+            continue
+
+        file_path = file_paths[0]
+        file_stat = file_path.stat()
+        with open(file_path, "rb") as infile:
+            checksum = hashlib.blake2b(infile.read(), digest_size=16).hexdigest()
+
+        genome_files[file_type] = {
+            "path": f"{genome_dir.name}/{file_path.name}",
+            "size": file_stat.st_size,
+            "mtime_ns": file_stat.st_mtime_ns,
+            "checksum": checksum,
+        }
+
+    return genome_files
+
+
+def _database_paths() -> tuple:
+    """Resolves the genome database and manifest paths once per process,
+    lookups then skip the root path search of vseek_paths
+
+    Returns
+    -------
+    tuple
+        genome database path and manifest path (which may not exist)
+    """
+    if "paths" not in _MANIFEST:
+        _MANIFEST["paths"] = (
+            Path(vsp.genome_db_path()),
+            Path(vsp.index_db_path()) / "genome_manifest.json",
+        )
+
+    return _MANIFEST["paths"]
+
+
+def _write_manifest(genome_files: dict) -> None:
+    """Saves the genome database manifest. The file is written under a
+    temporary name and then renamed, so readers never see a partial file
+
+    Parameters
+    ----------
+    genome_files : dict
+        accession id and its genome files as key value pairs
+    """
+    manifest_path = _database_paths()[1]
+    manifest_path.parent.mkdir(exist_ok=True)
+    temp_path = manifest_path.with_suffix(f".tmp{os.getpid()}")
+    with open(temp_path, "w") as outfile:
+        json.dump({"version": MANIFEST_VERSION, "genome_files": genome_files}, outfile)
+    os.replace(temp_path, manifest_path)
+
+
 def _all_prefetch_files() -> list[str]:
     """Returns a list of files sra files inside the prefetch directory
 
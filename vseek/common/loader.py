@@ -7,10 +7,12 @@ import vseek.common.vseek_paths as vsp
 from vseek.common.errors import InvalidFileError
 import vseek.apis.string_db as string_db
 import vseek.common.io_files as vloader
+import vseek.common.reference_pack as vpack
 
 
 def load_genome(file_path: str) -> tuple:
-    """
+    """Loads a genome of the genome database from the reference pack when
+    it is packed, from its fasta file otherwise
 
     Parameters
     ----------
@@ -22,6 +24,16 @@ def load_genome(file_path: str) -> tuple:
     tuple
         header, flat sequence in a tuple
     """
+    # genomes of the database are named db/genome/<ACC>/<ACC>.fasta
+    pack = _reference_pack()
+    file_path_obj = Path(file_path)
+    accession = file_path_obj.stem
+    if (
+        pack is not None
+        and accession in pack
+        and file_path_obj.parent == Path(vsp.genome_db_path()) / accession
+    ):
+        return pack.genome(accession)
 
     # extension check
     contents = _read_fasta(file_path)
@@ -133,6 +145,11 @@ def load_viral_genes(accession: str) -> list[str]:
     list[str]
         list of coding sequences
     """
+    pack = _reference_pack()
+    if pack is not None and accession in pack:
+        header, viral_genome = pack.genome(accession)
+        return _sliced_sequences(viral_genome, pack.intervals(accession))
+
     viral_genome_paths = vloader.get_viral_genome_fasta_paths(query=accession)
     sel_viral_genome_path = viral_genome_paths[accession]
     header, viral_genome = load_genome(sel_viral_genome_path)
@@ -141,19 +158,129 @@ def load_viral_genes(accession: str) -> list[str]:
     viral_genes_paths = viral_genes_paths[accession]
     meta_data = load_genes_metadata(viral_genes_paths)
 
-    sequences = []
-    for id, gene_metadata in meta_data[accession].items():
+    return _annotated_sequences(viral_genome, meta_data[accession])
 
-        # some genes are not annotated
-        try:
-            beg, end = tuple(gene_metadata["annotation"])
-        except KeyError:
-            continue
 
-        annotated_sequence = viral_genome[beg : end + 1]
-        sequences.append(annotated_sequence)
+def load_all_viral_genes(accessions=None) -> dict:
+    """Returns annotated viral gene sequences of multiple accessions. The
+    genome database paths are only looked up once.
 
-    return sequences
+    Parameters
+    ----------
+    accessions : list[str], optional
+        accession ids, default None loads every accession in the database
+
+    Returns
+    -------
+    dict
+        accession id and list of coding sequences as key value pairs
+    """
+    pack = _reference_pack()
+    if _packed(pack, accessions):
+        all_sequences = {}
+        for accession in pack.accessions if accessions is None else accessions:
+            header, viral_genome = pack.genome(accession)
+            all_sequences[accession] = _sliced_sequences(
+                viral_genome, pack.intervals(accession)
+            )
+
+        return all_sequences
+
+    viral_genome_paths = vloader.get_viral_genome_fasta_paths()
+    viral_genes_paths = vloader.get_genome_genes_paths()
+    if accessions is None:
+        accessions = sorted(viral_genome_paths.keys())
+
+    all_sequences = {}
+    for accession in accessions:
+        header, viral_genome = load_genome(viral_genome_paths[accession])
+        meta_data = load_genes_metadata(viral_genes_paths[accession])
+        all_sequences[accession] = _annotated_sequences(
+            viral_genome, meta_data[accession]
+        )
+
+    return all_sequences
+
+
+def load_all_viral_gene_intervals(accessions=None) -> dict:
+    """Returns the viral genomes and their annotated gene intervals
+
+    Parameters
+    ----------
+    accessions : list[str], optional
+        accession ids, default None loads every accession in the database
+
+    Returns
+    -------
+    dict
+        accession id and (genome sequence, list of inclusive (begin, end)
+        gene intervals) as key value pairs
+    """
+    pack = _reference_pack()
+    if _packed(pack, accessions):
+        return {
+            accession: (pack.genome(accession)[1], pack.intervals(accession))
+            for accession in (pack.accessions if accessions is None else accessions)
+        }
+
+    viral_genome_paths = vloader.get_viral_genome_fasta_paths()
+    viral_genes_paths = vloader.get_genome_genes_paths()
+    if accessions is None:
+        accessions = sorted(viral_genome_paths.keys())
+
+    all_intervals = {}
+    for accession in accessions:
+        header, viral_genome = load_genome(viral_genome_paths[accession])
+        meta_data = load_genes_metadata(viral_genes_paths[accession])
+        all_intervals[accession] = (
+            viral_genome,
+            _annotated_intervals(meta_data[accession]),
+        )
+
+    return all_intervals
+
+
+def build_reference_pack(file_path=None, accessions=None):
+    """Compiles the genome database directories into a reference pack (see
+    reference_pack.ReferencePack). Genomes are always read from their files,
+    never from a previous pack
+
+    Parameters
+    ----------
+    file_path : str, optional
+        path of the pack, default None uses the index directory of the
+        database (see reference_pack.reference_pack_path)
+    accessions : list[str], optional
+        accession ids to pack, default None packs every accession in the
+        database
+
+    Returns
+    -------
+    ReferencePack
+        the opened pack
+    """
+    genome_checksums = _genome_checksums()
+    viral_genome_paths = vloader.get_viral_genome_fasta_paths()
+    viral_genes_paths = vloader.get_genome_genes_paths()
+    if accessions is None:
+        accessions = sorted(viral_genome_paths.keys())
+
+    genomes = []
+    for accession in accessions:
+        contents = _read_fasta(viral_genome_paths[accession])
+        header, viral_genome = _flatten_fasta_sequence(contents)
+        meta_data = load_genes_metadata(viral_genes_paths[accession])
+        genomes.append(
+            (
+                accession,
+                header,
+                viral_genome,
+                _annotated_intervals(meta_data[accession]),
+                genome_checksums[accession],
+            )
+        )
+
+    return vpack.ReferencePack.build(genomes, file_path=file_path)
 
 
 def load_species_atlas() -> pd.DataFrame:
@@ -248,6 +375,127 @@ def _read_fasta(fpath: str) -> str:
     return contents
 
 
+def _annotated_sequences(viral_genome: str, genes_metadata: dict) -> list[str]:
+    """Slices the annotated genes out of a viral genome
+
+    Parameters
+    ----------
+    viral_genome : str
+        flat viral genome sequence
+    genes_metadata : dict
+        gene ids and gene meta data as key value pairs
+
+    Returns
+    -------
+    list[str]
+        list of coding sequences
+    """
+    return _sliced_sequences(viral_genome, _annotated_intervals(genes_metadata))
+
+
+def _sliced_sequences(viral_genome: str, intervals: list[tuple]) -> list[str]:
+    """Slices gene intervals out of a viral genome
+
+    Parameters
+    ----------
+    viral_genome : str
+        flat viral genome sequence
+    intervals : list[tuple]
+        inclusive (begin, end) gene intervals
+
+    Returns
+    -------
+    list[str]
+        list of coding sequences
+    """
+    sequences = []
+    for beg, end in intervals:
+        annotated_sequence = viral_genome[beg : end + 1]
+        sequences.append(annotated_sequence)
+
+    return sequences
+
+
+def _reference_pack():
+    """Opens the reference pack, unless a genome file changed since it was
+    built (see io_files.refresh_genome_manifest)
+
+    Returns
+    -------
+    ReferencePack, None
+        opened pack, None if the genomes are read from their directories
+    """
+    return vpack.open_reference_pack(genome_checksums=_genome_checksums)
+
+
+def _genome_checksums() -> dict:
+    """Checksums of the fasta and genes files of every genome in the
+    database, compared with the ones stored in the reference pack
+
+    Returns
+    -------
+    dict
+        accession id and checksum of its genome files as key value pairs
+    """
+    return {
+        genome_id: ":".join(
+            "" if genome_file is None else genome_file["checksum"]
+            for genome_file in (genome_files["fasta"], genome_files["genes"])
+        )
+        for genome_id, genome_files in vloader.refresh_genome_manifest().items()
+    }
+
+
+def _packed(pack, accessions) -> bool:
+    """Checks that the reference pack holds all requested accessions
+
+    Parameters
+    ----------
+    pack : ReferencePack, None
+        opened reference pack, None if the genome database is not packed
+    accessions : list[str], None
+        accession ids, None for every accession in the database
+
+    Returns
+    -------
+    bool
+        True if the accessions can be loaded from the pack
+    """
+    if pack is None:
+        return False
+    if accessions is None:
+        return True
+
+    return all(accession in pack for accession in accessions)
+
+
+def _annotated_intervals(genes_metadata: dict) -> list[tuple]:
+    """Collects the annotated gene intervals of a viral genome
+
+    Parameters
+    ----------
+    genes_metadata : dict
+        gene ids and gene meta data as key value pairs
+
+    Returns
+    -------
+    list[tuple]
+        inclusive (begin, end) interval of each annotated gene
+    """
+    intervals = []
+    for id, gene_metadata in genes_metadata.items():
+
+        # some genes are not annotated
+        try:
+            beg, end = tuple(gene_metadata["annotation"])
+        except KeyError:
+            continue
+
+        intervals.append((beg, end))
+
+    return intervals
+
+
 def _flatten_fasta_sequence(contents: str) -> str:
     """Flattens FASTA sequence into one single line
 
@@ -0,0 +1,365 @@
+import os
+import mmap
+import struct
+from pathlib import Path
+
+import numpy as np
+
+# vseek imports
+import vseek.common.vseek_paths as vsp
+from vseek.common.errors import InvalidFileError
+
+# first bytes of every pack, followed by the format version
+PACK_MAGIC = b"VSEEKPAK"
+PACK_VERSION = 2
+
+# magic, format version, number of accessions, accession id, fasta header
+# and checksum widths, number of genes and total genome length
+_HEADER = struct.Struct("<8sIIIIIQQ")
+
+# start of every section is aligned to a cache line
+_ALIGNMENT = 64
+
+# opened packs, path -> ((size, mtime), ReferencePack or None if stale)
+_OPEN_PACKS = {}
+
+
+class ReferencePack:
+    """Read-only genome database compiled into a single memory-mapped file,
+    replacing one fasta and one genes JSON file per accession. Opening the
+    pack only reads its header and accession table, genome pages are loaded
+    by the OS when they are first touched. Genomes are stored as uint8 ASCII
+    codes, the encoding of encode_sequence, so any IUPAC code is kept.
+
+    The file has a header (see _HEADER) followed by these sections:
+    accession_table: genome offset and length, first gene and number of
+        genes of each accession (int64)
+    gene_table: inclusive (begin, end) annotation of each gene (int64)
+    accession_ids: accession ids (fixed width bytes)
+    fasta_headers: fasta header of each genome (fixed width bytes)
+    checksums: checksum of the files each genome was built from (fixed width
+        bytes), compared with the genome database before the pack is used
+    sequences: all genomes concatenated (uint8)
+    """
+
+    def __init__(self, file_path: str):
+        """
+        Parameters
+        ----------
+        file_path : str
+            path to the pack file
+
+        Raises
+        ------
+        InvalidFileError
+            raised if the file is not a pack or has another format version
+        """
+        self.path = str(file_path)
+        with open(self.path, "rb") as pack_file:
+            self._mmap = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < _HEADER.size:
+            raise InvalidFileError(f"{self.path} is not a reference pack")
+        magic, version = struct.unpack_from("<8sI", self._mmap)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise InvalidFileError(
+                f"{self.path} is not a version {PACK_VERSION} reference pack"
+            )
+        (
+            _,
+            _,
+            n_accessions,
+            id_width,
+            header_width,
+            checksum_width,
+            n_genes,
+            n_bases,
+        ) = _HEADER.unpack_from(self._mmap)
+
+        sections = _section_layout(
+            n_accessions, id_width, header_width, checksum_width, n_genes
+        )
+        sections["sequences"] = (np.uint8, (n_bases,), sections["sequences"][2])
+        arrays = {
+            name: np.ndarray(shape, dtype=dtype, buffer=self._mmap, offset=offset)
+            for name, (dtype, shape, offset) in sections.items()
+        }
+        self.accession_table = arrays["accession_table"]
+        self.gene_table = arrays["gene_table"]
+        self.fasta_headers = arrays["fasta_headers"]
+        self.checksums = arrays["checksums"]
+        self.sequences = arrays["sequences"]
+
+        self.accessions = [acc_id.decode() for acc_id in arrays["accession_ids"]]
+        self._acc_idx = {acc_id: idx for idx, acc_id in enumerate(self.accessions)}
+
+    @classmethod
+    def build(cls, genomes, file_path=None):
+        """Compiles genomes into a pack
+
+        Parameters
+        ----------
+        genomes : iterable
+            accession id, fasta header, flat sequence, inclusive (begin, end)
+            gene intervals and checksum of each genome, e.g. read from the
+            genome database by loader.build_reference_pack
+        file_path : str, optional
+            path of the pack, default None uses reference_pack_path()
+
+        Returns
+        -------
+        ReferencePack
+            the opened pack
+        """
+        if file_path is None:
+            vsp.init_index_db_path()
+            file_path = reference_pack_path()
+
+        accessions = []
+        fasta_headers = []
+        checksums = []
+        genome_sequences = []
+        intervals = []
+        accession_table = []
+        n_bases = 0
+        for accession, header, viral_genome, genome_intervals, checksum in genomes:
+            accession_table.append(
+                (n_bases, len(viral_genome), len(intervals), len(genome_intervals))
+            )
+            accessions.append(accession)
+            fasta_headers.append(header.encode())
+            checksums.append(checksum.encode())
+            genome_sequences.append(viral_genome.encode("ascii"))
+            intervals.extend(genome_intervals)
+            n_bases += len(viral_genome)
+
+        accession_table = np.array(accession_table, dtype=np.int64).reshape(-1, 4)
+        accession_ids = np.array([acc_id.encode() for acc_id in accessions])
+        fasta_headers = np.array(fasta_headers)
+        checksums = np.array(checksums)
+        gene_table = np.array(intervals, dtype=np.int64).reshape(-1, 2)
+        id_width = max(accession_ids.dtype.itemsize, 1)
+        header_width = max(fasta_headers.dtype.itemsize, 1)
+        checksum_width = max(checksums.dtype.itemsize, 1)
+
+        sections = _section_layout(
+            len(accessions), id_width, header_width, checksum_width, len(gene_table)
+        )
+        section_arrays = {
+            "accession_table": accession_table,
+            "gene_table": gene_table,
+            "accession_ids": accession_ids.astype(f"S{id_width}"),
+            "fasta_headers": fasta_headers.astype(f"S{header_width}"),
+            "checksums": checksums.astype(f"S{checksum_width}"),
+        }
+
+        # written under a temporary name, open packs are not affected
+        temp_path = Path(f"{file_path}.tmp{os.getpid()}")
+        with open(temp_path, "wb") as pack_file:
+            pack_file.write(
+                _HEADER.pack(
+                    PACK_MAGIC,
+                    PACK_VERSION,
+                    len(accessions),
+                    id_width,
+                    header_width,
+                    checksum_width,
+                    len(gene_table),
+                    n_bases,
+                )
+            )
+            for name, array in section_arrays.items():
+                pack_file.seek(sections[name][2])
+                pack_file.write(array.tobytes())
+            pack_file.seek(sections["sequences"][2])
+            for genome in genome_sequences:
+                pack_file.write(genome)
+            pack_file.truncate(sections["sequences"][2] + n_bases)
+        os.replace(temp_path, file_path)
+
+        return cls(file_path)
+
+    def genome(self, accession: str) -> tuple:
+        """Returns the fasta header and the genome of an accession
+
+        Parameters
+        ----------
+        accession : str
+            accession id
+
+        Returns
+        -------
+        tuple
+            header and flat sequence, same as loader.load_genome
+        """
+        acc_idx = self._acc_idx[accession]
+        header = self.fasta_headers[acc_idx].decode()
+
+        return (header, self.sequence(accession).tobytes().decode("ascii"))
+
+    def sequence(self, accession: str) -> np.ndarray:
+        """Returns the genome of an accession without copying it
+
+        Parameters
+        ----------
+        accession : str
+            accession id
+
+        Returns
+        -------
+        np.ndarray
+            read-only uint8 encoded genome, a view of the pack
+        """
+        genome_offset, genome_length, _, _ = self.accession_table[
+            self._acc_idx[accession]
+        ]
+
+        return self.sequences[genome_offset : genome_offset + genome_length]
+
+    def intervals(self, accession: str) -> list[tuple]:
+        """Returns the annotated gene intervals of an accession
+
+        Parameters
+        ----------
+        accession : str
+            accession id
+
+        Returns
+        -------
+        list[tuple]
+            inclusive (begin, end) interval of each annotated gene
+        """
+        _, _, first_gene, n_genes = self.accession_table[self._acc_idx[accession]]
+        gene_table = self.gene_table[first_gene : first_gene + n_genes]
+
+        return [(beg, end) for beg, end in gene_table.tolist()]
+
+    def genome_checksums(self) -> dict:
+        """Returns the checksums of the files each genome was built from
+
+        Returns
+        -------
+        dict
+            accession id and checksum as key value pairs
+        """
+        return {
+            acc_id: checksum.decode()
+            for acc_id, checksum in zip(self.accessions, self.checksums)
+        }
+
+    def __contains__(self, accession: str) -> bool:
+        return accession in self._acc_idx
+
+    def __len__(self) -> int:
+        return len(self.accessions)
+
+
+def reference_pack_path() -> str:
+    """Returns the path of the reference pack of the genome database
+
+    Returns
+    -------
+    str
+        path to the reference pack, which may not exist
+    """
+    return str(Path(vsp.index_db_path()) / "reference.pack")
+
+
+def open_reference_pack(genome_checksums=None):
+    """Opens the reference pack of the genome database once per process. The
+    pack is opened again if the file was rebuilt since
+
+    Parameters
+    ----------
+    genome_checksums : callable, optional
+        returns the accession ids and checksums of the genome database (see
+        ReferencePack.genome_checksums), called when the pack is opened. The
+        pack is not used if they differ from the ones it was built from.
+        Default None trusts the pack
+
+    Returns
+    -------
+    ReferencePack, None
+        opened pack, None if the genome database is not packed, or was
+        changed since the pack was built
+    """
+    file_path = reference_pack_path()
+    try:
+        file_stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+
+    file_version = (file_stat.st_size, file_stat.st_mtime_ns)
+    if file_path not in _OPEN_PACKS or _OPEN_PACKS[file_path][0] != file_version:
+        try:
+            pack = ReferencePack(file_path)
+        except InvalidFileError:
+            pack = None
+
+        # genomes edited since the build are read from their directories
+        if (
+            pack is not None
+            and genome_checksums is not None
+            and pack.genome_checksums() != genome_checksums()
+        ):
+            pack = None
+        _OPEN_PACKS[file_path] = (file_version, pack)
+
+    return _OPEN_PACKS[file_path][1]
+
+
+def remove_reference_pack() -> None:
+    """Removes the reference pack, e.g. once the genome database changed.
+    Loaders then read the genome directories until the pack is rebuilt"""
+    Path(reference_pack_path()).unlink(missing_ok=True)
+    _OPEN_PACKS.pop(reference_pack_path(), None)
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+def _section_layout(
+    n_accessions: int,
+    id_width: int,
+    header_width: int,
+    checksum_width: int,
+    n_genes: int,
+) -> dict:
+    """Places the pack sections after the header
+
+    Parameters
+    ----------
+    n_accessions : int
+        number of accessions
+    id_width : int
+        width of the accession ids, in bytes
+    header_width : int
+        width of the fasta headers, in bytes
+    checksum_width : int
+        width of the genome checksums, in bytes
+    n_genes : int
+        number of genes
+
+    Returns
+    -------
+    dict
+        section name and (dtype, shape, byte offset) as key value pairs. The
+        sequences section is given with an empty shape
+    """
+    sections = {
+        "accession_table": (np.int64, (n_accessions, 4)),
+        "gene_table": (np.int64, (n_genes, 2)),
+        "accession_ids": (f"S{id_width}", (n_accessions,)),
+        "fasta_headers": (f"S{header_width}", (n_accessions,)),
+        "checksums": (f"S{checksum_width}", (n_accessions,)),
+        "sequences": (np.uint8, (0,)),
+    }
+
+    layout = {}
+    offset = _HEADER.size
+    for name, (dtype, shape) in sections.items():
+        offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+        layout[name] = (dtype, shape, offset)
+        offset += np.dtype(dtype).itemsize * int(np.prod(shape))
+
+    return layout
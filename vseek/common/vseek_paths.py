@@ -67,6 +67,18 @@ def genome_db_path() -> str:
     return str(gdb_path.absolute())
 
 
+def index_db_path() -> str:
+    """Returns path to the directory containing prebuilt search indexes
+
+    Returns
+    -------
+    str
+        path to index directory
+    """
+    index_path = Path(db_path()) / "index"
+    return str(index_path.absolute())
+
+
 def prefetch_path() -> str:
     """Returns path to SRA Prefetch directory
 
@@ -159,6 +171,22 @@ def init_genome_db_path() -> str:
     return genome_path
 
 
+def init_index_db_path() -> str:
+    """Returns path to the search index directory. If the directory does not
+    exists, it will create one.
+
+    Returns
+    -------
+    str
+        path to index directory
+    """
+    index_path_obj = Path(index_db_path())
+    index_path_obj.mkdir(exist_ok=True)
+    index_path = str(index_path_obj.absolute())
+
+    return index_path
+
+
 def init_prefetch_dir() -> str:
     """Creates a prefetch directory if it does not exists and returns
     the path.
@@ -1,20 +1,95 @@
 import unittest
+import argparse
 import numpy as np
 import pandas as pd
 import json
+import tempfile
+import hashlib
+import shutil
+import subprocess
+import sys
 from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+from unittest import mock
 
 # VSeek imports
+import run_vseek
 import vseek.common.io_files as vfiles
 import vseek.common.loader as vloader
 import vseek.common.vseek_paths as vsp
 from vseek.utils.sequence_io import SequenceIO
+from vseek.utils.data_structs import ReadBatch
 from vseek.utils.sra_callers import download_fasta
 from vseek.utils.vseek_analysis import dynamic_hamming
 from vseek.utils.vseek_plots import plot_viral_composition, bat_country_geo_plot
 from vseek.apis.ncbi import get_all_viral_accessions, get_viral_genes, get_viral_genomes
 from scipy.spatial.distance import hamming
-from vseek.utils.vseek_analysis import dynamic_hamming, hamming_distance_score
+from vseek.utils.vseek_analysis import (
+    SCORING_BACKENDS,
+    THRESHOLD_SCANS,
+    autotune_backend,
+    autotune_threshold_scan,
+    batch_hamming,
+    dynamic_hamming,
+    fft_hamming,
+    hamming_distance_score,
+    jit_hamming,
+    mismatch_budget,
+    sampled_hamming,
+    thresholded_hamming,
+    vectorized_hamming,
+)
+from vseek.utils.edit_distance import edit_similarity, semi_global_edit_distance
+from vseek.utils.jit_kernels import (
+    pattern_words,
+    text_words,
+    window_min_mismatches_loop,
+)
+from vseek.utils.nucleotide_codec import pack_sequence, unpack_sequence
+from vseek.utils.reference_catalog import ReferenceCatalog, merge_intervals
+from vseek.utils.classifier import classify_read, classify_read_batch, ReadClassifier
+from vseek.utils.kmer_index import KmerIndex, DEFAULT_SEED_SIZE
+from vseek.utils.sketches import AccessionSketches
+from vseek.utils.taxonomy_search import TaxonomySearch
+from vseek.utils.exact_match import ExactMatcher
+from vseek.utils.parallel import ParallelClassifier
+from vseek.utils.scheduler import TiledScheduler, reference_blocks
+from vseek.utils.shared_reference import SharedReference, remove_stale_segments
+from vseek.utils.db_artifacts import artifact_path, artifacts_status, build_artifacts
+
+
+@contextmanager
+def temporary_database(accessions=None):
+    """Points vseek_paths to a copy of the database in a temporary directory,
+    so that tests writing to it leave the user's database untouched
+
+    Parameters
+    ----------
+    accessions : list[str], optional
+        genomes to copy, default None copies the whole genome database
+
+    Yields
+    ------
+    Path
+        temporary database directory
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database_path = Path(temp_dir) / "db"
+        (database_path / "genome").mkdir(parents=True)
+        shutil.copy(
+            Path(vsp.db_path()) / "final_filtered_bat_virus.csv.gz", database_path
+        )
+        for genome_dir in Path(vsp.genome_db_path()).iterdir():
+            if accessions is None or genome_dir.name in accessions:
+                shutil.copytree(genome_dir, database_path / "genome" / genome_dir.name)
+
+        vfiles.reset_genome_manifest()
+        try:
+            with mock.patch.object(vsp, "db_path", return_value=str(database_path)):
+                yield database_path
+        finally:
+            vfiles.reset_genome_manifest()
 
 
 class TestFunction(unittest.TestCase):
@@ -52,6 +127,134 @@ class TestFunction(unittest.TestCase):
         test_gene = vloader.load_viral_genes("NC_013035")
         self.assertEqual(exp_gene, test_gene[0][:100])
 
+    def test_reference_pack(self):
+        accessions = ["NC_001348", "NC_013035"]
+        genome_path = vfiles.get_viral_genome_fasta_paths()["NC_013035"]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pack_path = str(Path(temp_dir) / "reference.pack")
+            pack = vloader.build_reference_pack(pack_path, accessions=accessions)
+            self.assertEqual(accessions, pack.accessions)
+            self.assertEqual(vloader.load_genome(genome_path), pack.genome("NC_013035"))
+            self.assertEqual(
+                vloader.load_all_viral_gene_intervals(accessions)["NC_001348"][1],
+                pack.intervals("NC_001348"),
+            )
+            self.assertNotIn("NC_006273", pack)
+
+    def test_stale_reference_pack(self):
+        accessions = ["NC_001348", "NC_013035"]
+        with temporary_database(accessions) as database_path:
+            vloader.build_reference_pack()
+            genome_path = vfiles.get_viral_genome_fasta_paths()["NC_013035"]
+            header, genome = Path(genome_path).read_text().split("\n", 1)
+
+            # genomes edited after the build are read from their files
+            with open(genome_path, "w") as outfile:
+                outfile.write(f"{header}\nACGT{genome[4:]}")
+            self.assertIsNone(vloader._reference_pack())
+            self.assertEqual("ACGT", vloader.load_genome(genome_path)[1][:4])
+
+            vloader.build_reference_pack()
+            self.assertIsNotNone(vloader._reference_pack())
+            self.assertEqual("ACGT", vloader.load_genome(genome_path)[1][:4])
+
+    def test_genome_manifest(self):
+        accessions = ["NC_001348", "NC_013035"]
+        with temporary_database(accessions) as database_path:
+            manifest = vfiles.get_genome_manifest()
+            self.assertEqual(accessions, sorted(manifest))
+            self.assertTrue(
+                (database_path / "index" / "genome_manifest.json").is_file()
+            )
+
+            # saved genomes are added to the manifest without rescanning
+            accession = "NC_TEST01"
+            vfiles.save_genome(accession, ">NC_TEST01.1 test\nACGT\n")
+            vfiles.save_genes(accession, {"1": {"annotation": [0, 1]}})
+            self.assertEqual(
+                str(database_path / "genome" / accession / f"{accession}.fasta"),
+                vfiles.get_viral_genome_fasta_paths(query=accession)[accession],
+            )
+            self.assertEqual(["AC"], vloader.load_viral_genes(accession))
+            genes_path = vfiles.get_genome_genes_paths(query=accession)[accession]
+            self.assertEqual(
+                hashlib.blake2b(
+                    Path(genes_path).read_bytes(), digest_size=16
+                ).hexdigest(),
+                manifest[accession]["genes"]["checksum"],
+            )
+
+        # the user's database is left untouched
+        self.assertNotIn(accession, vfiles.get_genome_manifest())
+        self.assertFalse((Path(vsp.genome_db_path()) / accession).exists())
+
+    def test_iter_fasta(self):
+        sequences = ["ACGT" * 40, "TTGCA" * 13, "GGN"]
+        unwrapped = "".join(
+            f">SRR1.{read_no} {read_no} length={len(sequence)}\n{sequence}\n"
+            for read_no, sequence in enumerate(sequences)
+        )
+        wrapped = "".join(
+            f">SRR1.{read_no} {read_no} length={len(sequence)}\n"
+            + "".join(
+                f"{sequence[beg : beg + 60]}\n" for beg in range(0, len(sequence), 60)
+            )
+            for read_no, sequence in enumerate(sequences)
+        )
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for fasta_contents in [unwrapped, wrapped.rstrip("\n")]:
+                fasta_path = Path(temp_dir) / "reads.fasta"
+                fasta_path.write_text(fasta_contents)
+                reader = SequenceIO(str(fasta_path))
+                for block_size in [16, 1 << 20]:
+                    records = list(reader.iter_fasta(block_size=block_size))
+                    self.assertEqual(
+                        sequences, [sequence.decode() for _, sequence in records]
+                    )
+                    self.assertEqual(b"SRR1.2 2 length=3", records[-1][0])
+
+                # the last record is not dropped
+                self.assertEqual(
+                    sequences, [read.sequence for read in reader.lazy_load_fasta()]
+                )
+
+    def test_read_batches(self):
+        sequences = ["ACGT" * 25, "TTGCA" * 30, "GGCAT" * 20, "CCA" * 50]
+        fasta_contents = "".join(
+            f">SRR1.{read_no} {read_no} length={len(sequence)}\n{sequence}\n"
+            for read_no, sequence in enumerate(sequences, start=1)
+        )
+        fasta_contents += ">SRR2.7 7 length=4\nACGT\n"
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            fasta_path = Path(temp_dir) / "reads.fasta"
+            fasta_path.write_text(fasta_contents)
+            reader = SequenceIO(str(fasta_path))
+            batches = list(reader.iter_batches(batch_size=3))
+            grouped_batches = list(reader.iter_batches(group_by_length=True))
+
+        # batches never mix samples
+        self.assertEqual(
+            ["SRR1", "SRR1", "SRR2"], [batch.sample_id for batch in batches]
+        )
+        self.assertIs(batches[0].sample_id, batches[1].sample_id)
+        self.assertEqual([1, 2, 3], batches[0].fragment_ids.tolist())
+        self.assertEqual(
+            sequences + ["ACGT"],
+            [read.tobytes().decode() for batch in batches for read in batch],
+        )
+
+        # reads of the same length share a batch
+        self.assertEqual(
+            [[100, 100], [150, 150], [4]],
+            [batch.lengths.tolist() for batch in grouped_batches],
+        )
+        self.assertEqual([2, 4], grouped_batches[1].fragment_ids.tolist())
+        self.assertEqual((2, 150), grouped_batches[1].as_matrix().shape)
+        with self.assertRaises(ValueError):
+            batches[0].as_matrix()
+
 
 class TestAnalysis(unittest.TestCase):
     def test_hamming_calculation(self):
@@ -84,11 +287,622 @@ class TestAnalysis(unittest.TestCase):
             end_idx += 1
             scores.append(score)
 
-        expected_final_score = max(scores)
+        expected_final_score = min(scores)
         test_final_score = dynamic_hamming(read, ref_seq)
 
         self.assertEqual(1.0 - expected_final_score, test_final_score)
 
+    def test_vectorized_hamming(self):
+        gene = vloader.load_viral_genes("NC_013035")[0]
+        reads = [
+            gene[10:60],  # perfect match
+            gene[200:240].replace("A", "T"),  # substitutions
+            "ACGTNNACGT",  # ambiguous bases
+            gene[:30] + "GATTACA" * 250,  # read larger than the gene
+        ]
+
+        for read in reads:
+            with self.subTest(read=read[:10]):
+                expected_score = dynamic_hamming(read, gene)
+                test_score = vectorized_hamming(read, gene)
+                self.assertEqual(expected_score, test_score)
+
+    def test_fft_hamming(self):
+        genes = vloader.load_viral_genes("NC_006273")
+        cases = [
+            (genes[3][500:650], genes[3]),  # perfect match
+            (genes[3][900:1200].replace("C", "G"), genes[3]),  # substitutions
+            ("ACGTNNACGT", genes[3]),  # ambiguous bases
+            ("GATTACA" * 50 + genes[145], genes[145]),  # read larger than the gene
+        ]
+
+        for read, gene in cases:
+            with self.subTest(read=read[:10]):
+                expected_score = dynamic_hamming(read, gene)
+                test_score = fft_hamming(read, gene)
+                self.assertEqual(expected_score, test_score)
+
+    def test_batch_hamming(self):
+        gene = vloader.load_viral_genes("NC_013035")[0]
+        reads = [gene[10:160], gene[200:350].replace("A", "T"), "ACGTN" * 30]
+        long_reads = [gene[:30] + "GATTACA" * 250, "C" * 30 + gene + "G" * 193]
+
+        for batch in [reads, long_reads]:
+            with self.subTest(read_length=len(batch[0])):
+                exp_scores = [dynamic_hamming(read, gene) for read in batch]
+                test_scores = batch_hamming(batch, gene)
+                self.assertEqual(exp_scores, test_scores.tolist())
+
+        with self.assertRaises(ValueError):
+            batch_hamming(reads + ["ACGT"], gene)
+
+    def test_scoring_backends(self):
+        gene = vloader.load_viral_genes("NC_013035")[0]
+        reads = [gene[10:160], gene[200:350].replace("A", "T"), "ACGTNNACGT"]
+
+        for backend in SCORING_BACKENDS:
+            for read in reads:
+                with self.subTest(backend=backend, read=read[:10]):
+                    expected_score = dynamic_hamming(read, gene)
+                    test_score = dynamic_hamming(read, gene, backend=backend)
+                    self.assertEqual(expected_score, test_score)
+                    self.assertIs(float, type(test_score))
+
+        with self.assertRaises(ValueError):
+            dynamic_hamming(reads[0], gene, backend="gpu")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_path = str(Path(tmp_dir) / "scoring_backend.json")
+            backend = autotune_backend([150, 150, 100], cache_path=cache_path)
+            with open(cache_path, "r") as infile:
+                cached_backends = list(json.load(infile).values())
+
+        self.assertIn(backend, SCORING_BACKENDS)
+        self.assertNotEqual("python", backend)
+        self.assertEqual([backend], cached_backends)
+
+    def test_jit_hamming(self):
+        genome_paths = vfiles.get_viral_genome_fasta_paths()
+        accessions = sorted(genome_paths)[::40]
+
+        for acc_id in accessions:
+            gene = min(vloader.load_viral_genes(acc_id), key=len)
+            read = gene[20:120].replace("G", "C")
+            with self.subTest(accession=acc_id):
+                expected_score = dynamic_hamming(read, gene)
+                self.assertEqual(expected_score, jit_hamming(read, gene))
+                self.assertEqual(
+                    dynamic_hamming(gene, read[:50]), jit_hamming(gene, read[:50])
+                )
+
+                # early exit: windows over the budget are never reported
+                min_mismatches = round((1.0 - expected_score) * len(read))
+                words, masks = pattern_words(np.frombuffer(read.encode(), np.uint8))
+                shifted_words = text_words(
+                    np.frombuffer(gene.encode(), np.uint8), len(read)
+                )
+                window_ranges = np.array([[0, len(gene) - len(read) + 1]])
+                for budget in [min_mismatches, min_mismatches - 1]:
+                    test_mismatches, n_abandoned = window_min_mismatches_loop(
+                        words, masks, shifted_words, window_ranges, budget
+                    )
+                    self.assertEqual(min(min_mismatches, budget + 1), test_mismatches)
+
+    def test_edit_similarity(self):
+        self.assertEqual(0, semi_global_edit_distance("ACGT", "TTACGTTT"))
+        self.assertEqual(1, semi_global_edit_distance("ACGT", "TTACTTT"))
+        self.assertEqual(1, semi_global_edit_distance("ACGT", "TTACGGTTT"))
+        self.assertEqual(4, semi_global_edit_distance("ACGT", ""))
+
+        gene = vloader.load_viral_genes("NC_013035")[0]
+        read = gene[200:350]
+        indel_read = read[:70] + read[71:] + "A"
+
+        self.assertEqual(1.0, edit_similarity(read, gene))
+        self.assertEqual(1.0 - 1 / 150, edit_similarity(indel_read, gene))
+        self.assertLess(dynamic_hamming(indel_read, gene), 0.9)
+        self.assertEqual(1.0, edit_similarity(gene[200:260], read[:50]))
+
+    def test_thresholded_hamming(self):
+        gene = vloader.load_viral_genes("NC_013035")[0]
+        read = gene[200:350].replace("A", "T")
+        exp_score = vectorized_hamming(read, gene)
+
+        self.assertEqual(45, mismatch_budget(150, threshold=0.7))
+        self.assertEqual(44, mismatch_budget(150, threshold=0.7, best=0.7))
+
+        stats = Counter()
+        for threshold in [0.4, exp_score, exp_score + 0.01]:
+            with self.subTest(threshold=threshold):
+                test_score = thresholded_hamming(read, gene, threshold, stats=stats)
+                if exp_score >= threshold:
+                    self.assertEqual(exp_score, test_score)
+                else:
+                    self.assertIsNone(test_score)
+
+        self.assertIsNone(thresholded_hamming(read, gene, 0.4, best=exp_score))
+        self.assertGreater(stats["windows_abandoned"], 0)
+
+    def test_sampled_hamming(self):
+        gene = vloader.load_viral_genes("NC_013035")[0]
+        reads = [gene[200:350], gene[200:350].replace("A", "T"), "ACGTN" * 30]
+
+        # the estimate never drops a window that would pass exact scoring
+        stats = Counter()
+        for read in reads:
+            for threshold in [0.4, 0.7, 0.9]:
+                with self.subTest(read=read[:10], threshold=threshold):
+                    exp_score = thresholded_hamming(read, gene, threshold)
+                    test_score = sampled_hamming(read, gene, threshold, stats=stats)
+                    self.assertEqual(exp_score, test_score)
+
+        self.assertLess(stats["windows_sample_passed"], stats["windows_sampled"])
+
+
+class TestNucleotideCodec(unittest.TestCase):
+    def test_packing(self):
+        seq = "ACGTNNACGTRYacgt" * 5
+        packed = pack_sequence(seq)
+
+        self.assertEqual(len(seq), packed.length)
+        self.assertEqual(3, len(packed.words))
+        self.assertEqual(seq, unpack_sequence(packed))
+
+    def test_packed_hamming(self):
+        gene = vloader.load_viral_genes("NC_013035")[0]
+        seq1 = "AAATTCCCNNAAATTCCCNNAAATTCCCNNAAATTCCCNN"
+        seq2 = "ACATGCCCNNACATGCCCNRACATGCCCNNACATGCCCNN"
+        self.assertEqual(
+            hamming_distance_score(seq1, seq2),
+            hamming_distance_score(seq1, seq2, backend="packed"),
+        )
+
+        reads = [gene[10:60], gene[200:240].replace("A", "N"), "ACGTNNACGT"]
+        for read in reads:
+            with self.subTest(read=read[:10]):
+                expected_score = dynamic_hamming(read, gene)
+                test_score = dynamic_hamming(read, gene, backend="packed")
+                self.assertEqual(expected_score, test_score)
+
+
+class TestClassifier(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.catalog = ReferenceCatalog.from_database()
+
+    def test_reference_catalog(self):
+        exp_genes = vloader.load_viral_genes("NC_013035")
+        test_genes = self.catalog["NC_013035"]
+
+        self.assertEqual(223, len(self.catalog))
+        self.assertEqual(len(exp_genes), len(test_genes))
+        self.assertEqual(exp_genes[0], test_genes[0].tobytes().decode())
+
+    def test_merged_reference_catalog(self):
+        intervals = [(0, 999), (700, 1999), (100, 299), (1950, 2500), (3000, 2000)]
+        exp_merged = [
+            (0, 1999, (0, 1)),
+            (100, 299, (2,)),
+            (1950, 2200, (3,)),
+            (3000, 2000, (4,)),
+        ]
+        self.assertEqual(exp_merged, merge_intervals(intervals, 250, 2201))
+
+        catalog = ReferenceCatalog({"A": ["ACGTACGT", "TTTT"], "B": ["ACGTACGT"]})
+        self.assertEqual({"A": [0, 1], "B": [0]}, catalog.sequence_ids)
+        self.assertEqual([("A", 0), ("B", 0)], catalog.sequence_sources[0])
+        self.assertEqual(12, catalog.unique_length)
+
+        stats = Counter()
+        acc_id, score = classify_read("ACGTACGT", catalog, threshold=0.5, stats=stats)
+        self.assertEqual(("A", 1.0), (acc_id, score))
+
+        accessions = ["NC_006273", "NC_001664", "NC_013035"]
+        merged_catalog = ReferenceCatalog.from_database(accessions, merge_overlap=250)
+        self.assertLess(merged_catalog.total_length, self.catalog.total_length)
+        for read in [
+            self.catalog["NC_006273"][3][500:650],
+            self.catalog["NC_001664"][5][300:450],
+        ]:
+            with self.subTest(read=read[:10]):
+                exp_result = classify_read(
+                    read, self.catalog, threshold=0.4, accessions=accessions
+                )
+                test_result = classify_read(read, merged_catalog, threshold=0.4)
+                self.assertEqual(exp_result, test_result)
+
+    def test_accession_buffers(self):
+        genes = ["ACGTAC", "GG", "TTGCAT"]
+        catalog = ReferenceCatalog({"A": genes})
+        self.assertEqual(b"ACGTACGGTTGCAT", catalog.buffers["A"].tobytes())
+        self.assertEqual([0, 6, 8, 14], catalog.gene_offsets["A"].tolist())
+        self.assertEqual([[0, 1], [8, 9]], catalog.window_ranges("A", 6).tolist())
+
+        # the perfect match spans gene boundaries and must not be scored
+        read = "ACGGTT"
+        exp_score = max(dynamic_hamming(read, gene) for gene in genes)
+        self.assertEqual(("A", exp_score), classify_read(read, catalog, 0.1))
+
+        arrays_catalog = ReferenceCatalog.from_arrays(self.catalog.to_arrays())
+        for acc_id in ["NC_006273", "NC_013035"]:
+            self.assertTrue(
+                np.array_equal(
+                    self.catalog.buffers[acc_id], arrays_catalog.buffers[acc_id]
+                )
+            )
+            self.assertEqual(
+                self.catalog.sequence_ids[acc_id], arrays_catalog.sequence_ids[acc_id]
+            )
+
+    def test_classify_read(self):
+        read = vloader.load_viral_genes("NC_006273")[3][500:650]
+        acc_id, score = classify_read(read, self.catalog, threshold=0.4)
+
+        self.assertEqual("NC_006273", acc_id)
+        self.assertEqual(1.0, score)
+
+    def test_threshold_scans(self):
+        gene = vloader.load_viral_genes("NC_006273")[3]
+        reads = [gene[500:650], gene[500:650].replace("A", "T", 20), "GATTACA" * 20]
+
+        self.assertIn("threshold_numpy", THRESHOLD_SCANS)
+        for backend in THRESHOLD_SCANS:
+            for read in reads:
+                with self.subTest(backend=backend, read=read[:10]):
+                    exp_result = classify_read(read, self.catalog, threshold=0.4)
+                    test_result = classify_read(
+                        read, self.catalog, threshold=0.4, backend=backend
+                    )
+                    self.assertEqual(exp_result, test_result)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_path = str(Path(tmp_dir) / "scan_autotune.json")
+            backend = autotune_threshold_scan([150, 150, 100], 0.4, cache_path)
+            self.assertIn(backend, THRESHOLD_SCANS)
+            self.assertEqual(
+                backend, autotune_threshold_scan([150, 150, 100], 0.4, cache_path)
+            )
+
+    def test_seeded_classify_read(self):
+        index = KmerIndex.build(self.catalog, k=12)
+        gene = vloader.load_viral_genes("NC_001664")[5]
+        read = gene[300:450]
+        read = read[:40] + "N" + read[41:100] + "A" + read[101:]
+
+        exp_result = classify_read(read, self.catalog, threshold=0.4)
+        test_result = classify_read(read, self.catalog, threshold=0.4, index=index)
+
+        self.assertEqual("NC_001664", test_result[0])
+        self.assertEqual(exp_result, test_result)
+
+    def test_classify_read_batch(self):
+        accessions = ["NC_013035", "NC_001664", "NC_006273", "NC_001348"]
+        reads = [
+            self.catalog["NC_001664"][5][300:450],
+            self.catalog["NC_006273"][3][500:650],
+            self.catalog["NC_006273"][8][100:250],
+            "GATTACA" * 20 + "GATTACAGAT",
+            self.catalog["NC_006273"][3][500:650],
+        ]
+        read_accessions = [accessions, accessions[::-1], accessions[1:], [], None]
+
+        exp_results = [
+            classify_read(read, self.catalog, threshold=0.4, accessions=acc_ids)
+            for read, acc_ids in zip(reads, read_accessions)
+        ]
+        test_results = classify_read_batch(
+            reads, self.catalog, threshold=0.4, accessions=read_accessions
+        )
+
+        self.assertEqual(exp_results, test_results)
+        self.assertEqual((None, 0.0), test_results[3])
+
+    def test_edit_classify_read(self):
+        index = KmerIndex.build(self.catalog, k=12)
+        read = vloader.load_viral_genes("NC_006273")[3][500:650]
+        indel_read = read[:60] + read[62:100] + "T" + read[100:]
+
+        acc_id, score = classify_read(
+            indel_read, self.catalog, threshold=0.9, index=index, scoring_mode="edit"
+        )
+        self.assertEqual("NC_006273", acc_id)
+        self.assertEqual(1.0 - 3 / 149, score)
+
+        with self.assertRaises(ValueError):
+            classify_read(read, self.catalog, threshold=0.9, scoring_mode="blast")
+
+    def test_read_classifier(self):
+        classifier = ReadClassifier(self.catalog, threshold=0.4, reorder_every=1)
+        reads = [
+            self.catalog["NC_001664"][5][300:450],
+            self.catalog["NC_006273"][3][500:650],
+            self.catalog["NC_006273"][8][100:250],
+        ]
+
+        for read in reads:
+            with self.subTest(read=read[:10]):
+                exp_result = classify_read(read, self.catalog, threshold=0.4)
+                test_result = classifier.classify(read)
+                self.assertEqual(exp_result, test_result)
+
+        self.assertEqual({"NC_006273": 2, "NC_001664": 1}, dict(classifier.counts))
+        self.assertEqual(["NC_006273", "NC_001664"], classifier.accession_order()[:2])
+        self.assertGreater(classifier.stats["accessions_pruned"], 0)
+
+    def test_sketch_screening(self):
+        sketches = AccessionSketches.build(self.catalog)
+        viral_read = self.catalog["NC_001664"][5][300:450]
+        random_read = "".join(np.random.default_rng(0).choice(list("ACGT"), 140))
+
+        screened = sketches.screen([viral_read, random_read], floor=0.05)
+        self.assertIn("NC_001664", screened[0])
+        self.assertEqual([], screened[1])
+
+        acc_id, score = classify_read(
+            random_read, self.catalog, threshold=0.4, accessions=screened[1]
+        )
+        self.assertIsNone(acc_id)
+
+    def test_sketch_screening_short_reads(self):
+        sketches = AccessionSketches.build(self.catalog)
+        gene = self.catalog["NC_001664"][5].tobytes().decode()
+        reads = [
+            gene[300:312],  # shorter than the sketch k-mers
+            "N".join([gene[300:310], gene[310:320], gene[320:330]]),  # ambiguous
+        ]
+
+        # reads without sampled k-mers skip the screen instead of being dropped
+        self.assertEqual([None, None], sketches.screen(reads, floor=0.05))
+        exp_counts = ReadClassifier(self.catalog, threshold=0.4).classify_batch(reads)
+        test_counts = ReadClassifier(self.catalog, threshold=0.4).classify_batch(
+            reads, sketches=sketches, floor=0.05
+        )
+        self.assertGreater(sum(exp_counts.values()), 0)
+        self.assertEqual(exp_counts, test_counts)
+
+    def test_taxonomy_search(self):
+        sketches = AccessionSketches.build(self.catalog)
+        taxonomy = TaxonomySearch.from_arrays(
+            TaxonomySearch.build(self.catalog).to_arrays()
+        )
+        self.assertEqual(self.catalog.accessions, taxonomy.accessions)
+        self.assertIn("Herpesviridae", taxonomy.levels["family"]["names"].tolist())
+
+        reads = [
+            self.catalog["NC_001664"][5][300:450],
+            vloader.load_viral_genes("NC_006273")[3][500:650].replace("A", "T", 5),
+            "GATTACA" * 20,
+            "ACGT",
+        ]
+        exp_stats = Counter()
+        test_stats = Counter()
+        exp_screened = sketches.screen(reads, floor=0.05, stats=exp_stats)
+        test_screened = taxonomy.screen(reads, floor=0.05, stats=test_stats)
+
+        # pruned families and genera never hide a passing accession
+        self.assertEqual(exp_screened, test_screened)
+        self.assertLess(
+            test_stats["screen_comparisons"], exp_stats["screen_comparisons"] / 5
+        )
+
+    def test_exact_match(self):
+        matcher = ExactMatcher(self.catalog)
+        gene = vloader.load_viral_genes("NC_006273")[3]
+        buffer = self.catalog.buffers["NC_006273"].tobytes().decode()
+        gene_end = self.catalog.gene_offsets["NC_006273"][1]
+        reads = [
+            gene[500:650],
+            gene[500:550] + "T" + gene[551:650],
+            buffer[gene_end - 75 : gene_end + 75],  # spans a gene boundary
+        ]
+        exact_accessions = matcher.find(reads)
+        self.assertIn("NC_006273", exact_accessions[0])
+        self.assertEqual([], exact_accessions[2])
+
+        exp_classifier = ReadClassifier(self.catalog, threshold=0.4)
+        test_classifier = ReadClassifier(self.catalog, threshold=0.4, exact_match=True)
+        exp_counts = exp_classifier.classify_batch(reads)
+        test_counts = test_classifier.classify_batch(reads)
+        self.assertEqual(exp_counts, test_counts)
+        self.assertGreaterEqual(test_classifier.stats["exact_hits"], 1)
+
+    def test_parallel_classifier(self):
+        index = KmerIndex.build(self.catalog, k=12)
+        sketches = AccessionSketches.build(self.catalog)
+        reads = [
+            self.catalog["NC_001664"][5][300:450].tobytes().decode(),
+            self.catalog["NC_006273"][3][500:650].tobytes().decode(),
+            self.catalog["NC_006273"][8][100:250].tobytes().decode(),
+            "GATTACA" * 20,
+        ]
+        read_batches = [reads[:2], reads[2:]]
+
+        results = {}
+        for workers in (1, 2):
+            with ParallelClassifier(
+                self.catalog,
+                threshold=0.4,
+                workers=workers,
+                index=index,
+                sketches=sketches,
+                floor=0.05,
+            ) as parallel_classifier:
+                counts = Counter()
+                for batch_counts, batch_stats in parallel_classifier.imap(read_batches):
+                    counts.update(batch_counts)
+                results[workers] = counts
+
+        self.assertEqual({"NC_006273": 2, "NC_001664": 1}, dict(results[1]))
+        self.assertEqual(results[1], results[2])
+
+    def test_tiled_scheduler(self):
+        blocks = reference_blocks(self.catalog, block_bases=100000)
+        n_genes = sum(len(genes) for genes in self.catalog.genes.values())
+        self.assertEqual(
+            n_genes, sum(len(genes) for block in blocks for genes in block.values())
+        )
+
+        reads = [
+            self.catalog["NC_001664"][5][300:450],
+            self.catalog["NC_006273"][3][500:650],
+            self.catalog["NC_006273"][8][100:250],
+            "GATTACA" * 20,
+        ]
+        exp_results = [classify_read(read, self.catalog, 0.4) for read in reads]
+        with TiledScheduler(
+            self.catalog, threshold=0.4, workers=2, block_bases=100000, tile_reads=3
+        ) as scheduler:
+            test_results = scheduler.classify(reads)
+            timings = scheduler.tile_timings
+
+        self.assertEqual(exp_results, test_results)
+        self.assertEqual(2 * len(blocks), len(timings))
+        self.assertEqual(len(reads) * len(blocks), sum(t["reads"] for t in timings))
+
+    def test_shared_reference(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            build = self.catalog.to_arrays
+            with SharedReference("vseek-test", build, temp_dir) as exp_reference:
+                test_reference = SharedReference("vseek-test", build, temp_dir)
+                test_catalog = ReferenceCatalog.from_arrays(test_reference.open())
+                self.assertTrue(exp_reference.published)
+                self.assertFalse(test_reference.published)
+                self.assertEqual(2, exp_reference.users)
+                self.assertEqual(self.catalog.accessions, test_catalog.accessions)
+                np.testing.assert_array_equal(
+                    self.catalog.buffers["NC_006273"],
+                    test_catalog.buffers["NC_006273"],
+                )
+
+                # closing one user keeps the segment for the other
+                test_reference.close()
+                self.assertTrue(exp_reference.path.is_file())
+            self.assertFalse(exp_reference.path.is_file())
+
+            # segments only used by dead processes are removed
+            stale_reference = SharedReference("vseek-stale", build, temp_dir)
+            stale_reference.open()
+            process = subprocess.Popen([sys.executable, "-c", "pass"])
+            process.wait()
+            stale_reference.path.with_suffix(".pids").write_text(f"{process.pid}\n")
+            self.assertEqual(
+                [str(stale_reference.path)], remove_stale_segments(temp_dir)
+            )
+
+            # lock files are removed with their segments
+            self.assertEqual([], list(Path(temp_dir).iterdir()))
+
+    def test_database_artifacts(self):
+        user_index = {
+            path.name: path.stat().st_mtime_ns
+            for path in Path(vsp.init_index_db_path()).iterdir()
+        }
+        with temporary_database() as database_path:
+            stamp = build_artifacts(0, DEFAULT_SEED_SIZE, workers=1)
+            self.assertEqual("current", artifacts_status(0, DEFAULT_SEED_SIZE))
+            self.assertEqual("stale", artifacts_status(0, DEFAULT_SEED_SIZE + 1))
+            self.assertEqual(5, len(stamp["build_seconds"]))
+
+            # loaded artifacts are the ones built from the genome directories
+            self.assertTrue(
+                artifact_path("catalog").startswith(str(database_path / "index"))
+            )
+            catalog = ReferenceCatalog.load(artifact_path("catalog"))
+            index = KmerIndex.load(artifact_path("kmer_index"))
+
+        # the user's index directory is left untouched
+        self.assertEqual(
+            user_index,
+            {
+                path.name: path.stat().st_mtime_ns
+                for path in Path(vsp.index_db_path()).iterdir()
+            },
+        )
+        self.assertEqual(self.catalog.accessions, catalog.accessions)
+        self.assertTrue(
+            np.array_equal(
+                self.catalog.to_arrays()["sequences"], catalog.to_arrays()["sequences"]
+            )
+        )
+        read = self.catalog["NC_013035"][0][:100]
+        self.assertTrue(
+            np.array_equal(
+                KmerIndex.build(self.catalog).candidate_windows(read)["NC_013035"][0],
+                index.candidate_windows(read)["NC_013035"][0],
+            )
+        )
+
+    def test_read_batch_classification(self):
+        reads = [
+            self.catalog["NC_001664"][5][300:450].tobytes(),
+            self.catalog["NC_006273"][3][500:650].tobytes(),
+            b"GATTACAAAT" * 15,
+        ]
+        read_batch = ReadBatch.from_sequences("SRR1", [1, 2, 3], reads)
+
+        # batches are sent to the worker processes as is
+        with ParallelClassifier(
+            self.catalog, threshold=0.4, workers=2
+        ) as parallel_classifier:
+            results = list(parallel_classifier.imap([reads, read_batch]))
+        self.assertEqual(results[0][0], results[1][0])
+        with TiledScheduler(self.catalog, threshold=0.4, workers=1) as scheduler:
+            partial_batch = ReadBatch.from_sequences("SRR1", [1, 2], reads[:2])
+            results.extend(scheduler.imap([partial_batch]))
+        self.assertEqual(
+            [3, 3, 2], [batch_stats["reads"] for _, batch_stats in results]
+        )
+        self.assertEqual(
+            [result[0] for result in classify_read_batch(reads, self.catalog, 0.4)],
+            [
+                result[0]
+                for result in classify_read_batch(
+                    read_batch.as_matrix(), self.catalog, 0.4
+                )
+            ],
+        )
+
+    def test_cli_sample_stride(self):
+        args = argparse.Namespace(
+            threshold=0.4,
+            containment_floor=0.0,
+            scoring_backend="auto",
+            scoring_mode="hamming",
+            exact_match=False,
+            sample_stride=4,
+        )
+        reads = [
+            self.catalog["NC_001664"][5][300:450].tobytes(),
+            self.catalog["NC_006273"][3][500:650].tobytes(),
+        ]
+
+        # the default backend runs the sampled estimate
+        options = run_vseek.classifier_options(args)
+        with ParallelClassifier(self.catalog, workers=1, **options) as classifier:
+            batch_counts, batch_stats = next(classifier.imap([reads]))
+        self.assertEqual({"NC_001664": 1, "NC_006273": 1}, dict(batch_counts))
+        self.assertGreater(batch_stats["windows_sampled"], 0)
+
+        # backends scoring every window in full cannot sample
+        process = subprocess.run(
+            [sys.executable, "run_vseek.py", "-i", "SRR1", "--sample_stride", "4"]
+            + ["--scoring_backend", "numpy"],
+            capture_output=True,
+            text=True,
+        )
+        self.assertNotEqual(0, process.returncode)
+        self.assertIn("Sample stride is only used", process.stderr)
+
+    def test_cli_taxonomy_search(self):
+        # the taxonomy search has no floor of its own
+        process = subprocess.run(
+            [sys.executable, "run_vseek.py", "-i", "SRR1", "--taxonomy_search"],
+            capture_output=True,
+            text=True,
+        )
+        self.assertNotEqual(0, process.returncode)
+        self.assertIn("use --containment_floor above 0", process.stderr)
+
 
 class TestProfilerAndLoader(unittest.TestCase):
     def test_viral_accesion(self):
@@ -0,0 +1,581 @@
+from collections import Counter, defaultdict
+from functools import partial
+
+import numpy as np
+
+# vseek imports
+from vseek.utils.edit_distance import edit_similarity
+from vseek.utils.exact_match import ExactMatcher
+from vseek.utils.reference_catalog import ReferenceCatalog
+from vseek.utils.vseek_analysis import (
+    THRESHOLD_SCANS,
+    batch_hamming,
+    encode_sequence,
+    get_scoring_backend,
+    sampled_hamming,
+    thresholded_hamming,
+)
+
+
+def classify_read(
+    read,
+    catalog: ReferenceCatalog,
+    threshold: float,
+    index=None,
+    accessions=None,
+    stats=None,
+    backend=None,
+    scoring_mode: str = "hamming",
+    sample_stride=None,
+    accession_genes=None,
+    candidates=None,
+    best: float = 0.0,
+) -> tuple:
+    """Finds the accession whose genes are the most similar to the read.
+    Accessions are visited in the given order and only need to beat the top
+    score found so far. Ties go to the accession visited first, so a
+    sequence shared by several genes is only scored for its first copy.
+
+    Parameters
+    ----------
+    read : str, np.ndarray
+        meta-genomic read
+    catalog : ReferenceCatalog
+        encoded reference gene sequences
+    threshold : float
+        minimum similarity score for a gene to be considered
+    index : KmerIndex, optional
+        seed index of the catalog. If provided, only the windows supported by
+        a shared seed are scored. Default None scans every window
+    accessions : list[str], optional
+        accession ids to score in visiting order, e.g. the ones passing the
+        sketch screening. Default None scores all accessions in the catalog
+    stats : collections.Counter, optional
+        scanning counters (genes skipped, windows scanned and abandoned,
+        accessions pruned)
+    backend : str, optional
+        scoring backend (see SCORING_BACKENDS) or threshold-aware scan (see
+        THRESHOLD_SCANS) used for genes scanned in full. Default None uses
+        the threshold-aware early abandoning scan
+    scoring_mode : str, optional
+        "hamming" scores substitutions only, "edit" scores the best
+        semi-global edit distance so that indels are tolerated. Default is
+        "hamming"
+    sample_stride : int, optional
+        windows scanned in full are first estimated on positions spaced at
+        most this far apart (see sampled_hamming). Default None compares
+        windows with the early abandoning scan only
+    accession_genes : dict, optional
+        accession id and numbers of the genes to score, e.g. one reference
+        block of the TiledScheduler. Default None scores all genes
+    candidates : dict, optional
+        candidate windows of the read already found with
+        index.candidate_windows, the index is then not searched again
+    best : float, optional
+        score to beat, e.g. the best score of the read in other reference
+        blocks. Default is 0.0
+
+    Returns
+    -------
+    tuple
+        top scoring accession id and its score. (None, best) is returned if
+        no gene reaches the threshold and beats `best`
+    """
+    if accessions is None:
+        accessions = catalog.accessions
+
+    read = encode_sequence(read)
+    if scoring_mode == "edit":
+        scorer = edit_similarity
+    elif scoring_mode == "hamming":
+        scorer = None
+        if backend is not None and backend not in THRESHOLD_SCANS:
+            scorer = get_scoring_backend(backend)
+    else:
+        raise ValueError(f"{scoring_mode} is not a supported scoring mode")
+
+    full_scan = THRESHOLD_SCANS.get(backend, thresholded_hamming)
+    if sample_stride is not None:
+        full_scan = partial(sampled_hamming, stride=sample_stride)
+
+    if candidates is None and index is not None:
+        candidates = index.candidate_windows(read)
+    if candidates is not None:
+        # accessions without any shared seed cannot win
+        accessions = [acc_id for acc_id in accessions if acc_id in candidates]
+
+    top_score_acc_id = None
+    top_score = best
+    scored_sequences = set()
+    for n_visited, acc_id in enumerate(accessions, start=1):
+        gene_windows = None
+        if candidates is not None:
+            gene_windows = candidates[acc_id]
+
+            # edit alignments can shift away from the seed diagonals
+            if scoring_mode == "edit":
+                gene_windows = dict.fromkeys(gene_windows)
+
+        if accession_genes is not None:
+            if gene_windows is None:
+                gene_windows = dict.fromkeys(accession_genes[acc_id])
+            else:
+                gene_windows = {
+                    gene_no: gene_windows[gene_no]
+                    for gene_no in accession_genes[acc_id]
+                    if gene_no in gene_windows
+                }
+
+        score = _accession_score(
+            read,
+            catalog[acc_id],
+            threshold,
+            gene_windows,
+            stats,
+            best=top_score,
+            scorer=scorer,
+            sequence_ids=catalog.sequence_ids[acc_id],
+            scored_sequences=scored_sequences,
+            buffer=catalog.buffers[acc_id],
+            gene_offsets=catalog.gene_offsets[acc_id],
+            full_scan=full_scan,
+        )
+        if score > top_score:
+            top_score_acc_id = acc_id
+            top_score = score
+
+        # no later accession can beat a perfect match
+        if top_score == 1:
+            if stats is not None:
+                stats["accessions_pruned"] += len(accessions) - n_visited
+            break
+
+    return (top_score_acc_id, top_score)
+
+
+def classify_read_batch(
+    reads: list, catalog: ReferenceCatalog, threshold: float, accessions=None
+) -> list[tuple]:
+    """Batch version of classify_read for reads of the same length. Reads
+    are grouped by accession and every gene scores its whole group with one
+    matrix product per block of windows (see batch_hamming). Results are
+    identical to classify_read, ties go to the accession listed first.
+
+    Parameters
+    ----------
+    reads : list
+        meta-genomic reads of the same length
+    catalog : ReferenceCatalog
+        encoded reference gene sequences
+    threshold : float
+        minimum similarity score for a gene to be considered
+    accessions : list[list[str]], optional
+        accession ids to score for each read, e.g. the output of the sketch
+        screening, None scoring all accessions. Default None scores all
+        accessions for every read
+
+    Returns
+    -------
+    list[tuple]
+        top scoring accession id and score of each read, (None, 0.0) for
+        reads where no gene reaches the threshold
+    """
+    reads = [encode_sequence(read) for read in reads]
+    if len({len(read) for read in reads}) > 1:
+        raise ValueError("All reads of a batch must have the same length")
+    if accessions is None:
+        accessions = [None] * len(reads)
+    accessions = [
+        catalog.accessions if read_accessions is None else read_accessions
+        for read_accessions in accessions
+    ]
+
+    # reads to score against each accession
+    accession_reads = defaultdict(list)
+    for read_no, read_accessions in enumerate(accessions):
+        for acc_id in read_accessions:
+            accession_reads[acc_id].append(read_no)
+
+    read_scores = [{} for _ in reads]
+    for acc_id, read_numbers in accession_reads.items():
+        acc_reads = np.stack([reads[read_no] for read_no in read_numbers])
+        acc_scores = np.zeros(len(read_numbers))
+        for gene in catalog[acc_id]:
+            gene_scores = batch_hamming(acc_reads, gene)
+            gene_scores[gene_scores < threshold] = 0.0
+            np.maximum(acc_scores, gene_scores, out=acc_scores)
+
+        for read_no, score in zip(read_numbers, acc_scores.tolist()):
+            read_scores[read_no][acc_id] = score
+
+    results = []
+    for read_no, read_accessions in enumerate(accessions):
+        top_score_acc_id = None
+        top_score = 0.0
+        for acc_id in read_accessions:
+            score = read_scores[read_no][acc_id]
+            if score > top_score:
+                top_score_acc_id = acc_id
+                top_score = score
+
+        results.append((top_score_acc_id, top_score))
+
+    return results
+
+
+class ReadClassifier:
+    """Classification driver of the Discovery step. Keeps the running viral
+    counts and visits the accessions with the most hits first, so that
+    likely winners set a high best score early and the remaining accessions
+    are pruned or abandoned quickly.
+    """
+
+    def __init__(
+        self,
+        catalog: ReferenceCatalog,
+        threshold: float,
+        index=None,
+        reorder_every: int = 100,
+        backend=None,
+        scoring_mode: str = "hamming",
+        exact_match: bool = False,
+        sample_stride=None,
+    ):
+        """
+        Parameters
+        ----------
+        catalog : ReferenceCatalog
+            encoded reference gene sequences
+        threshold : float
+            minimum similarity score for a gene to be considered
+        index : KmerIndex, optional
+            seed index of the catalog, default None scans every window
+        reorder_every : int, optional
+            number of classified reads between accession reorderings,
+            default is 100
+        backend : str, optional
+            scoring backend used for genes scanned in full, default None
+            uses the threshold-aware early abandoning scan
+        scoring_mode : str, optional
+            "hamming" or "edit" (indel tolerant), default is "hamming"
+        exact_match : bool, optional
+            resolves the reads of a batch occurring exactly in a gene
+            without scoring them (see ExactMatcher), default is False
+        sample_stride : int, optional
+            largest spacing of the sampled estimate of full scans (see
+            sampled_hamming), default None disables the estimate
+        """
+        self.catalog = catalog
+        self.threshold = threshold
+        self.index = index
+        self.reorder_every = reorder_every
+        self.backend = backend
+        self.scoring_mode = scoring_mode
+        self.exact_matcher = ExactMatcher(catalog) if exact_match else None
+        self.sample_stride = sample_stride
+        self.counts = defaultdict(lambda: 0)
+        self.stats = Counter()
+
+        self._n_classified = 0
+        self._order = catalog.accessions
+        self._catalog_rank = {acc_id: rank for rank, acc_id in enumerate(self._order)}
+        self._rank = self._catalog_rank
+
+    def accession_order(self, accessions=None) -> list[str]:
+        """Returns accessions sorted by their current number of hits
+
+        Parameters
+        ----------
+        accessions : list[str], optional
+            subset of accessions to sort, default None returns all accessions
+
+        Returns
+        -------
+        list[str]
+            accession ids, most frequent first
+        """
+        if accessions is None:
+            return self._order
+
+        return sorted(accessions, key=self._rank.__getitem__)
+
+    def classify(self, read, accessions=None, exact_accessions=None) -> tuple:
+        """Classifies a read and adds it to the viral counts
+
+        Parameters
+        ----------
+        read : str, np.ndarray
+            meta-genomic read
+        accessions : list[str], optional
+            accession ids allowed for this read, default None allows all
+        exact_accessions : list[str], optional
+            accession ids containing the read exactly (see ExactMatcher).
+            The read is then resolved without scoring any window
+
+        Returns
+        -------
+        tuple
+            top scoring accession id and its score, (None, 0.0) if the read
+            did not match any accession
+        """
+        acc_id = None
+        if exact_accessions:
+            acc_id = _exact_match_winner(
+                encode_sequence(read),
+                self.catalog,
+                self.accession_order(accessions),
+                exact_accessions,
+            )
+
+        if acc_id is not None:
+            score = 1.0
+            self.stats["exact_hits"] += 1
+        else:
+            acc_id, score = classify_read(
+                read,
+                self.catalog,
+                self.threshold,
+                index=self.index,
+                accessions=self.accession_order(accessions),
+                stats=self.stats,
+                backend=self.backend,
+                scoring_mode=self.scoring_mode,
+                sample_stride=self.sample_stride,
+            )
+        if acc_id is not None:
+            self.counts[acc_id] += 1
+
+        self._n_classified += 1
+        if self._n_classified % self.reorder_every == 0:
+            self._reorder()
+
+        return (acc_id, score)
+
+    def classify_batch(self, reads: list, sketches=None, floor: float = 0.0):
+        """Screens and classifies a batch of reads
+
+        Parameters
+        ----------
+        reads : list
+            meta-genomic reads
+        sketches : AccessionSketches, TaxonomySearch, optional
+            accession sketches used to screen the batch, default None scores
+            every read against all accessions
+        floor : float, optional
+            minimum estimated containment of the sketch screening
+
+        Returns
+        -------
+        collections.Counter
+            number of reads assigned to each accession within this batch
+        """
+        reads = [encode_sequence(read) for read in reads]
+        if sketches is not None:
+            batch_accessions = sketches.screen(reads, floor, stats=self.stats)
+        else:
+            batch_accessions = [None] * len(reads)
+
+        if self.exact_matcher is not None:
+            batch_exact_accessions = self.exact_matcher.find(reads)
+        else:
+            batch_exact_accessions = [None] * len(reads)
+
+        batch_counts = Counter()
+        for read, accessions, exact_accessions in zip(
+            reads, batch_accessions, batch_exact_accessions
+        ):
+            acc_id, score = self.classify(
+                read, accessions=accessions, exact_accessions=exact_accessions
+            )
+            if acc_id is not None:
+                batch_counts[acc_id] += 1
+
+        return batch_counts
+
+    def _reorder(self) -> None:
+        """Sorts accessions by running hit frequency, ties keep the catalog
+        order"""
+        self._order = sorted(
+            self.catalog.accessions,
+            key=lambda acc_id: (
+                -self.counts.get(acc_id, 0),
+                self._catalog_rank[acc_id],
+            ),
+        )
+        self._rank = {acc_id: rank for rank, acc_id in enumerate(self._order)}
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+def _exact_match_winner(
+    read: np.ndarray, catalog: ReferenceCatalog, accessions: list, exact_accessions
+):
+    """Returns the accession classify_read would pick for a read occurring
+    exactly in a gene: the first accession in visiting order scoring 1,
+    either by containing the read or by having a shorter gene contained in
+    the read
+
+    Parameters
+    ----------
+    read : np.ndarray
+        uint8 encoded meta-genomic read
+    catalog : ReferenceCatalog
+        encoded reference gene sequences
+    accessions : list[str]
+        accession ids in visiting order
+    exact_accessions : list[str]
+        accession ids containing the read exactly
+
+    Returns
+    -------
+    str, None
+        winning accession id, None if no accession in the visiting order
+        contains the read
+    """
+    exact_accessions = set(exact_accessions)
+    read_bytes = read.tobytes()
+    for acc_id in accessions:
+        if acc_id in exact_accessions:
+            return acc_id
+
+        for gene in catalog[acc_id]:
+            if 0 < len(gene) < len(read) and gene.tobytes() in read_bytes:
+                return acc_id
+
+    return None
+
+
+def _accession_score(
+    read: np.ndarray,
+    gene_sequences,
+    threshold: float,
+    gene_windows=None,
+    stats=None,
+    best: float = 0.0,
+    scorer=None,
+    sequence_ids=None,
+    scored_sequences=None,
+    buffer=None,
+    gene_offsets=None,
+    full_scan=thresholded_hamming,
+) -> float:
+    """Returns the top score of the read against the genes of one accession.
+    Each gene only needs to beat the top score found so far, so windows are
+    abandoned as soon as they can no longer do so.
+
+    If the accession buffer is given, the windows of all genes at least as
+    long as the read are scanned in one pass over the buffer, skipping the
+    windows that span a gene boundary. Shorter genes walk on the read and
+    are scored one by one.
+
+    Parameters
+    ----------
+    read : np.ndarray
+        uint8 encoded meta-genomic read
+    gene_sequences : list[np.ndarray]
+        uint8 encoded gene sequences
+    threshold : float
+        minimum similarity score for a gene to be considered
+    gene_windows : dict, optional
+        gene number and candidate window offsets (None for a full scan) as
+        key value pairs. Default None fully scans every gene
+    stats : collections.Counter, optional
+        scanning counters
+    best : float, optional
+        score to beat, e.g. the best score of the previous accessions.
+        Default is 0.0
+    scorer : callable, optional
+        scoring backend used for genes scanned in full, default None uses
+        thresholded_hamming
+    sequence_ids : list[int], optional
+        unique sequence id of each gene (see ReferenceCatalog)
+    scored_sequences : set, optional
+        unique sequence ids already scored for this read, updated in place.
+        Copies can only tie with the score found first, so they are skipped
+    buffer : np.ndarray, optional
+        concatenated gene sequences of the accession (see ReferenceCatalog)
+    gene_offsets : np.ndarray, optional
+        start of each gene in the buffer, plus the end
+    full_scan : callable, optional
+        threshold-aware scan of all windows, thresholded_hamming or
+        sampled_hamming. Default is thresholded_hamming
+
+    Returns
+    -------
+    float
+        top score of the accession, `best` if no gene reaches the threshold
+        and beats it
+    """
+    if gene_windows is None:
+        gene_windows = dict.fromkeys(range(len(gene_sequences)))
+
+    # windows of the genes scanned together in the accession buffer
+    window_ranges = []
+    buffer_offsets = []
+
+    top_score = best
+    for gene_no, offsets in gene_windows.items():
+        if scored_sequences is not None:
+            sequence_id = sequence_ids[gene_no]
+            if sequence_id in scored_sequences:
+                if stats is not None:
+                    stats["genes_deduplicated"] += 1
+                continue
+            scored_sequences.add(sequence_id)
+
+        gene = gene_sequences[gene_no]
+        if buffer is not None and scorer is None and len(gene) >= len(read):
+            gene_start = gene_offsets[gene_no]
+            if offsets is None:
+                window_ranges.append(
+                    (gene_start, gene_start + len(gene) - len(read) + 1)
+                )
+            else:
+                buffer_offsets.append(offsets + gene_start)
+            continue
+
+        if offsets is None and scorer is not None:
+            score = scorer(read, gene)
+            if stats is not None:
+                stats["genes_scored"] += 1
+            if score is None or score < threshold or score <= top_score:
+                score = None
+        elif offsets is None:
+            score = full_scan(read, gene, threshold, best=top_score, stats=stats)
+        else:
+            score = thresholded_hamming(
+                read, gene, threshold, best=top_score, offsets=offsets, stats=stats
+            )
+        if score is None:
+            continue
+
+        top_score = score
+        if score == 1:
+            return top_score
+
+    if window_ranges:
+        score = full_scan(
+            read,
+            buffer,
+            threshold,
+            best=top_score,
+            stats=stats,
+            window_ranges=np.array(window_ranges, dtype=np.int64),
+        )
+        if score is not None:
+            top_score = score
+
+    if buffer_offsets and top_score < 1:
+        score = thresholded_hamming(
+            read,
+            buffer,
+            threshold,
+            best=top_score,
+            offsets=np.concatenate(buffer_offsets),
+            stats=stats,
+        )
+        if score is not None:
+            top_score = score
+
+    return top_score
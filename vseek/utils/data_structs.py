@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class ReadRecord:
     """Structure class that contains sequence reads information.
     srr_id: which SRR file it came from
@@ -11,3 +14,90 @@ class ReadRecord:
         self.fragment_id = fragment_id
         self.sequence = sequence
         self.length = length
+
+
+class ReadBatch:
+    """Structure class that contains a batch of sequence reads in columnar
+    form, one contiguous buffer instead of one string per read.
+    sample_id: which SRR file the reads came from, shared by the batch
+    fragment_ids: fragment id of each read (int64)
+    data: all read sequences concatenated, as uint8 ASCII codes (see
+        encode_sequence)
+    offsets: start of each read in data (int64)
+    lengths: length of each read (int64)
+
+    Iterating over a batch yields the encoded reads as views of data, so it
+    can be given to the classifiers in place of a list of reads.
+    """
+
+    __slots__ = ("sample_id", "fragment_ids", "data", "offsets", "lengths")
+
+    def __init__(self, sample_id, fragment_ids, data, offsets, lengths):
+        self.sample_id = sample_id
+        self.fragment_ids = fragment_ids
+        self.data = data
+        self.offsets = offsets
+        self.lengths = lengths
+
+    @classmethod
+    def from_sequences(cls, sample_id: str, fragment_ids: list, sequences: list):
+        """Packs read sequences into a batch
+
+        Parameters
+        ----------
+        sample_id : str
+            SRR id shared by all reads
+        fragment_ids : list[int]
+            fragment id of each read
+        sequences : list[bytes]
+            read sequences
+
+        Returns
+        -------
+        ReadBatch
+            batch holding the reads in one contiguous buffer
+        """
+        lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+        offsets = np.zeros(len(sequences), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+
+        return cls(
+            sample_id=sample_id,
+            fragment_ids=np.array(fragment_ids, dtype=np.int64),
+            data=np.frombuffer(b"".join(sequences), dtype=np.uint8),
+            offsets=offsets,
+            lengths=lengths,
+        )
+
+    def as_matrix(self) -> np.ndarray:
+        """Returns the reads as a (reads, length) array without copying them,
+        e.g. for batch_hamming
+
+        Returns
+        -------
+        np.ndarray
+            uint8 encoded reads, one per row
+
+        Raises
+        ------
+        ValueError
+            raised if the reads do not all have the same length
+        """
+        if len(self) == 0:
+            return self.data.reshape(0, 0)
+        if np.any(self.lengths != self.lengths[0]):
+            raise ValueError("All reads of a batch must have the same length")
+
+        return self.data.reshape(len(self), int(self.lengths[0]))
+
+    def __getitem__(self, read_no: int) -> np.ndarray:
+        offset = self.offsets[read_no]
+        return self.data[offset : offset + self.lengths[read_no]]
+
+    def __iter__(self):
+        if len(self) == 0:
+            return iter([])
+        return iter(np.split(self.data, self.offsets[1:]))
+
+    def __len__(self) -> int:
+        return len(self.lengths)
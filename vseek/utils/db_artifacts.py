@@ -0,0 +1,225 @@
+import json
+import time
+import hashlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+# vseek imports
+import vseek.common.io_files as vfiles
+import vseek.common.loader as vloader
+import vseek.common.vseek_paths as vsp
+from vseek.utils.kmer_index import KmerIndex
+from vseek.utils.reference_catalog import ReferenceCatalog
+from vseek.utils.sketches import AccessionSketches
+from vseek.utils.taxonomy_search import TaxonomySearch
+
+# changed whenever an artifact format changes, older builds are then stale
+ARTIFACTS_VERSION = 2
+
+# artifact name and file name in the index directory, in build order
+ARTIFACT_FILES = {
+    "reference_pack": "reference.pack",
+    "catalog": "reference_catalog.npz",
+    "kmer_index": "kmer_index.npz",
+    "accession_sketches": "accession_sketches.npz",
+    "taxonomy_sketches": "taxonomy_sketches.npz",
+}
+
+# records the inputs hash and parameters of the last complete build
+STAMP_FILE = "build_stamp.json"
+
+# caches the fastest threshold-aware scan per CPU, read lengths and threshold
+# (see vseek_analysis.autotune_threshold_scan)
+AUTOTUNE_FILE = "scan_autotune.json"
+
+
+def artifact_path(name: str) -> str:
+    """Returns the path of a database artifact in the index directory
+
+    Parameters
+    ----------
+    name : str
+        artifact name (see ARTIFACT_FILES)
+
+    Returns
+    -------
+    str
+        path to the artifact
+    """
+    return str(Path(vsp.index_db_path()) / ARTIFACT_FILES[name])
+
+
+def inputs_hash(merge_overlap: int, seed_size: int) -> str:
+    """Hashes everything the artifacts are built from: the checksums of the
+    genome fasta and genes files (see io_files.refresh_genome_manifest), the
+    bat virus table, the build parameters and ARTIFACTS_VERSION
+
+    Parameters
+    ----------
+    merge_overlap : int
+        minimum overlap of merged gene annotations, 0 disables merging
+    seed_size : int
+        k-mer size of the seed index, 0 disables the index
+
+    Returns
+    -------
+    str
+        hexadecimal blake2b digest
+    """
+    genome_checksums = {
+        genome_id: [
+            None if genome_file is None else genome_file["checksum"]
+            for genome_file in (genome_files["fasta"], genome_files["genes"])
+        ]
+        for genome_id, genome_files in vfiles.refresh_genome_manifest().items()
+    }
+    bat_virus_path = Path(vsp.db_path()) / "final_filtered_bat_virus.csv.gz"
+    bat_virus_checksum = hashlib.blake2b(
+        bat_virus_path.read_bytes(), digest_size=16
+    ).hexdigest()
+
+    inputs = {
+        "version": ARTIFACTS_VERSION,
+        "parameters": {"merge_overlap": merge_overlap, "seed_size": seed_size},
+        "genomes": genome_checksums,
+        "bat_virus_table": bat_virus_checksum,
+    }
+
+    return hashlib.blake2b(
+        json.dumps(inputs, sort_keys=True).encode(), digest_size=16
+    ).hexdigest()
+
+
+def artifacts_status(merge_overlap: int, seed_size: int) -> str:
+    """Checks the artifacts of the index directory against their inputs
+
+    Parameters
+    ----------
+    merge_overlap : int
+        minimum overlap of merged gene annotations, 0 disables merging
+    seed_size : int
+        k-mer size of the seed index, 0 disables the index
+
+    Returns
+    -------
+    str
+        "missing" if no complete build exists, "stale" if the inputs or
+        parameters changed since the last build, "current" otherwise
+    """
+    stamp = read_build_stamp()
+    if stamp is None:
+        return "missing"
+    if not all(Path(artifact_path(name)).is_file() for name in stamp["artifacts"]):
+        return "missing"
+    if stamp["inputs_hash"] != inputs_hash(merge_overlap, seed_size):
+        return "stale"
+
+    return "current"
+
+
+def read_build_stamp():
+    """Reads the stamp of the last complete build of the index directory
+
+    Returns
+    -------
+    dict, None
+        build stamp (see build_artifacts), None if no build completed
+    """
+    stamp_path = Path(vsp.index_db_path()) / STAMP_FILE
+    if not stamp_path.is_file():
+        return None
+
+    with open(stamp_path, "r") as infile:
+        return json.load(infile)
+
+
+def build_artifacts(merge_overlap: int, seed_size: int, workers=None) -> dict:
+    """Builds every database artifact and stamps them with the hash of their
+    inputs. The reference pack and the catalog are built first, the seed
+    index and sketches are then built in parallel from the saved catalog
+
+    Parameters
+    ----------
+    merge_overlap : int
+        minimum overlap of merged gene annotations, 0 disables merging
+    seed_size : int
+        k-mer size of the seed index, 0 disables the index
+    workers : int, optional
+        number of processes, default None uses all cores
+
+    Returns
+    -------
+    dict
+        build stamp: inputs hash, parameters, artifact names and seconds
+        spent building each artifact
+    """
+    index_path = Path(vsp.init_index_db_path())
+
+    # artifacts being rebuilt are never mistaken for a complete build
+    stamp_path = index_path / STAMP_FILE
+    stamp_path.unlink(missing_ok=True)
+
+    names = [name for name in ARTIFACT_FILES if name != "kmer_index" or seed_size > 0]
+    build_seconds = dict(
+        _build_artifact(name, merge_overlap, seed_size)
+        for name in ["reference_pack", "catalog"]
+    )
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(_build_artifact, name, merge_overlap, seed_size)
+            for name in names
+            if name not in build_seconds
+        ]
+        build_seconds.update(future.result() for future in futures)
+
+    stamp = {
+        "version": ARTIFACTS_VERSION,
+        "inputs_hash": inputs_hash(merge_overlap, seed_size),
+        "parameters": {"merge_overlap": merge_overlap, "seed_size": seed_size},
+        "artifacts": names,
+        "build_seconds": build_seconds,
+    }
+    with open(stamp_path, "w") as outfile:
+        json.dump(stamp, outfile, indent=4)
+
+    return stamp
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+def _build_artifact(name: str, merge_overlap: int, seed_size: int) -> tuple:
+    """Builds and saves one artifact, the ones after the catalog load it
+    from the index directory
+
+    Parameters
+    ----------
+    name : str
+        artifact name (see ARTIFACT_FILES)
+    merge_overlap : int
+        minimum overlap of merged gene annotations, 0 disables merging
+    seed_size : int
+        k-mer size of the seed index
+
+    Returns
+    -------
+    tuple
+        artifact name and seconds spent building it
+    """
+    started = time.perf_counter()
+    file_path = artifact_path(name)
+    if name == "reference_pack":
+        vloader.build_reference_pack(file_path)
+    elif name == "catalog":
+        catalog = ReferenceCatalog.from_database(merge_overlap=merge_overlap)
+        catalog.save(file_path)
+    else:
+        catalog = ReferenceCatalog.load(artifact_path("catalog"))
+        if name == "kmer_index":
+            KmerIndex.build(catalog, k=seed_size).save(file_path)
+        elif name == "accession_sketches":
+            AccessionSketches.build(catalog).save(file_path)
+        elif name == "taxonomy_sketches":
+            TaxonomySearch.build(catalog).save(file_path)
+
+    return (name, time.perf_counter() - started)
@@ -0,0 +1,127 @@
+import numpy as np
+
+# vseek imports
+from vseek.utils.vseek_analysis import encode_sequence
+
+
+def pattern_bitmasks(pattern: np.ndarray) -> dict:
+    """Builds the match bit vector of every symbol of the pattern. Bit i of
+    a symbol's vector is set when the pattern has that symbol at position i.
+    Python integers are used as bit vectors, so patterns of any length are
+    processed in ceil(m / w) machine word operations.
+
+    Parameters
+    ----------
+    pattern : np.ndarray
+        uint8 encoded sequence
+
+    Returns
+    -------
+    dict
+        symbol (uint8 code) and bit vector as key value pairs
+    """
+    bitmasks = {}
+    for position, symbol in enumerate(pattern.tobytes()):
+        bitmasks[symbol] = bitmasks.get(symbol, 0) | (1 << position)
+
+    return bitmasks
+
+
+def semi_global_edit_distance(pattern, text) -> int:
+    """Smallest edit distance between the whole pattern and any substring of
+    the text, computed with Myers' bit-parallel algorithm (Hyyro's
+    formulation). Substitutions, insertions and deletions all cost 1 and
+    the text ends are free.
+
+    Parameters
+    ----------
+    pattern : str, np.ndarray
+        sequence aligned end to end, e.g. a meta-genomic read
+    text : str, np.ndarray
+        sequence the pattern is searched in, e.g. a gene
+
+    Returns
+    -------
+    int
+        best semi-global edit distance
+    """
+    pattern = encode_sequence(pattern)
+    text = encode_sequence(text)
+    pattern_length = len(pattern)
+    if pattern_length == 0:
+        return 0
+
+    bitmasks = pattern_bitmasks(pattern)
+    all_bits = (1 << pattern_length) - 1
+    last_bit = 1 << (pattern_length - 1)
+
+    # vertical deltas of the current column, all +1 at the start
+    positive_vertical = all_bits
+    negative_vertical = 0
+    distance = pattern_length
+    best_distance = pattern_length
+    for symbol in text.tobytes():
+        matches = bitmasks.get(symbol, 0)
+        vertical = matches | negative_vertical
+        horizontal = (
+            ((matches & positive_vertical) + positive_vertical) ^ positive_vertical
+        ) | matches
+
+        positive_horizontal = negative_vertical | (
+            ~(horizontal | positive_vertical) & all_bits
+        )
+        negative_horizontal = positive_vertical & horizontal
+
+        if positive_horizontal & last_bit:
+            distance += 1
+        elif negative_horizontal & last_bit:
+            distance -= 1
+
+        # no carry into the first row: the alignment may start anywhere
+        positive_horizontal = (positive_horizontal << 1) & all_bits
+        negative_horizontal = (negative_horizontal << 1) & all_bits
+        positive_vertical = negative_horizontal | (
+            ~(vertical | positive_horizontal) & all_bits
+        )
+        negative_vertical = positive_horizontal & vertical
+
+        if distance < best_distance:
+            best_distance = distance
+            if best_distance == 0:
+                break
+
+    return best_distance
+
+
+def edit_similarity(read, reference) -> float:
+    """Indel tolerant counterpart of dynamic_hamming. The shorter sequence
+    is aligned end to end within the longer one and the score is reported
+    on the same 0 to 1 scale: 1 - edit distance / length of the shorter
+    sequence.
+
+    Parameters
+    ----------
+    read : str, np.ndarray
+        meta-genomic read
+    reference : str, np.ndarray
+        reference sequence
+
+    Returns
+    -------
+    float
+        top similarity score
+    """
+    read = encode_sequence(read)
+    reference = encode_sequence(reference)
+    if len(read) == 0 or len(reference) == 0:
+        return 0.0
+
+    # if the read is larger than the gene, the gene is searched in the read
+    if len(reference) > len(read):
+        pattern, text = read, reference
+    else:
+        pattern, text = reference, read
+
+    distance = semi_global_edit_distance(pattern, text)
+
+    return 1.0 - distance / len(pattern)
@@ -0,0 +1,186 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# vseek imports
+from vseek.utils.reference_catalog import ReferenceCatalog
+from vseek.utils.vseek_analysis import encode_sequence
+
+# odd base of the rolling hash, arithmetic is done modulo 2^64
+ROLLING_HASH_BASE = 0x100000001B3
+
+# window hashes are first filtered on their low bits with a bitmap of the
+# read hashes, only the few windows passing it are searched
+FILTER_BITS = 22
+
+
+class ExactMatcher:
+    """Finds the reads of a batch occurring exactly in the catalog genes with
+    a multi-pattern Rabin-Karp search. The rolling hash prefixes of all
+    accession buffers are computed once. The hash of every window of a read
+    length is then derived in a single vectorized pass and looked up among
+    the hashes of the batch reads, so the whole catalog is streamed once per
+    read length and batch, whatever the number of reads.
+
+    sequences: accession buffers concatenated (see ReferenceCatalog)
+    accession_starts: start of each accession in sequences
+    gene_ends: end of the gene of every position of sequences
+    prefix_hashes: rolling hash of every prefix of sequences
+    """
+
+    def __init__(self, catalog: ReferenceCatalog):
+        """
+        Parameters
+        ----------
+        catalog : ReferenceCatalog
+            encoded reference gene sequences
+        """
+        arrays = catalog.to_arrays()
+        gene_offsets = arrays["gene_offsets"]
+        gene_bounds = np.cumsum(np.concatenate(([0], arrays["gene_counts"])))
+
+        self.accessions = catalog.accessions
+        self.sequences = arrays["sequences"]
+        self.accession_starts = gene_offsets[gene_bounds[:-1]]
+        self.gene_ends = np.repeat(gene_offsets[1:], np.diff(gene_offsets))
+        self.prefix_hashes = _prefix_hashes(self.sequences)
+
+    def find(self, reads: list) -> list[list[str]]:
+        """Lists, per read, the accessions with a gene containing the read
+
+        Parameters
+        ----------
+        reads : list
+            meta-genomic reads
+
+        Returns
+        -------
+        list[list[str]]
+            accession ids containing each read exactly, in catalog order.
+            Empty for reads without any exact occurrence
+        """
+        reads = [encode_sequence(read) for read in reads]
+        read_accessions = [set() for _ in reads]
+
+        read_lengths = np.array([len(read) for read in reads])
+        for length in np.unique(read_lengths).tolist():
+            if length == 0 or length > len(self.sequences):
+                continue
+            read_numbers = np.flatnonzero(read_lengths == length)
+            for read_no, acc_idx in self._length_hits(reads, read_numbers, length):
+                read_accessions[read_no].add(acc_idx)
+
+        return [
+            [self.accessions[acc_idx] for acc_idx in sorted(acc_indices)]
+            for acc_indices in read_accessions
+        ]
+
+    def _length_hits(self, reads: list, read_numbers: np.ndarray, length: int):
+        """Finds the exact occurrences of reads of the same length
+
+        Parameters
+        ----------
+        reads : list
+            uint8 encoded meta-genomic reads
+        read_numbers : np.ndarray
+            numbers of the reads of the given length
+        length : int
+            read length
+
+        Returns
+        -------
+        iterator
+            (read number, accession index) of every exact occurrence
+        """
+        length_reads = np.stack([reads[read_no] for read_no in read_numbers])
+        powers = _powers(length + 1)
+        read_powers = powers[length - 1 :: -1]
+        read_hashes = (length_reads.astype(np.uint64) * read_powers).sum(
+            axis=1, dtype=np.uint64
+        )
+        order = np.argsort(read_hashes, kind="stable")
+        sorted_hashes = read_hashes[order]
+
+        # hashes of all windows lying inside a single gene
+        starts = np.flatnonzero(
+            np.arange(len(self.sequences) - length + 1) + length
+            <= self.gene_ends[: len(self.sequences) - length + 1]
+        )
+        window_hashes = (
+            self.prefix_hashes[starts + length]
+            - self.prefix_hashes[starts] * powers[length]
+        )
+
+        filter_mask = np.uint64(2**FILTER_BITS - 1)
+        hash_filter = np.zeros(2**FILTER_BITS, dtype=bool)
+        hash_filter[read_hashes & filter_mask] = True
+        candidates = hash_filter[window_hashes & filter_mask]
+        starts = starts[candidates]
+        window_hashes = window_hashes[candidates]
+
+        # windows whose hash is the hash of a read, then all reads sharing it
+        first = np.searchsorted(sorted_hashes, window_hashes, side="left")
+        last = np.searchsorted(sorted_hashes, window_hashes, side="right")
+        n_hits = last - first
+        hit_starts = np.repeat(starts, n_hits)
+        hits = np.repeat(first - np.cumsum(n_hits) + n_hits, n_hits)
+        hit_reads = order[hits + np.arange(len(hits))]
+
+        # hash collisions are ruled out by comparing the bases
+        windows = sliding_window_view(self.sequences, length)
+        exact = np.all(windows[hit_starts] == length_reads[hit_reads], axis=1)
+        acc_indices = (
+            np.searchsorted(self.accession_starts, hit_starts[exact], side="right") - 1
+        )
+
+        return zip(read_numbers[hit_reads[exact]].tolist(), acc_indices.tolist())
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+def _powers(length: int) -> np.ndarray:
+    """Powers of the rolling hash base modulo 2^64
+
+    Parameters
+    ----------
+    length : int
+        number of powers
+
+    Returns
+    -------
+    np.ndarray
+        uint64 base^0 to base^(length - 1)
+    """
+    powers = np.full(length, ROLLING_HASH_BASE, dtype=np.uint64)
+    powers[0] = 1
+
+    return np.cumprod(powers, dtype=np.uint64)
+
+
+def _prefix_hashes(sequence: np.ndarray) -> np.ndarray:
+    """Rolling hash of every prefix of a sequence, computed without a
+    Python loop: the hash of the first i bases is
+    base^(i - 1) * sum(sequence[j] * base^-j) modulo 2^64, the base being
+    odd and thus invertible
+
+    Parameters
+    ----------
+    sequence : np.ndarray
+        uint8 encoded sequence
+
+    Returns
+    -------
+    np.ndarray
+        uint64 hashes of the len(sequence) + 1 prefixes
+    """
+    inverse = pow(ROLLING_HASH_BASE, -1, 2**64)
+    inverse_powers = np.full(len(sequence), inverse, dtype=np.uint64)
+    inverse_powers[0] = 1
+    inverse_powers = np.cumprod(inverse_powers, dtype=np.uint64)
+
+    prefix_hashes = np.zeros(len(sequence) + 1, dtype=np.uint64)
+    prefix_hashes[1:] = _powers(len(sequence)) * np.cumsum(
+        sequence.astype(np.uint64) * inverse_powers, dtype=np.uint64
+    )
+
+    return prefix_hashes
@@ -0,0 +1,211 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# numba is an optional dependency, kernels fall back to numpy without it
+try:
+    from numba import njit
+
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# number of windows compared per block by the numpy fallback
+FALLBACK_BLOCK_SIZE = 8192
+
+# bases compared per XOR, one uint64 word holds 8 uint8 encoded bases
+WORD_SIZE = 8
+
+_LOW_BITS = np.uint64(0x0101010101010101)
+_BYTE = np.uint64(0xFF)
+
+
+def _window_min_mismatches(
+    pattern_words: np.ndarray,
+    masks: np.ndarray,
+    text_words: np.ndarray,
+    window_ranges: np.ndarray,
+    budget: int,
+) -> tuple:
+    """Smallest number of mismatches of the pattern over the windows of the
+    text within the given ranges of window offsets. Eight bases are compared
+    per XOR and the differing bytes are counted with bit tricks. A window is
+    abandoned as soon as it can no longer beat the best window found so far,
+    starting from budget + 1.
+
+    Parameters
+    ----------
+    pattern_words : np.ndarray
+        pattern bytes as uint64 words
+    masks : np.ndarray
+        uint64 mask of the pattern bytes in use in each word
+    text_words : np.ndarray
+        (8, words) text bytes as uint64 words, row s starts at byte s
+    window_ranges : np.ndarray
+        (n, 2) int64 array of [start, stop) window offsets to scan
+    budget : int
+        maximum number of mismatches of interest
+
+    Returns
+    -------
+    tuple
+        smallest number of mismatches (budget + 1 if no window is within the
+        budget) and number of abandoned windows
+    """
+    best = budget + 1
+    n_abandoned = 0
+    for range_no in range(len(window_ranges)):
+        for start in range(window_ranges[range_no, 0], window_ranges[range_no, 1]):
+            shifted_words = text_words[start % WORD_SIZE]
+            first_word = start // WORD_SIZE
+
+            mismatches = 0
+            for word_no in range(len(pattern_words)):
+                diff = pattern_words[word_no] ^ shifted_words[first_word + word_no]
+                diff &= masks[word_no]
+
+                # one bit per differing byte, then summing the bytes
+                diff |= diff >> np.uint64(4)
+                diff |= diff >> np.uint64(2)
+                diff |= diff >> np.uint64(1)
+                diff &= _LOW_BITS
+                diff += diff >> np.uint64(8)
+                diff += diff >> np.uint64(16)
+                diff += diff >> np.uint64(32)
+                mismatches += int(diff & _BYTE)
+                if mismatches >= best:
+                    break
+
+            if mismatches < best:
+                best = mismatches
+                if best == 0:
+                    return (best, n_abandoned)
+            else:
+                n_abandoned += 1
+
+    return (best, n_abandoned)
+
+
+# compiled loop when numba is importable, pure Python loop otherwise
+if NUMBA_AVAILABLE:
+    window_min_mismatches_loop = njit(cache=True, nogil=True)(_window_min_mismatches)
+else:
+    window_min_mismatches_loop = _window_min_mismatches
+
+
+def pattern_words(pattern: np.ndarray) -> tuple:
+    """Packs a uint8 encoded pattern into uint64 words
+
+    Parameters
+    ----------
+    pattern : np.ndarray
+        uint8 encoded sequence
+
+    Returns
+    -------
+    tuple
+        uint64 pattern words and the uint64 masks of the bytes in use
+    """
+    n_words = -(-len(pattern) // WORD_SIZE)
+    padded = np.zeros(n_words * WORD_SIZE, dtype=np.uint8)
+    padded[: len(pattern)] = pattern
+    in_use = np.zeros(n_words * WORD_SIZE, dtype=np.uint8)
+    in_use[: len(pattern)] = 0xFF
+
+    return (padded.view(np.uint64), in_use.view(np.uint64))
+
+
+def text_words(text: np.ndarray, pattern_length: int) -> np.ndarray:
+    """Packs a uint8 encoded text into uint64 words, once for every byte
+    shift, so that any window starts on a word boundary of one of the rows
+
+    Parameters
+    ----------
+    text : np.ndarray
+        uint8 encoded sequence
+    pattern_length : int
+        length of the pattern walking on the text
+
+    Returns
+    -------
+    np.ndarray
+        (8, words) uint64 array, row s holds the text starting at byte s
+    """
+    n_words = -(-len(text) // WORD_SIZE) + -(-pattern_length // WORD_SIZE)
+    padded = np.zeros((n_words + 1) * WORD_SIZE, dtype=np.uint8)
+    padded[: len(text)] = text
+
+    shifted = np.empty((WORD_SIZE, n_words), dtype=np.uint64)
+    for shift in range(WORD_SIZE):
+        shifted[shift] = padded[shift : shift + n_words * WORD_SIZE].view(np.uint64)
+
+    return shifted
+
+
+def window_min_mismatches(
+    read: np.ndarray,
+    reference: np.ndarray,
+    budget: int,
+    stats=None,
+    window_ranges=None,
+) -> int:
+    """Smallest number of mismatches over all windows the read walks on the
+    reference (the reference walks on the read if it is shorter). Uses the
+    compiled early exit loop when numba is available, otherwise a strided
+    numpy scan.
+
+    Parameters
+    ----------
+    read : np.ndarray
+        uint8 encoded meta-genomic read
+    reference : np.ndarray
+        uint8 encoded reference sequence
+    budget : int
+        maximum number of mismatches of interest, windows are abandoned
+        once over it
+    stats : collections.Counter, optional
+        counter updated with the number of abandoned windows
+    window_ranges : np.ndarray, optional
+        (n, 2) array of [start, stop) window offsets to scan, e.g. the
+        windows inside single genes of a concatenated accession. Default
+        None scans all windows
+
+    Returns
+    -------
+    int
+        smallest number of mismatches, budget + 1 if no window is within
+        the budget
+    """
+    if len(reference) > len(read):
+        pattern, text = read, reference
+    else:
+        pattern, text = reference, read
+    if window_ranges is None:
+        window_ranges = [(0, len(text) - len(pattern) + 1)]
+    window_ranges = np.asarray(window_ranges, dtype=np.int64).reshape(-1, 2)
+    if len(window_ranges) == 0:
+        return budget + 1
+
+    # only the part of the text covered by the windows is packed
+    first_window = window_ranges[:, 0].min()
+    text = text[first_window : window_ranges[:, 1].max() + len(pattern) - 1]
+    window_ranges = window_ranges - first_window
+
+    if NUMBA_AVAILABLE:
+        words, masks = pattern_words(pattern)
+        best, n_abandoned = window_min_mismatches_loop(
+            words, masks, text_words(text, len(pattern)), window_ranges, budget
+        )
+        if stats is not None:
+            stats["windows_abandoned"] += int(n_abandoned)
+        return int(best)
+
+    windows = sliding_window_view(text, len(pattern))
+    best = budget + 1
+    for range_start, range_stop in window_ranges.tolist():
+        for start in range(range_start, range_stop, FALLBACK_BLOCK_SIZE):
+            block = windows[start : min(start + FALLBACK_BLOCK_SIZE, range_stop)]
+            best = min(best, int(np.count_nonzero(block != pattern, axis=1).min()))
+            if best == 0:
+                return best
+
+    return best
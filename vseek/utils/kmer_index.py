@@ -0,0 +1,288 @@
+from pathlib import Path
+from collections import defaultdict
+
+import numpy as np
+
+# vseek imports
+from vseek.utils.nucleotide_codec import kmer_codes
+from vseek.utils.reference_catalog import ReferenceCatalog
+
+DEFAULT_SEED_SIZE = 12
+
+# k-mers occurring more often than this (low complexity repeats) are not
+# used as seeds, keeps the number of candidate windows per read bounded
+DEFAULT_MAX_OCCURRENCES = 512
+
+
+class KmerIndex:
+    """Inverted index of the reference gene k-mers. Every indexed k-mer is
+    stored with the gene it comes from and its offset inside the gene, as
+    sorted integer arrays:
+
+    kmers: sorted uint64 k-mer codes
+    gene_ids: global gene id of each k-mer
+    offsets: position of each k-mer inside its gene
+    """
+
+    def __init__(
+        self,
+        k: int,
+        kmers: np.ndarray,
+        gene_ids: np.ndarray,
+        offsets: np.ndarray,
+        genes: list[tuple],
+        gene_lengths: np.ndarray,
+        unindexed_genes: np.ndarray,
+        max_occurrences: int = DEFAULT_MAX_OCCURRENCES,
+    ):
+        """
+        Parameters
+        ----------
+        k : int
+            k-mer (seed) size
+        kmers : np.ndarray
+            sorted uint64 k-mer codes
+        gene_ids : np.ndarray
+            global gene id of each k-mer
+        offsets : np.ndarray
+            position of each k-mer inside its gene
+        genes : list[tuple]
+            (accession id, gene number) of each global gene id
+        gene_lengths : np.ndarray
+            length of each gene
+        unindexed_genes : np.ndarray
+            global gene ids without any k-mer, these are always fully scanned
+        max_occurrences : int, optional
+            k-mers with more occurrences are ignored during lookups
+        """
+        self.k = k
+        self.kmers = kmers
+        self.gene_ids = gene_ids
+        self.offsets = offsets
+        self.genes = genes
+        self.gene_lengths = gene_lengths
+        self.unindexed_genes = unindexed_genes
+        self.max_occurrences = max_occurrences
+
+    @classmethod
+    def build(
+        cls,
+        catalog: ReferenceCatalog,
+        k: int = DEFAULT_SEED_SIZE,
+        max_occurrences: int = DEFAULT_MAX_OCCURRENCES,
+    ):
+        """Builds the k-mer index over all genes in the reference catalog
+
+        Parameters
+        ----------
+        catalog : ReferenceCatalog
+            encoded reference gene sequences
+        k : int, optional
+            k-mer (seed) size, default is 12
+        max_occurrences : int, optional
+            k-mers with more occurrences are ignored during lookups
+
+        Returns
+        -------
+        KmerIndex
+            k-mer index of the catalog
+        """
+        genes = []
+        gene_lengths = []
+        all_kmers = []
+        all_gene_ids = []
+        all_offsets = []
+        unindexed_genes = []
+        for acc_id, gene_sequences in catalog.items():
+            for gene_no, gene in enumerate(gene_sequences):
+                gene_id = len(genes)
+                genes.append((acc_id, gene_no))
+                gene_lengths.append(len(gene))
+
+                kmers, positions = kmer_codes(gene, k)
+                if len(kmers) == 0:
+                    unindexed_genes.append(gene_id)
+                    continue
+
+                all_kmers.append(kmers)
+                all_gene_ids.append(np.full(len(kmers), gene_id, dtype=np.int32))
+                all_offsets.append(positions.astype(np.int32))
+
+        kmers = np.concatenate(all_kmers) if all_kmers else np.empty(0, np.uint64)
+        gene_ids = np.concatenate(all_gene_ids) if all_kmers else np.empty(0, np.int32)
+        offsets = np.concatenate(all_offsets) if all_kmers else np.empty(0, np.int32)
+
+        order = np.argsort(kmers, kind="stable")
+        return cls(
+            k=k,
+            kmers=kmers[order],
+            gene_ids=gene_ids[order],
+            offsets=offsets[order],
+            genes=genes,
+            gene_lengths=np.array(gene_lengths, dtype=np.int64),
+            unindexed_genes=np.array(unindexed_genes, dtype=np.int64),
+            max_occurrences=max_occurrences,
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays: dict):
+        """Rebuilds an index from the arrays returned by to_arrays
+
+        Parameters
+        ----------
+        arrays : dict
+            arrays returned by to_arrays
+
+        Returns
+        -------
+        KmerIndex
+            index backed by the given arrays
+        """
+        accessions = arrays["accessions"].tolist()
+        genes = [
+            (accessions[acc_idx], gene_no)
+            for acc_idx, gene_no in zip(
+                arrays["gene_accessions"].tolist(), arrays["gene_numbers"].tolist()
+            )
+        ]
+
+        return cls(
+            k=int(arrays["k"]),
+            kmers=arrays["kmers"],
+            gene_ids=arrays["gene_ids"],
+            offsets=arrays["offsets"],
+            genes=genes,
+            gene_lengths=arrays["gene_lengths"],
+            unindexed_genes=arrays["unindexed_genes"],
+            max_occurrences=int(arrays["max_occurrences"]),
+        )
+
+    def to_arrays(self) -> dict:
+        """Returns the index as plain numpy arrays, e.g. to place it into
+        shared memory
+
+        Returns
+        -------
+        dict
+            array names and numpy arrays as key value pairs
+        """
+        accessions = list(dict.fromkeys(acc_id for acc_id, gene_no in self.genes))
+        acc_idx = {acc_id: idx for idx, acc_id in enumerate(accessions)}
+
+        return {
+            "k": np.array(self.k),
+            "max_occurrences": np.array(self.max_occurrences),
+            "kmers": self.kmers,
+            "gene_ids": self.gene_ids,
+            "offsets": self.offsets,
+            "accessions": np.array(accessions),
+            "gene_accessions": np.array(
+                [acc_idx[acc_id] for acc_id, gene_no in self.genes], dtype=np.int32
+            ),
+            "gene_numbers": np.array(
+                [gene_no for acc_id, gene_no in self.genes], dtype=np.int32
+            ),
+            "gene_lengths": self.gene_lengths,
+            "unindexed_genes": self.unindexed_genes,
+        }
+
+    @classmethod
+    def load(cls, file_path: str):
+        """Loads an index saved with KmerIndex.save
+
+        Parameters
+        ----------
+        file_path : str
+            path to the index file
+
+        Returns
+        -------
+        KmerIndex
+            loaded index
+        """
+        with np.load(file_path) as index_file:
+            return cls.from_arrays(dict(index_file))
+
+    def save(self, file_path: str) -> None:
+        """Saves the index into a numpy .npz file
+
+        Parameters
+        ----------
+        file_path : str
+            path where the index is saved
+        """
+        with open(Path(file_path), "wb") as outfile:
+            np.savez(outfile, **self.to_arrays())
+
+    def lookup(self, kmers: np.ndarray) -> tuple:
+        """Finds all occurrences of the query k-mers
+
+        Parameters
+        ----------
+        kmers : np.ndarray
+            uint64 k-mer codes
+
+        Returns
+        -------
+        tuple
+            index of the query k-mer, gene ids and gene offsets of each hit
+        """
+        starts = np.searchsorted(self.kmers, kmers, side="left")
+        ends = np.searchsorted(self.kmers, kmers, side="right")
+        n_hits = ends - starts
+        n_hits[n_hits > self.max_occurrences] = 0
+
+        query_idx = np.repeat(np.arange(len(kmers)), n_hits)
+        hit_starts = np.repeat(starts - np.cumsum(n_hits) + n_hits, n_hits)
+        hits = hit_starts + np.arange(len(query_idx))
+
+        return (query_idx, self.gene_ids[hits], self.offsets[hits])
+
+    def candidate_windows(self, read: np.ndarray) -> dict:
+        """Finds the window offsets supported by at least one shared seed.
+        Offsets follow the window_mismatches convention.
+
+        Parameters
+        ----------
+        read : np.ndarray
+            uint8 encoded meta-genomic read
+
+        Returns
+        -------
+        dict
+            accession id -> {gene number: window offsets}. Genes too short to
+            be indexed are mapped to None, meaning they must be fully scanned
+        """
+        read_kmers, read_positions = kmer_codes(read, self.k)
+        query_idx, gene_ids, gene_offsets = self.lookup(read_kmers)
+
+        # diagonal of each seed hit: gene position of the read start
+        diagonals = gene_offsets.astype(np.int64) - read_positions[query_idx]
+        gene_lengths = self.gene_lengths[gene_ids]
+        read_is_pattern = gene_lengths > len(read)
+        window_offsets = np.where(read_is_pattern, diagonals, -diagonals)
+        n_windows = np.abs(gene_lengths - len(read)) + 1
+        valid = (window_offsets >= 0) & (window_offsets < n_windows)
+
+        # unique (gene, offset) pairs, sorted by gene
+        pairs = np.unique(
+            np.stack((gene_ids[valid].astype(np.int64), window_offsets[valid])),
+            axis=1,
+        )
+        split_at = np.flatnonzero(np.diff(pairs[0])) + 1
+
+        candidates = defaultdict(dict)
+        for gene_offsets in np.split(pairs, split_at, axis=1):
+            if gene_offsets.shape[1] == 0:
+                continue
+            acc_id, gene_no = self.genes[gene_offsets[0, 0]]
+            candidates[acc_id][gene_no] = gene_offsets[1]
+
+        for gene_id in self.unindexed_genes:
+            acc_id, gene_no = self.genes[gene_id]
+            candidates[acc_id][gene_no] = None
+
+        return candidates
+
+    def __len__(self) -> int:
+        return len(self.kmers)
@@ -0,0 +1,324 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 2-bit nucleotide codes, every other character (N, IUPAC ambiguity codes,
+# lowercase bases, ...) is flagged in the ambiguity mask
+NUCLEOTIDE_CODES = {"A": 0, "C": 1, "G": 2, "T": 3}
+BASES_PER_WORD = 32
+
+_LOW_BITS = np.uint64(0x5555555555555555)
+_SHIFTS = np.arange(0, 64, 2, dtype=np.uint64)
+
+_CODE_TABLE = np.zeros(256, dtype=np.uint64)
+_AMBIGUOUS_TABLE = np.ones(256, dtype=bool)
+for _base, _code in NUCLEOTIDE_CODES.items():
+    _CODE_TABLE[ord(_base)] = _code
+    _AMBIGUOUS_TABLE[ord(_base)] = False
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class PackedSequence:
+    """Structure class that contains a 2-bit packed nucleotide sequence.
+    words: 2-bit codes, 32 bases per uint64 word
+    mask: both bits of a base are set if the base is ambiguous
+    length: number of bases
+    ambiguous_positions: positions of the ambiguous bases
+    ambiguous_bases: original ASCII codes of the ambiguous bases
+    """
+
+    __slots__ = ("words", "mask", "length", "ambiguous_positions", "ambiguous_bases")
+
+    def __init__(self, words, mask, length, ambiguous_positions, ambiguous_bases):
+        self.words = words
+        self.mask = mask
+        self.length = length
+        self.ambiguous_positions = ambiguous_positions
+        self.ambiguous_bases = ambiguous_bases
+
+    def __len__(self):
+        return self.length
+
+
+def pack_sequence(sequence) -> PackedSequence:
+    """Packs a nucleotide sequence into 2-bit codes
+
+    Parameters
+    ----------
+    sequence : str, bytes, np.ndarray
+        nucleotide sequence or uint8 encoded sequence
+
+    Returns
+    -------
+    PackedSequence
+        packed sequence with its ambiguity mask
+    """
+    if isinstance(sequence, PackedSequence):
+        return sequence
+    if isinstance(sequence, str):
+        sequence = sequence.encode("ascii")
+    sequence = np.frombuffer(sequence, dtype=np.uint8)
+
+    length = len(sequence)
+    n_words = -(-length // BASES_PER_WORD)
+    padded = np.zeros(n_words * BASES_PER_WORD, dtype=np.uint8)
+    padded[:length] = sequence
+
+    ambiguous = _AMBIGUOUS_TABLE[padded]
+    ambiguous[length:] = False
+    codes = _CODE_TABLE[padded].reshape(n_words, BASES_PER_WORD)
+    mask_codes = ambiguous.astype(np.uint64).reshape(n_words, BASES_PER_WORD)
+
+    words = np.bitwise_or.reduce(codes << _SHIFTS, axis=1)
+    mask = np.bitwise_or.reduce((mask_codes * np.uint64(3)) << _SHIFTS, axis=1)
+    ambiguous_positions = np.flatnonzero(ambiguous)
+
+    return PackedSequence(
+        words=words.astype(np.uint64),
+        mask=mask.astype(np.uint64),
+        length=length,
+        ambiguous_positions=ambiguous_positions,
+        ambiguous_bases=padded[ambiguous_positions],
+    )
+
+
+def unpack_sequence(packed: PackedSequence) -> str:
+    """Converts a packed sequence back into a string
+
+    Parameters
+    ----------
+    packed : PackedSequence
+        packed sequence
+
+    Returns
+    -------
+    str
+        nucleotide sequence
+    """
+    codes = (packed.words[:, None] >> _SHIFTS) & np.uint64(3)
+    sequence = np.frombuffer(b"ACGT", dtype=np.uint8)[codes.ravel()[: packed.length]]
+    sequence[packed.ambiguous_positions] = packed.ambiguous_bases
+
+    return sequence.tobytes().decode("ascii")
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Counts the set bits of each uint64 word
+
+    Parameters
+    ----------
+    words : np.ndarray
+        uint64 words
+
+    Returns
+    -------
+    np.ndarray
+        number of set bits per word
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+
+    # numpy < 2.0 fallback: byte lookup table
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+    byte_counts = _POPCOUNT_TABLE[words.view(np.uint8)]
+    return byte_counts.reshape(words.shape + (8,)).sum(axis=-1)
+
+
+def packed_mismatches(read: PackedSequence, reference: PackedSequence) -> int:
+    """Counts mismatches between two packed sequences of the same length
+    with XOR and popcount
+
+    Parameters
+    ----------
+    read : PackedSequence
+        packed meta-genomic read
+    reference : PackedSequence
+        packed reference sequence of the same length
+
+    Returns
+    -------
+    int
+        number of mismatches
+    """
+    read = pack_sequence(read)
+    reference = pack_sequence(reference)
+    if read.length != reference.length:
+        raise ValueError("Packed sequences must have the same length")
+
+    window = np.stack([reference.words])
+    window_mask = np.stack([reference.mask])
+    mismatches = _count_word_mismatches(read, window, window_mask)
+    mismatches -= _shared_ambiguous_matches(read, reference, n_windows=1)
+
+    return int(mismatches[0])
+
+
+def packed_window_mismatches(read: PackedSequence, reference: PackedSequence):
+    """Packed equivalent of vseek_analysis.window_mismatches. Counts the
+    mismatches of every window the read walks on the reference. If the
+    read is larger than the reference, the reference walks on the read.
+
+    Parameters
+    ----------
+    read : PackedSequence
+        packed meta-genomic read
+    reference : PackedSequence
+        packed reference sequence
+
+    Returns
+    -------
+    np.ndarray
+        number of mismatches at each window offset
+    """
+    read = pack_sequence(read)
+    reference = pack_sequence(reference)
+    if reference.length > read.length:
+        pattern, text = read, reference
+    else:
+        pattern, text = reference, read
+
+    n_windows = text.length - pattern.length + 1
+    n_pattern_words = len(pattern.words)
+    mismatches = np.empty(n_windows, dtype=np.int64)
+
+    # one extra zero word so that every window can read its next word
+    text_words = np.append(text.words, np.zeros(n_pattern_words + 1, np.uint64))
+    text_mask = np.append(text.mask, np.zeros(n_pattern_words + 1, np.uint64))
+
+    # windows starting at the same position inside a word (phase) are word
+    # aligned once the text is shifted by that phase
+    for phase in range(min(BASES_PER_WORD, n_windows)):
+        n_phase_windows = len(range(phase, n_windows, BASES_PER_WORD))
+        shifted_words = _shift_words(text_words, phase)
+        shifted_mask = _shift_words(text_mask, phase)
+
+        windows = sliding_window_view(shifted_words, n_pattern_words)
+        window_masks = sliding_window_view(shifted_mask, n_pattern_words)
+        mismatches[phase::BASES_PER_WORD] = _count_word_mismatches(
+            pattern,
+            windows[:n_phase_windows],
+            window_masks[:n_phase_windows],
+        )
+
+    mismatches -= _shared_ambiguous_matches(pattern, text, n_windows)
+    return mismatches
+
+
+def kmer_codes(sequence, k: int) -> tuple:
+    """Computes the 2-bit integer code of every k-mer in a sequence. K-mers
+    containing ambiguous bases are skipped.
+
+    Parameters
+    ----------
+    sequence : str, bytes, np.ndarray
+        nucleotide sequence or uint8 encoded sequence
+    k : int
+        k-mer size, at most 32 bases
+
+    Returns
+    -------
+    tuple
+        uint64 k-mer codes and the positions where each k-mer starts
+    """
+    if not 0 < k <= BASES_PER_WORD:
+        raise ValueError(f"k-mer size must be between 1 and {BASES_PER_WORD}")
+    if isinstance(sequence, str):
+        sequence = sequence.encode("ascii")
+    sequence = np.frombuffer(sequence, dtype=np.uint8)
+
+    n_kmers = len(sequence) - k + 1
+    if n_kmers <= 0:
+        return (np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64))
+
+    codes = _CODE_TABLE[sequence]
+    kmers = np.zeros(n_kmers, dtype=np.uint64)
+    for idx in range(k):
+        kmers = (kmers << np.uint64(2)) | codes[idx : idx + n_kmers]
+
+    # dropping k-mers that overlap an ambiguous base
+    ambiguous_sum = np.concatenate(([0], np.cumsum(_AMBIGUOUS_TABLE[sequence])))
+    positions = np.flatnonzero(ambiguous_sum[k:] == ambiguous_sum[:n_kmers])
+
+    return (kmers[positions], positions)
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+def _shift_words(words: np.ndarray, phase: int) -> np.ndarray:
+    """Shifts packed words so that base `phase` becomes the first base
+
+    Parameters
+    ----------
+    words : np.ndarray
+        packed words
+    phase : int
+        number of bases to shift
+
+    Returns
+    -------
+    np.ndarray
+        shifted words, one word shorter than the input
+    """
+    if phase == 0:
+        return words[:-1]
+
+    shift = np.uint64(2 * phase)
+    return (words[:-1] >> shift) | (words[1:] << (np.uint64(64) - shift))
+
+
+def _count_word_mismatches(pattern: PackedSequence, windows, window_masks):
+    """Counts mismatching bases between a pattern and word aligned windows.
+    Ambiguous bases are counted as mismatches.
+
+    Parameters
+    ----------
+    pattern : PackedSequence
+        packed pattern
+    windows : np.ndarray
+        (n_windows, n_words) packed windows
+    window_masks : np.ndarray
+        (n_windows, n_words) ambiguity masks of the windows
+
+    Returns
+    -------
+    np.ndarray
+        number of mismatches per window
+    """
+    diff = (windows ^ pattern.words) | window_masks | pattern.mask
+    per_base = (diff | (diff >> np.uint64(1))) & _LOW_BITS
+
+    # ignoring bases after the end of the pattern
+    tail = pattern.length % BASES_PER_WORD
+    if tail != 0:
+        per_base[:, -1] &= np.uint64((1 << (2 * tail)) - 1)
+
+    return popcount(per_base).sum(axis=1, dtype=np.int64)
+
+
+def _shared_ambiguous_matches(pattern: PackedSequence, text: PackedSequence, n_windows):
+    """Counts positions per window where both sequences have the same
+    ambiguous base. These were counted as mismatches by the XOR kernel.
+
+    Parameters
+    ----------
+    pattern : PackedSequence
+        packed pattern
+    text : PackedSequence
+        packed text the pattern walks on
+    n_windows : int
+        number of windows
+
+    Returns
+    -------
+    np.ndarray
+        number of shared ambiguous bases per window
+    """
+    if len(pattern.ambiguous_positions) == 0 or len(text.ambiguous_positions) == 0:
+        return 0
+
+    offsets = np.subtract.outer(text.ambiguous_positions, pattern.ambiguous_positions)
+    same_base = np.equal.outer(text.ambiguous_bases, pattern.ambiguous_bases)
+    selected = same_base & (offsets >= 0) & (offsets < n_windows)
+
+    return np.bincount(offsets[selected], minlength=n_windows)
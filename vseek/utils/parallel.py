@@ -0,0 +1,292 @@
+from collections import Counter
+from multiprocessing import Pool
+
+# vseek imports
+from vseek.utils.classifier import ReadClassifier
+from vseek.utils.kmer_index import KmerIndex
+from vseek.utils.reference_catalog import ReferenceCatalog
+from vseek.utils.shared_arrays import (
+    attach_arrays,
+    prefixed_arrays,
+    share_arrays,
+    unprefixed_arrays,
+)
+from vseek.utils.sketches import AccessionSketches
+
+# per worker process state, set by _init_worker
+_WORKER = {}
+
+
+class ParallelClassifier:
+    """Classifies read batches in a pool of worker processes. The reference
+    catalog, seed index and accession sketches are placed once into a shared
+    memory block that every worker attaches to, so the references are never
+    copied or pickled per worker. Only read sequences and per batch counts
+    cross process boundaries.
+
+    With a single worker the batches are classified in the calling process
+    and nothing is shared. Must be used as a context manager, the shared
+    memory block is released on exit.
+    """
+
+    def __init__(
+        self,
+        catalog: ReferenceCatalog,
+        threshold: float,
+        workers: int,
+        index=None,
+        sketches=None,
+        floor: float = 0.0,
+        reorder_every: int = 100,
+        backend=None,
+        scoring_mode: str = "hamming",
+        exact_match: bool = False,
+        sample_stride=None,
+    ):
+        """
+        Parameters
+        ----------
+        catalog : ReferenceCatalog
+            encoded reference gene sequences
+        threshold : float
+            minimum similarity score for a gene to be considered
+        workers : int
+            number of worker processes
+        index : KmerIndex, optional
+            seed index of the catalog, default None scans every window
+        sketches : AccessionSketches, TaxonomySearch, optional
+            accession sketches used to screen read batches, default None
+            disables screening
+        floor : float, optional
+            minimum estimated containment of the sketch screening
+        reorder_every : int, optional
+            number of reads classified by a worker between accession
+            reorderings, default is 100
+        backend : str, optional
+            scoring backend used for genes scanned in full, default None
+            uses the threshold-aware early abandoning scan
+        scoring_mode : str, optional
+            "hamming" or "edit" (indel tolerant), default is "hamming"
+        exact_match : bool, optional
+            resolves reads occurring exactly in a gene without scoring them,
+            default is False
+        sample_stride : int, optional
+            largest spacing of the sampled estimate of full scans, default
+            None disables the estimate
+        """
+        self.catalog = catalog
+        self.threshold = threshold
+        self.workers = workers
+        self.index = index
+        self.sketches = sketches
+        self.floor = floor
+        self.reorder_every = reorder_every
+        self.backend = backend
+        self.scoring_mode = scoring_mode
+        self.exact_match = exact_match
+        self.sample_stride = sample_stride
+
+        self._block = None
+        self._pool = None
+        self._classifier = None
+
+    def __enter__(self):
+        if self.workers == 1:
+            self._classifier = ReadClassifier(
+                self.catalog,
+                threshold=self.threshold,
+                index=self.index,
+                reorder_every=self.reorder_every,
+                backend=self.backend,
+                scoring_mode=self.scoring_mode,
+                exact_match=self.exact_match,
+                sample_stride=self.sample_stride,
+            )
+            return self
+
+        arrays = prefixed_arrays("catalog", self.catalog.to_arrays())
+        if self.index is not None:
+            arrays.update(prefixed_arrays("index", self.index.to_arrays()))
+        if self.sketches is not None:
+            arrays.update(prefixed_arrays("sketches", self.sketches.to_arrays()))
+
+        self._block, handle = share_arrays(arrays)
+        try:
+            self._pool = Pool(
+                self.workers,
+                initializer=_init_worker,
+                initargs=(
+                    handle,
+                    self.threshold,
+                    self.floor,
+                    self.reorder_every,
+                    self.backend,
+                    self.scoring_mode,
+                    type(self.sketches),
+                    self.exact_match,
+                    self.sample_stride,
+                ),
+            )
+        except Exception:
+            self._release()
+            raise
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._pool is not None:
+            if exc_type is None:
+                self._pool.close()
+            else:
+                self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+        self._classifier = None
+        self._release()
+
+    def imap(self, read_batches):
+        """Classifies read batches in the worker processes, results are
+        returned in the order of the batches
+
+        Parameters
+        ----------
+        read_batches : iterable
+            batches (lists) of read sequences as strings
+
+        Returns
+        -------
+        iterator
+            (batch counts, scanning counters) of each batch, both as
+            collections.Counter
+        """
+        if self._classifier is not None:
+            return (
+                _classify_with(self._classifier, read_batch, self.sketches, self.floor)
+                for read_batch in read_batches
+            )
+        if self._pool is None:
+            raise RuntimeError("ParallelClassifier must be used as a context manager")
+
+        return self._pool.imap(_classify_batch, read_batches)
+
+    def _release(self) -> None:
+        """Closes and removes the shared memory block"""
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+def _init_worker(
+    handle,
+    threshold: float,
+    floor: float,
+    reorder_every: int,
+    backend=None,
+    scoring_mode: str = "hamming",
+    sketches_type=AccessionSketches,
+    exact_match: bool = False,
+    sample_stride=None,
+):
+    """Attaches a worker process to the shared references and builds its
+    read classifier
+
+    Parameters
+    ----------
+    handle : SharedArraysHandle
+        handle of the shared references
+    threshold : float
+        minimum similarity score for a gene to be considered
+    floor : float
+        minimum estimated containment of the sketch screening
+    reorder_every : int
+        number of classified reads between accession reorderings
+    backend : str, optional
+        scoring backend used for genes scanned in full
+    scoring_mode : str, optional
+        "hamming" or "edit" (indel tolerant)
+    sketches_type : type, optional
+        class rebuilding the screening sketches from their arrays, default
+        is AccessionSketches
+    exact_match : bool, optional
+        resolves reads occurring exactly in a gene without scoring them
+    sample_stride : int, optional
+        largest spacing of the sampled estimate of full scans
+    """
+    block, arrays = attach_arrays(handle)
+
+    catalog = ReferenceCatalog.from_arrays(unprefixed_arrays("catalog", arrays))
+    index_arrays = unprefixed_arrays("index", arrays)
+    sketch_arrays = unprefixed_arrays("sketches", arrays)
+
+    index = KmerIndex.from_arrays(index_arrays) if index_arrays else None
+    sketches = sketches_type.from_arrays(sketch_arrays) if sketch_arrays else None
+
+    # the block must stay referenced while the arrays are in use
+    _WORKER["block"] = block
+    _WORKER["sketches"] = sketches
+    _WORKER["floor"] = floor
+    _WORKER["classifier"] = ReadClassifier(
+        catalog,
+        threshold=threshold,
+        index=index,
+        reorder_every=reorder_every,
+        backend=backend,
+        scoring_mode=scoring_mode,
+        exact_match=exact_match,
+        sample_stride=sample_stride,
+    )
+
+
+def _classify_batch(read_batch: list) -> tuple:
+    """Classifies one read batch inside a worker process
+
+    Parameters
+    ----------
+    read_batch : list
+        read sequences
+
+    Returns
+    -------
+    tuple
+        batch counts and the scanning counters collected for this batch
+    """
+    return _classify_with(
+        _WORKER["classifier"], read_batch, _WORKER["sketches"], _WORKER["floor"]
+    )
+
+
+def _classify_with(
+    classifier: ReadClassifier, read_batch: list, sketches, floor: float
+) -> tuple:
+    """Classifies one read batch and collects the scanning counters of that
+    batch only
+
+    Parameters
+    ----------
+    classifier : ReadClassifier
+        classifier of the current process
+    read_batch : list
+        read sequences
+    sketches : AccessionSketches, TaxonomySearch
+        screening sketches, None disables screening
+    floor : float
+        minimum estimated containment of the sketch screening
+
+    Returns
+    -------
+    tuple
+        batch counts and the scanning counters collected for this batch,
+        "reads" counting the reads of the batch
+    """
+    batch_counts = classifier.classify_batch(read_batch, sketches=sketches, floor=floor)
+
+    batch_stats = Counter(classifier.stats)
+    batch_stats["reads"] += len(read_batch)
+    classifier.stats.clear()
+
+    return (batch_counts, batch_stats)
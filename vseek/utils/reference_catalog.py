@@ -0,0 +1,363 @@
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+# vseek imports
+import vseek.common.loader as vloader
+from vseek.utils.vseek_analysis import encode_sequence
+
+# overlapping annotations are merged when they share at least this many
+# bases, must be at least the longest read length for scores to be exact
+DEFAULT_MERGE_OVERLAP = 250
+
+
+class ReferenceCatalog:
+    """In-memory catalog of all annotated viral gene sequences. The genome
+    database is parsed once and the genes of every accession are stored
+    back to back in one uint8 encoded buffer, so classifying a read does not
+    touch the file system and an accession is scanned in a single pass:
+    buffers: accession id -> concatenated gene sequences
+    gene_offsets: accession id -> start of each gene in the buffer, plus
+        the end
+    genes: accession id -> gene sequences, views of the buffer
+
+    Identical sequences are detected once. Every gene has the id of its
+    unique sequence, so a read never needs to score the same sequence twice:
+    sequence_ids: accession id -> unique sequence id of each gene
+    sequence_sources: unique sequence id -> (accession id, gene number) of
+        every gene sharing the sequence
+    gene_sources: accession id -> annotated gene numbers merged into each
+        gene
+    """
+
+    def __init__(self, genes: dict, gene_sources=None):
+        """
+        Parameters
+        ----------
+        genes : dict
+            accession id and list of gene sequences as key value pairs
+        gene_sources : dict, optional
+            accession id and, for each gene, the tuple of annotated gene
+            numbers it was merged from. Default None means every gene is
+            one annotated gene
+        """
+        buffers = {}
+        gene_offsets = {}
+        for acc_id, gene_sequences in genes.items():
+            gene_sequences = [encode_sequence(gene) for gene in gene_sequences]
+            buffers[acc_id] = np.concatenate([np.empty(0, np.uint8)] + gene_sequences)
+            gene_offsets[acc_id] = np.cumsum(
+                [0] + [len(gene) for gene in gene_sequences], dtype=np.int64
+            )
+
+        self._set_buffers(buffers, gene_offsets, gene_sources)
+
+    @classmethod
+    def from_database(cls, accessions=None, merge_overlap=None):
+        """Loads the annotated genes of the genome database
+
+        Parameters
+        ----------
+        accessions : list[str], optional
+            accession ids to load, default None loads all accessions
+        merge_overlap : int, optional
+            overlapping annotations of an accession sharing at least this
+            many bases (and both at least as long) are merged into their
+            union. Must be at least the longest read length. Default None
+            keeps every annotation as is
+
+        Returns
+        -------
+        ReferenceCatalog
+            catalog containing the encoded gene sequences
+        """
+        if not merge_overlap:
+            return cls(vloader.load_all_viral_genes(accessions))
+
+        genes = {}
+        gene_sources = {}
+        all_intervals = vloader.load_all_viral_gene_intervals(accessions)
+        for acc_id, (viral_genome, intervals) in all_intervals.items():
+            merged = merge_intervals(intervals, merge_overlap, len(viral_genome))
+            genes[acc_id] = [viral_genome[beg : end + 1] for beg, end, _ in merged]
+            gene_sources[acc_id] = [sources for _, _, sources in merged]
+
+        return cls(genes, gene_sources)
+
+    @classmethod
+    def from_arrays(cls, arrays: dict):
+        """Rebuilds a catalog from the arrays returned by to_arrays. Accession
+        buffers and gene sequences are views of the given sequence buffer,
+        nothing is copied.
+
+        Parameters
+        ----------
+        arrays : dict
+            arrays returned by to_arrays
+
+        Returns
+        -------
+        ReferenceCatalog
+            catalog backed by the given arrays
+        """
+        sequences = arrays["sequences"]
+        all_offsets = arrays["gene_offsets"]
+        gene_bounds = np.cumsum(np.concatenate(([0], arrays["gene_counts"])))
+        source_bounds = np.cumsum(np.concatenate(([0], arrays["source_counts"])))
+        source_genes = arrays["source_genes"].tolist()
+
+        buffers = {}
+        gene_offsets = {}
+        gene_sources = {}
+        for acc_idx, acc_id in enumerate(arrays["accessions"].tolist()):
+            first_gene = gene_bounds[acc_idx]
+            last_gene = gene_bounds[acc_idx + 1]
+            acc_offsets = all_offsets[first_gene : last_gene + 1]
+            buffers[acc_id] = sequences[acc_offsets[0] : acc_offsets[-1]]
+            gene_offsets[acc_id] = acc_offsets - acc_offsets[0]
+            gene_sources[acc_id] = [
+                tuple(source_genes[source_bounds[gene_id] : source_bounds[gene_id + 1]])
+                for gene_id in range(first_gene, last_gene)
+            ]
+
+        catalog = cls.__new__(cls)
+        catalog._set_buffers(buffers, gene_offsets, gene_sources)
+
+        return catalog
+
+    def to_arrays(self) -> dict:
+        """Flattens the catalog into plain numpy arrays, e.g. to place it
+        into shared memory
+
+        Returns
+        -------
+        dict
+            sequences: all accession buffers concatenated
+            gene_offsets: start of each gene in sequences, plus the end
+            gene_counts: number of genes of each accession
+            source_genes: annotated gene numbers merged into each gene
+            source_counts: number of annotated genes merged into each gene
+            accessions: accession ids
+        """
+        buffer_starts = np.cumsum(
+            [0] + [len(buffer) for buffer in self.buffers.values()], dtype=np.int64
+        )
+        all_offsets = [
+            gene_offsets[:-1] + buffer_start
+            for gene_offsets, buffer_start in zip(
+                self.gene_offsets.values(), buffer_starts
+            )
+        ]
+        all_sources = [
+            sources for acc_id in self.genes for sources in self.gene_sources[acc_id]
+        ]
+
+        return {
+            "sequences": np.concatenate(
+                [np.empty(0, np.uint8)] + list(self.buffers.values())
+            ),
+            "gene_offsets": np.concatenate(
+                [np.empty(0, np.int64)] + all_offsets + [buffer_starts[-1:]]
+            ),
+            "gene_counts": np.array(
+                [len(genes) for genes in self.genes.values()], dtype=np.int64
+            ),
+            "source_genes": np.array(
+                [gene_no for sources in all_sources for gene_no in sources],
+                dtype=np.int64,
+            ),
+            "source_counts": np.array(
+                [len(sources) for sources in all_sources], dtype=np.int64
+            ),
+            "accessions": np.array(self.accessions),
+        }
+
+    @classmethod
+    def load(cls, file_path: str):
+        """Loads a catalog saved with ReferenceCatalog.save
+
+        Parameters
+        ----------
+        file_path : str
+            path to the catalog file
+
+        Returns
+        -------
+        ReferenceCatalog
+            loaded catalog
+        """
+        with np.load(file_path) as catalog_file:
+            return cls.from_arrays(dict(catalog_file))
+
+    def save(self, file_path: str) -> None:
+        """Saves the catalog into a numpy .npz file
+
+        Parameters
+        ----------
+        file_path : str
+            path where the catalog is saved
+        """
+        with open(Path(file_path), "wb") as outfile:
+            np.savez(outfile, **self.to_arrays())
+
+    def window_ranges(self, acc_id: str, window_length: int, gene_numbers=None):
+        """Ranges of the windows of the accession buffer lying inside a
+        single gene, windows spanning a gene boundary are left out
+
+        Parameters
+        ----------
+        acc_id : str
+            accession id
+        window_length : int
+            window length, e.g. the read length
+        gene_numbers : list[int], optional
+            genes whose windows are returned, default None uses all genes
+
+        Returns
+        -------
+        np.ndarray
+            (n, 2) int64 array of [start, stop) window offsets in the
+            buffer, genes shorter than the window have no range
+        """
+        gene_offsets = self.gene_offsets[acc_id]
+        if gene_numbers is None:
+            gene_numbers = range(len(gene_offsets) - 1)
+        gene_numbers = np.asarray(gene_numbers, dtype=np.int64)
+
+        starts = gene_offsets[gene_numbers]
+        stops = gene_offsets[gene_numbers + 1] - window_length + 1
+        in_gene = stops > starts
+
+        return np.stack((starts[in_gene], stops[in_gene]), axis=1)
+
+    @property
+    def accessions(self) -> list[str]:
+        """list of accession ids in the catalog"""
+        return list(self.genes.keys())
+
+    @property
+    def total_length(self) -> int:
+        """total number of bases stored in the catalog"""
+        return sum(len(gene) for genes in self.genes.values() for gene in genes)
+
+    @property
+    def unique_length(self) -> int:
+        """number of bases of the unique sequences, i.e. scanned by a read
+        visiting every accession"""
+        unique_lengths = {}
+        for acc_id, gene_sequences in self.genes.items():
+            for seq_id, gene in zip(self.sequence_ids[acc_id], gene_sequences):
+                unique_lengths[seq_id] = len(gene)
+
+        return sum(unique_lengths.values())
+
+    def items(self):
+        """Iterates over accession ids and their encoded gene sequences"""
+        return self.genes.items()
+
+    def __getitem__(self, acc_id: str) -> list[np.ndarray]:
+        return self.genes[acc_id]
+
+    def __contains__(self, acc_id: str) -> bool:
+        return acc_id in self.genes
+
+    def __iter__(self):
+        return iter(self.genes)
+
+    def __len__(self) -> int:
+        return len(self.genes)
+
+    def _set_buffers(self, buffers: dict, gene_offsets: dict, gene_sources=None):
+        """Stores the accession buffers, slices the gene views and finds the
+        unique sequences
+
+        Parameters
+        ----------
+        buffers : dict
+            accession id and uint8 concatenated gene sequences
+        gene_offsets : dict
+            accession id and start of each gene in its buffer, plus the end
+        gene_sources : dict, optional
+            accession id and annotated gene numbers merged into each gene
+        """
+        self.buffers = buffers
+        self.gene_offsets = gene_offsets
+        self.genes = {}
+        self.sequence_ids = {}
+        self.sequence_sources = []
+
+        unique_sequences = {}
+        for acc_id, buffer in buffers.items():
+            offsets = gene_offsets[acc_id].tolist()
+            self.genes[acc_id] = []
+            self.sequence_ids[acc_id] = []
+            for gene_no, (beg, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+                gene = buffer[beg:end]
+                digest = hashlib.blake2b(gene.tobytes(), digest_size=16).digest()
+                if digest not in unique_sequences:
+                    unique_sequences[digest] = len(self.sequence_sources)
+                    self.sequence_sources.append([])
+
+                sequence_id = unique_sequences[digest]
+                self.genes[acc_id].append(gene)
+                self.sequence_ids[acc_id].append(sequence_id)
+                self.sequence_sources[sequence_id].append((acc_id, gene_no))
+
+        if gene_sources is None:
+            gene_sources = {
+                acc_id: [(gene_no,) for gene_no in range(len(gene_sequences))]
+                for acc_id, gene_sequences in self.genes.items()
+            }
+        self.gene_sources = gene_sources
+
+
+def merge_intervals(
+    intervals: list[tuple], min_overlap: int, genome_length: int
+) -> list[tuple]:
+    """Collapses overlapping gene intervals into their union. Two intervals
+    are only merged if they share at least `min_overlap` bases and both are
+    at least that long: every window of that length inside the union then
+    lies inside one of the original intervals, so the best window score is
+    unchanged. Nested intervals are absorbed under the same condition.
+
+    Parameters
+    ----------
+    intervals : list[tuple]
+        inclusive (begin, end) gene intervals
+    min_overlap : int
+        minimum number of shared bases, at least the longest read length
+    genome_length : int
+        genome length, annotations running past the genome end are clipped
+
+    Returns
+    -------
+    list[tuple]
+        inclusive (begin, end, annotated gene numbers) merged intervals,
+        sorted by begin
+    """
+    order = sorted(range(len(intervals)), key=lambda gene_no: intervals[gene_no])
+
+    merged = []
+    current = None
+    for gene_no in order:
+        beg, end = intervals[gene_no]
+        end = min(end, genome_length - 1)
+
+        # short (or reversed) annotations are never merged
+        if end - beg + 1 < min_overlap:
+            merged.append((beg, intervals[gene_no][1], (gene_no,)))
+            continue
+
+        if current is not None and min(current[1], end) - beg + 1 >= min_overlap:
+            current = (current[0], max(current[1], end), current[2] + (gene_no,))
+            continue
+
+        if current is not None:
+            merged.append(current)
+        current = (beg, end, (gene_no,))
+
+    if current is not None:
+        merged.append(current)
+
+    return sorted(merged, key=lambda interval: interval[:2])
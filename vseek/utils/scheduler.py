@@ -0,0 +1,408 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# vseek imports
+from vseek.utils.classifier import classify_read, _exact_match_winner
+from vseek.utils.exact_match import ExactMatcher
+from vseek.utils.reference_catalog import ReferenceCatalog
+from vseek.utils.vseek_analysis import encode_sequence
+
+# reference bases per block. The packed text words of a block (8 bytes per
+# base) then stay within a typical L2/L3 cache
+DEFAULT_BLOCK_BASES = 64 * 1024
+
+# reads per tile
+DEFAULT_TILE_READS = 64
+
+
+class TiledScheduler:
+    """Discovery scheduler splitting the classification of a read batch into
+    tiles of (read slice x reference block). Reference blocks hold about the
+    same number of bases, large accessions being split across blocks, so
+    tiles take similar times whatever the accession sizes. Tiles are run by
+    a pool of threads taking the next tile as soon as they are free, the
+    numpy and compiled kernels release the GIL while comparing windows.
+
+    The top score of a read in each block is reduced across blocks at the
+    end of the batch. Ties go to the accession listed first in the catalog,
+    so results are the ones of classify_read. Meanwhile the best score of
+    every read found by finished tiles is shared with the next tiles, which
+    only look for scores at least as high. Every tile is timed, see
+    timing_report, to tune the block and tile sizes of a machine.
+
+    Must be used as a context manager, the threads are released on exit.
+    """
+
+    def __init__(
+        self,
+        catalog: ReferenceCatalog,
+        threshold: float,
+        workers: int,
+        index=None,
+        sketches=None,
+        floor: float = 0.0,
+        backend=None,
+        scoring_mode: str = "hamming",
+        exact_match: bool = False,
+        sample_stride=None,
+        block_bases: int = DEFAULT_BLOCK_BASES,
+        tile_reads: int = DEFAULT_TILE_READS,
+    ):
+        """
+        Parameters
+        ----------
+        catalog : ReferenceCatalog
+            encoded reference gene sequences
+        threshold : float
+            minimum similarity score for a gene to be considered
+        workers : int
+            number of threads
+        index : KmerIndex, optional
+            seed index of the catalog, default None scans every window
+        sketches : AccessionSketches, TaxonomySearch, optional
+            sketches used to screen read batches, default None disables
+            screening
+        floor : float, optional
+            minimum estimated containment of the sketch screening
+        backend : str, optional
+            scoring backend used for genes scanned in full
+        scoring_mode : str, optional
+            "hamming" or "edit" (indel tolerant), default is "hamming"
+        exact_match : bool, optional
+            resolves reads occurring exactly in a gene without scoring them,
+            default is False
+        sample_stride : int, optional
+            largest spacing of the sampled estimate of full scans, default
+            None disables the estimate
+        block_bases : int, optional
+            reference bases per block, default is 65536
+        tile_reads : int, optional
+            reads per tile, default is 64
+        """
+        self.catalog = catalog
+        self.threshold = threshold
+        self.workers = workers
+        self.index = index
+        self.sketches = sketches
+        self.floor = floor
+        self.backend = backend
+        self.scoring_mode = scoring_mode
+        self.sample_stride = sample_stride
+        self.exact_matcher = ExactMatcher(catalog) if exact_match else None
+        self.tile_reads = tile_reads
+        self.blocks = reference_blocks(catalog, block_bases)
+        self.block_lengths = [_block_length(catalog, block) for block in self.blocks]
+        self.tile_timings = []
+
+        self._rank = {acc_id: rank for rank, acc_id in enumerate(catalog.accessions)}
+        self._pool = None
+        self._n_batches = 0
+
+    def __enter__(self):
+        self._pool = ThreadPoolExecutor(self.workers)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._pool.shutdown(wait=True, cancel_futures=exc_type is not None)
+        self._pool = None
+
+    def classify(self, reads: list, accessions=None, stats=None) -> list[tuple]:
+        """Classifies a batch of reads tile by tile
+
+        Parameters
+        ----------
+        reads : list
+            meta-genomic reads
+        accessions : list[list[str]], optional
+            accession ids allowed for each read, e.g. the output of the
+            sketch screening. Default None allows all accessions
+        stats : collections.Counter, optional
+            scanning counters
+
+        Returns
+        -------
+        list[tuple]
+            top scoring accession id and score of each read, (None, 0.0)
+            for reads that did not match any accession
+        """
+        reads = [encode_sequence(read) for read in reads]
+        if accessions is None:
+            accessions = [None] * len(reads)
+        accessions = [
+            None if read_accessions is None else set(read_accessions)
+            for read_accessions in accessions
+        ]
+
+        # best score of each read so far, a lower bound of its final score
+        read_best = [0.0] * len(reads)
+
+        candidates = [None] * len(reads)
+        if self.index is not None:
+            candidates = [self.index.candidate_windows(read) for read in reads]
+
+        # large blocks first, so that small tiles fill the gaps at the end
+        block_order = sorted(
+            range(len(self.blocks)), key=lambda block_no: -self.block_lengths[block_no]
+        )
+        futures = [
+            self._pool.submit(
+                self._classify_tile,
+                reads,
+                accessions,
+                candidates,
+                read_best,
+                range(start, min(start + self.tile_reads, len(reads))),
+                block_no,
+            )
+            for block_no in block_order
+            for start in range(0, len(reads), self.tile_reads)
+        ]
+
+        # reducing the top scores of every read across blocks
+        best = [(0.0, 0, None)] * len(reads)
+        for future in futures:
+            tile_results, tile_stats, tile_timing = future.result()
+            for read_no, (acc_id, score) in tile_results:
+                if acc_id is None:
+                    continue
+                candidate = (score, -self._rank[acc_id], acc_id)
+                if candidate[:2] > best[read_no][:2]:
+                    best[read_no] = candidate
+
+            tile_timing["batch"] = self._n_batches
+            self.tile_timings.append(tile_timing)
+            if stats is not None:
+                stats.update(tile_stats)
+
+        self._n_batches += 1
+
+        return [
+            (acc_id, score) if acc_id is not None else (None, 0.0)
+            for score, _, acc_id in best
+        ]
+
+    def imap(self, read_batches):
+        """Screens and classifies read batches, same interface as
+        ParallelClassifier.imap
+
+        Parameters
+        ----------
+        read_batches : iterable
+            batches (lists) of read sequences
+
+        Returns
+        -------
+        iterator
+            (batch counts, scanning counters) of each batch, "reads"
+            counting the reads of the batch
+        """
+        for read_batch in read_batches:
+            batch_stats = Counter(reads=len(read_batch))
+            reads = [encode_sequence(read) for read in read_batch]
+            batch_accessions = [None] * len(reads)
+            if self.sketches is not None:
+                batch_accessions = self.sketches.screen(
+                    reads, self.floor, stats=batch_stats
+                )
+
+            # reads occurring exactly in a gene are resolved without tiles
+            batch_counts = Counter()
+            if self.exact_matcher is not None:
+                unresolved = []
+                batch_exact_accessions = self.exact_matcher.find(reads)
+                for read_no, exact_accessions in enumerate(batch_exact_accessions):
+                    accessions = batch_accessions[read_no]
+                    if accessions is None:
+                        accessions = self.catalog.accessions
+
+                    acc_id = None
+                    if exact_accessions:
+                        acc_id = _exact_match_winner(
+                            reads[read_no], self.catalog, accessions, exact_accessions
+                        )
+                    if acc_id is None:
+                        unresolved.append(read_no)
+                        continue
+                    batch_counts[acc_id] += 1
+                    batch_stats["exact_hits"] += 1
+
+                reads = [reads[read_no] for read_no in unresolved]
+                batch_accessions = [batch_accessions[read_no] for read_no in unresolved]
+
+            results = self.classify(reads, batch_accessions, stats=batch_stats)
+            for acc_id, score in results:
+                if acc_id is not None:
+                    batch_counts[acc_id] += 1
+
+            yield (batch_counts, batch_stats)
+
+    def timing_report(self) -> str:
+        """Summarizes the tile timings recorded so far
+
+        Returns
+        -------
+        str
+            number of tiles, mean and slowest tile time, and time per
+            reference base and read, in a few lines
+        """
+        if len(self.tile_timings) == 0:
+            return "No tile classified"
+
+        seconds = np.array([timing["seconds"] for timing in self.tile_timings])
+        work = np.array(
+            [timing["reads"] * timing["bases"] for timing in self.tile_timings]
+        )
+        slowest = self.tile_timings[int(seconds.argmax())]
+
+        return (
+            f"{len(seconds)} tiles of up to {self.tile_reads} reads x "
+            f"{len(self.blocks)} reference blocks, {seconds.sum():.2f} s in "
+            f"total on {self.workers} threads\n"
+            f"tile time: mean {seconds.mean() * 1000:.1f} ms, "
+            f"median {np.median(seconds) * 1000:.1f} ms, "
+            f"slowest {seconds.max() * 1000:.1f} ms "
+            f"(block {slowest['block']}, {slowest['reads']} reads x "
+            f"{slowest['bases']} bases)\n"
+            f"{seconds.sum() / max(work.sum(), 1) * 1e9:.2f} ns per read base"
+        )
+
+    def _classify_tile(
+        self,
+        reads: list,
+        accessions: list,
+        candidates: list,
+        read_best: list,
+        read_numbers: range,
+        block_no: int,
+    ) -> tuple:
+        """Classifies a slice of reads against one reference block
+
+        Parameters
+        ----------
+        reads : list
+            uint8 encoded reads of the batch
+        accessions : list
+            set of accession ids allowed for each read, or None
+        candidates : list
+            candidate windows of each read, or None
+        read_best : list
+            best score of each read found by other tiles, updated in place
+        read_numbers : range
+            reads of the tile
+        block_no : int
+            reference block of the tile
+
+        Returns
+        -------
+        tuple
+            (read number, (top scoring accession id, score)) of every read,
+            the tile scanning counters and the tile timing
+        """
+        started = time.perf_counter()
+        block = self.blocks[block_no]
+        tile_stats = Counter()
+
+        tile_results = []
+        for read_no in read_numbers:
+            block_accessions = list(block)
+            if accessions[read_no] is not None:
+                block_accessions = [
+                    acc_id for acc_id in block if acc_id in accessions[read_no]
+                ]
+
+            # just below the best score, ties with other blocks are found and
+            # then broken on the catalog order
+            result = classify_read(
+                reads[read_no],
+                self.catalog,
+                self.threshold,
+                index=self.index,
+                accessions=block_accessions,
+                stats=tile_stats,
+                backend=self.backend,
+                scoring_mode=self.scoring_mode,
+                sample_stride=self.sample_stride,
+                accession_genes=block,
+                candidates=candidates[read_no],
+                best=float(np.nextafter(read_best[read_no], 0.0)),
+            )
+            tile_results.append((read_no, result))
+
+            # unsynchronized, a lost update only loosens the bound of
+            # other tiles: any stored score is one a block really reached
+            if result[0] is not None and result[1] > read_best[read_no]:
+                read_best[read_no] = result[1]
+
+        tile_timing = {
+            "block": block_no,
+            "reads": len(read_numbers),
+            "bases": self.block_lengths[block_no],
+            "seconds": time.perf_counter() - started,
+        }
+
+        return (tile_results, tile_stats, tile_timing)
+
+
+def reference_blocks(
+    catalog: ReferenceCatalog, block_bases: int = DEFAULT_BLOCK_BASES
+) -> list[dict]:
+    """Packs the catalog genes, in catalog order, into blocks of about
+    `block_bases` bases. Genes longer than a block get a block of their own
+
+    Parameters
+    ----------
+    catalog : ReferenceCatalog
+        encoded reference gene sequences
+    block_bases : int, optional
+        reference bases per block, default is 65536
+
+    Returns
+    -------
+    list[dict]
+        accession id and gene numbers of each block, as key value pairs
+    """
+    blocks = []
+    block = {}
+    n_bases = 0
+    for acc_id, gene_sequences in catalog.items():
+        for gene_no, gene in enumerate(gene_sequences):
+            if n_bases > 0 and n_bases + len(gene) > block_bases:
+                blocks.append(block)
+                block = {}
+                n_bases = 0
+
+            block.setdefault(acc_id, []).append(gene_no)
+            n_bases += len(gene)
+
+    if len(block) > 0:
+        blocks.append(block)
+
+    return blocks
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+def _block_length(catalog: ReferenceCatalog, block: dict) -> int:
+    """Number of reference bases of a block
+
+    Parameters
+    ----------
+    catalog : ReferenceCatalog
+        encoded reference gene sequences
+    block : dict
+        accession id and gene numbers of the block
+
+    Returns
+    -------
+    int
+        total length of the block genes
+    """
+    return sum(
+        len(catalog[acc_id][gene_no])
+        for acc_id, gene_numbers in block.items()
+        for gene_no in gene_numbers
+    )
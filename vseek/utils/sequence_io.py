@@ -1,6 +1,13 @@
+import sys
 from pathlib import Path
-from vseek.common.errors import FastaFileNotFound
-from vseek.utils.data_structs import ReadRecord
+from vseek.common.errors import FastaFileNotFound, InvalidFileError
+from vseek.utils.data_structs import ReadBatch, ReadRecord
+
+# bytes read at once by SequenceIO.iter_fasta
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+# reads per ReadBatch yielded by SequenceIO.iter_batches
+DEFAULT_BATCH_SIZE = 1024
 
 
 class SequenceIO:
@@ -42,6 +49,116 @@ class SequenceIO:
 
                 entry.append(cleaned_line)
 
+            # the last record is not followed by a header
+            if len(entry) > 0:
+                yield self._convert(entry)
+
+    def iter_fasta(self, block_size: int = DEFAULT_BLOCK_SIZE):
+        """Reads the fasta records straight from large byte blocks of the
+        file. Record boundaries are found with bytes.rfind and bytes.split, so
+        no line is decoded or stripped. Sequences wrapped over several lines
+        (e.g. fastq-dump --fasta 60) are joined, unwrapped ones are yielded
+        as is.
+
+        Parameters
+        ----------
+        block_size : int, optional
+            bytes read at once, default is 1 MiB
+
+        Yields
+        ------
+        tuple[bytes, bytes]
+            header (without ">") and sequence of each record, the sequence
+            can be given to encode_sequence as is
+
+        Raises
+        ------
+        InvalidFileError
+            raised if the file does not start with a fasta header
+        """
+        with open(self.sequence_path, "rb") as fasta_file:
+            first_block = fasta_file.read(block_size)
+            if len(first_block) > 0 and first_block[:1] != b">":
+                raise InvalidFileError(
+                    f"{self.sequence_path} does not start with a fasta header"
+                )
+
+            # blocks read since the last record boundary
+            pending = []
+            block = first_block
+            while len(block) > 0:
+                cut = block.rfind(b"\n>")
+                if cut == -1:
+                    pending.append(block)
+                    block = fasta_file.read(block_size)
+                    continue
+
+                chunk = b"".join(pending + [block[:cut]])
+                pending = [block[cut + 1 :]]
+                yield from _split_records(chunk)
+                block = fasta_file.read(block_size)
+
+            # the last record is not followed by a header
+            yield from _split_records(b"".join(pending))
+
+    def iter_batches(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        group_by_length: bool = False,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+    ):
+        """Loads the fasta reads as ReadBatch of up to `batch_size` reads. A
+        batch only holds reads of one SRR id, taken from the header (e.g.
+        SRR12464727 in ">SRR12464727.1 1 length=151"). The fragment id is the
+        number following the SRR id, the position of the read in the file
+        (from 1) if there is none.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            maximum number of reads per batch, default is 1024
+        group_by_length : bool, optional
+            batches only hold reads of the same length (see
+            ReadBatch.as_matrix). Full batches are yielded as soon as they
+            are filled, the incomplete batch of each length at the end of
+            the sample. Default is False
+        block_size : int, optional
+            bytes read at once, default is 1 MiB
+
+        Yields
+        ------
+        ReadBatch
+            batch of encoded reads
+        """
+        # pending sequences and fragment ids of each read length (None if
+        # reads are not grouped)
+        groups = {}
+        sample_name = None
+        sample_id = None
+        for read_no, (header, sequence) in enumerate(
+            self.iter_fasta(block_size=block_size), start=1
+        ):
+            read_name = header.split(b" ", 1)[0]
+            read_sample_name, _, fragment_id = read_name.partition(b".")
+            if read_sample_name != sample_name:
+                yield from _group_batches(sample_id, groups)
+                groups = {}
+                sample_name = read_sample_name
+                sample_id = sys.intern(sample_name.decode())
+
+            group_key = len(sequence) if group_by_length else None
+            if group_key not in groups:
+                groups[group_key] = ([], [])
+            sequences, fragment_ids = groups[group_key]
+            sequences.append(sequence)
+            fragment_ids.append(int(fragment_id) if fragment_id.isdigit() else read_no)
+
+            if len(sequences) == batch_size:
+                yield ReadBatch.from_sequences(sample_id, fragment_ids, sequences)
+                del groups[group_key]
+
+        yield from _group_batches(sample_id, groups)
+
     def _convert(self, entry: list[str]):
         """converts entry into a FastaReadRecord
 
@@ -64,3 +181,50 @@ class SequenceIO:
         return ReadRecord(
             srr_id=header_id, fragment_id=frag_id, sequence=sequence, length=length
         )
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+def _split_records(chunk: bytes):
+    """Splits whole fasta records held in a bytes chunk
+
+    Parameters
+    ----------
+    chunk : bytes
+        fasta records, starting with ">"
+
+    Yields
+    ------
+    tuple[bytes, bytes]
+        header and sequence of each record
+    """
+    if len(chunk) == 0:
+        return
+    if b"\r" in chunk:
+        chunk = chunk.replace(b"\r", b"")
+
+    for record in chunk[1:].split(b"\n>"):
+        header, _, sequence = record.partition(b"\n")
+        yield (header, sequence.replace(b"\n", b""))
+
+
+def _group_batches(sample_id: str, groups: dict):
+    """Packs the pending reads of a sample, shortest reads first
+
+    Parameters
+    ----------
+    sample_id : str
+        SRR id of the reads
+    groups : dict
+        read length (None if reads are not grouped) and pending (sequences,
+        fragment ids) as key value pairs
+
+    Yields
+    ------
+    ReadBatch
+        batch of each group
+    """
+    for group_key in sorted(groups, key=lambda length: length or 0):
+        sequences, fragment_ids = groups[group_key]
+        yield ReadBatch.from_sequences(sample_id, fragment_ids, sequences)
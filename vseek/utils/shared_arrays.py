@@ -0,0 +1,117 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# start of every array inside the shared block is aligned to a cache line
+_ALIGNMENT = 64
+
+
+class SharedArraysHandle:
+    """Picklable description of numpy arrays stored in one shared memory
+    block. Only the block name and the array layouts are sent to other
+    processes, never the array contents.
+    name: shared memory block name
+    layout: (key, dtype, shape, byte offset) of each array
+    """
+
+    __slots__ = ("name", "layout")
+
+    def __init__(self, name: str, layout: list[tuple]):
+        self.name = name
+        self.layout = layout
+
+
+def share_arrays(arrays: dict) -> tuple:
+    """Copies numpy arrays into a new shared memory block
+
+    Parameters
+    ----------
+    arrays : dict
+        array names and numpy arrays as key value pairs
+
+    Returns
+    -------
+    tuple
+        SharedMemory block (the caller must close and unlink it) and the
+        SharedArraysHandle used to attach to it
+    """
+    layout = []
+    size = 0
+    for key, array in arrays.items():
+        array = np.asarray(array)
+        layout.append((key, array.dtype.str, array.shape, size))
+        size += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for (key, dtype, shape, offset), array in zip(layout, arrays.values()):
+        shared = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)
+        shared[...] = array
+
+    return (block, SharedArraysHandle(block.name, layout))
+
+
+def attach_arrays(handle: SharedArraysHandle) -> tuple:
+    """Attaches to arrays shared with share_arrays without copying them
+
+    Parameters
+    ----------
+    handle : SharedArraysHandle
+        handle returned by share_arrays
+
+    Returns
+    -------
+    tuple
+        SharedMemory block (must stay referenced while the arrays are used)
+        and the read-only arrays as a dictionary
+    """
+    block = shared_memory.SharedMemory(name=handle.name)
+    arrays = {}
+    for key, dtype, shape, offset in handle.layout:
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=offset)
+        array.flags.writeable = False
+        arrays[key] = array
+
+    return (block, arrays)
+
+
+def prefixed_arrays(prefix: str, arrays: dict) -> dict:
+    """Adds a prefix to array names so that several objects can share one
+    memory block or segment
+
+    Parameters
+    ----------
+    prefix : str
+        name prefix
+    arrays : dict
+        array names and numpy arrays as key value pairs
+
+    Returns
+    -------
+    dict
+        prefixed array names and numpy arrays as key value pairs
+    """
+    return {f"{prefix}/{key}": array for key, array in arrays.items()}
+
+
+def unprefixed_arrays(prefix: str, arrays: dict) -> dict:
+    """Selects the arrays with the given prefix and removes it from the names
+
+    Parameters
+    ----------
+    prefix : str
+        name prefix
+    arrays : dict
+        prefixed array names and numpy arrays as key value pairs
+
+    Returns
+    -------
+    dict
+        array names and numpy arrays as key value pairs, empty if no array
+        has the prefix
+    """
+    prefix = f"{prefix}/"
+    return {
+        key[len(prefix) :]: array
+        for key, array in arrays.items()
+        if key.startswith(prefix)
+    }
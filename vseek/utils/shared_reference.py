@@ -0,0 +1,370 @@
+import os
+import json
+import fcntl
+import mmap
+import struct
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+
+import numpy as np
+
+# first bytes of every segment file, followed by the format version
+SEGMENT_MAGIC = b"VSEEKREF"
+SEGMENT_VERSION = 1
+
+# magic, format version and length of the JSON layout that follows
+_HEADER = struct.Struct("<8sIQ")
+
+# start of every array inside the segment is aligned to a cache line
+_ALIGNMENT = 64
+
+
+class SharedReference:
+    """Encoded references published once per node into a memory-mapped
+    segment file, so that concurrent VSeek runs attach to them read-only
+    instead of loading and encoding the genome database each. The file
+    starts with a versioned header describing the array layout, segments
+    written by another format version are rebuilt.
+
+    Runs using a segment register their PID next to it under a file lock,
+    once per open.
+    The last run to close the segment removes it, and segments left by runs
+    that died are removed by the next run opening any segment.
+
+    path: segment file
+    arrays: read-only arrays of the segment, set by open
+    published: True if this process built the segment
+    """
+
+    def __init__(self, name: str, build, directory=None):
+        """
+        Parameters
+        ----------
+        name : str
+            segment name, e.g. from segment_name. Runs using the same name
+            share the segment
+        build : callable
+            called without arguments if the segment does not exist yet,
+            returns the array names and numpy arrays to publish
+        directory : str, optional
+            directory of the segment files. Default None uses /dev/shm when
+            available, the temporary directory otherwise
+        """
+        if directory is None:
+            directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+            directory = directory or tempfile.gettempdir()
+
+        self.name = name
+        self.build = build
+        self.directory = Path(directory)
+        self.path = self.directory / f"{name}.seg"
+        self.arrays = None
+        self.published = False
+
+        self._mmap = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self) -> dict:
+        """Attaches to the segment, publishing it first if it is missing or
+        has another format version
+
+        Returns
+        -------
+        dict
+            array names and read-only numpy arrays as key value pairs
+        """
+        remove_stale_segments(self.directory, keep=self.name)
+
+        with _locked(self.path):
+            layout = _read_layout(self.path)
+            if layout is None:
+                _write_segment(self.path, self.build())
+                layout = _read_layout(self.path)
+                self.published = True
+
+            with open(self.path, "rb") as segment_file:
+                self._mmap = mmap.mmap(
+                    segment_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            pids = _live_pids(_registry_path(self.path))
+            _write_pids(_registry_path(self.path), pids + [os.getpid()])
+
+        self.arrays = {}
+        for key, dtype, shape, offset in layout:
+            self.arrays[key] = np.ndarray(
+                tuple(shape), dtype=dtype, buffer=self._mmap, offset=offset
+            )
+
+        return self.arrays
+
+    def close(self) -> None:
+        """Detaches from the segment, removing it if no other run uses it.
+        Arrays already handed out stay valid until they are released"""
+        if self._mmap is None:
+            return
+
+        with _locked(self.path):
+            pids = _live_pids(_registry_path(self.path))
+            if os.getpid() in pids:
+                pids.remove(os.getpid())
+            if pids:
+                _write_pids(_registry_path(self.path), pids)
+            else:
+                _remove_segment(self.path)
+
+        self.arrays = None
+        self._mmap = None
+
+    @property
+    def users(self) -> int:
+        """number of opened and not yet closed SharedReference of the
+        segment, in all live processes"""
+        with _locked(self.path):
+            return len(_live_pids(_registry_path(self.path)))
+
+
+def segment_name(inputs_hash: str) -> str:
+    """Names the segment of a database build. The name changes whenever the
+    genome database or the build parameters change
+
+    Parameters
+    ----------
+    inputs_hash : str
+        inputs hash of the database artifacts (see db_artifacts.inputs_hash)
+
+    Returns
+    -------
+    str
+        segment name
+    """
+    return f"vseek-reference-{inputs_hash[:16]}"
+
+
+def remove_stale_segments(directory: str, keep=None) -> list[str]:
+    """Removes the segments of a directory that no live process uses, e.g.
+    left by runs that died before closing them
+
+    Parameters
+    ----------
+    directory : str
+        directory of the segment files
+    keep : str, optional
+        name of a segment that is never removed
+
+    Returns
+    -------
+    list[str]
+        paths of the removed segments
+    """
+    removed = []
+    for segment_path in sorted(Path(directory).glob("vseek-*.seg")):
+        if segment_path.stem == keep:
+            continue
+        with _locked(segment_path):
+            if segment_path.is_file() and not _live_pids(_registry_path(segment_path)):
+                _remove_segment(segment_path)
+                removed.append(str(segment_path))
+
+    return removed
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+@contextmanager
+def _locked(segment_path: Path):
+    """Holds the exclusive lock of a segment. The lock file is removed with
+    its segment, processes that were waiting on the removed file lock the
+    new one instead
+
+    Parameters
+    ----------
+    segment_path : Path
+        segment file
+    """
+    lock_path = _lock_path(segment_path)
+    while True:
+        lock_file = open(lock_path, "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+    try:
+        yield
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def _lock_path(segment_path: Path) -> Path:
+    """Returns the lock file of a segment
+
+    Parameters
+    ----------
+    segment_path : Path
+        segment file
+
+    Returns
+    -------
+    Path
+        lock file
+    """
+    return segment_path.with_suffix(".lock")
+
+
+def _registry_path(segment_path: Path) -> Path:
+    """Returns the file listing the PIDs attached to a segment
+
+    Parameters
+    ----------
+    segment_path : Path
+        segment file
+
+    Returns
+    -------
+    Path
+        PID registry file
+    """
+    return segment_path.with_suffix(".pids")
+
+
+def _live_pids(registry_path: Path) -> list[int]:
+    """Reads the PIDs of a registry, leaving out processes that are gone.
+    A PID is listed once per SharedReference it opened
+
+    Parameters
+    ----------
+    registry_path : Path
+        PID registry file
+
+    Returns
+    -------
+    list[int]
+        PIDs of the live processes
+    """
+    if not registry_path.is_file():
+        return []
+
+    pids = []
+    for line in registry_path.read_text().split():
+        pid = int(line)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            continue
+        except PermissionError:
+            pass
+        pids.append(pid)
+
+    return pids
+
+
+def _write_pids(registry_path: Path, pids: list[int]) -> None:
+    """Writes the PIDs of a registry
+
+    Parameters
+    ----------
+    registry_path : Path
+        PID registry file
+    pids : list[int]
+        PIDs of the processes attached to the segment
+    """
+    registry_path.write_text("".join(f"{pid}\n" for pid in sorted(pids)))
+
+
+def _read_layout(segment_path: Path):
+    """Reads the array layout of a segment header
+
+    Parameters
+    ----------
+    segment_path : Path
+        segment file
+
+    Returns
+    -------
+    list, None
+        (key, dtype, shape, byte offset) of each array, None if the segment
+        is missing, truncated or has another format version
+    """
+    if not segment_path.is_file():
+        return None
+
+    with open(segment_path, "rb") as segment_file:
+        header = segment_file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return None
+        magic, version, layout_length = _HEADER.unpack(header)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            return None
+
+        layout = json.loads(segment_file.read(layout_length))
+
+    return layout
+
+
+def _write_segment(segment_path: Path, arrays: dict) -> None:
+    """Writes arrays and their layout into a segment file. The file is
+    written under a temporary name and then renamed, runs still mapping a
+    previous version of it are not affected
+
+    Parameters
+    ----------
+    segment_path : Path
+        segment file
+    arrays : dict
+        array names and numpy arrays as key value pairs
+    """
+    arrays = {key: np.asarray(array) for key, array in arrays.items()}
+
+    # offsets depend on the layout length, which depends on the offsets
+    data_start = 0
+    while True:
+        layout = []
+        data_end = data_start
+        for key, array in arrays.items():
+            layout.append((key, array.dtype.str, array.shape, data_end))
+            data_end += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+        layout_bytes = json.dumps(layout).encode()
+        header_length = _HEADER.size + len(layout_bytes)
+        if header_length <= data_start:
+            break
+        data_start = -(-header_length // _ALIGNMENT) * _ALIGNMENT
+
+    temp_path = segment_path.with_suffix(f".tmp{os.getpid()}")
+    with open(temp_path, "wb") as segment_file:
+        segment_file.write(
+            _HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, len(layout_bytes))
+        )
+        segment_file.write(layout_bytes)
+        for (key, dtype, shape, offset), array in zip(layout, arrays.values()):
+            segment_file.seek(offset)
+            segment_file.write(array.tobytes())
+        segment_file.truncate(data_end)
+
+    os.replace(temp_path, segment_path)
+
+
+def _remove_segment(segment_path: Path) -> None:
+    """Removes a segment file, its PID registry and its lock file, which must
+    be held. Processes still mapping the segment keep their pages until they
+    release them
+
+    Parameters
+    ----------
+    segment_path : Path
+        segment file
+    """
+    segment_path.unlink(missing_ok=True)
+    _registry_path(segment_path).unlink(missing_ok=True)
+    _lock_path(segment_path).unlink(missing_ok=True)
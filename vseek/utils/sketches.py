@@ -0,0 +1,299 @@
+from pathlib import Path
+
+import numpy as np
+
+# vseek imports
+from vseek.utils.nucleotide_codec import kmer_codes
+from vseek.utils.reference_catalog import ReferenceCatalog
+
+DEFAULT_SKETCH_KMER_SIZE = 16
+
+# 1 out of every `scale` k-mer hashes is kept in the sketches (FracMinHash)
+DEFAULT_SKETCH_SCALE = 4
+
+_MAX_HASH = 2**64
+
+
+class AccessionSketches:
+    """Scaled MinHash (FracMinHash) sketches of every accession in the
+    reference catalog. A k-mer is kept when its hash falls below
+    2^64 / scale, so reads and accessions are sampled the same way and the
+    containment of a read in an accession can be estimated from the
+    sketches alone.
+
+    hashes: sorted uint64 hashes of all sketches
+    accession_ids: index of the accession each hash belongs to
+    """
+
+    def __init__(
+        self,
+        k: int,
+        scale: int,
+        hashes: np.ndarray,
+        accession_ids: np.ndarray,
+        accessions: list[str],
+    ):
+        """
+        Parameters
+        ----------
+        k : int
+            k-mer size
+        scale : int
+            sampling rate, 1 out of `scale` hashes is kept
+        hashes : np.ndarray
+            sorted uint64 hashes of all sketches
+        accession_ids : np.ndarray
+            index of the accession of each hash
+        accessions : list[str]
+            accession ids
+        """
+        self.k = k
+        self.scale = scale
+        self.hashes = hashes
+        self.accession_ids = accession_ids
+        self.accessions = accessions
+
+    @classmethod
+    def build(
+        cls,
+        catalog: ReferenceCatalog,
+        k: int = DEFAULT_SKETCH_KMER_SIZE,
+        scale: int = DEFAULT_SKETCH_SCALE,
+    ):
+        """Sketches the genes of every accession in the reference catalog
+
+        Parameters
+        ----------
+        catalog : ReferenceCatalog
+            encoded reference gene sequences
+        k : int, optional
+            k-mer size, default is 16
+        scale : int, optional
+            sampling rate, default is 4
+
+        Returns
+        -------
+        AccessionSketches
+            sketches of all accessions
+        """
+        all_hashes = []
+        all_accession_ids = []
+        for acc_idx, (acc_id, gene_sequences) in enumerate(catalog.items()):
+            acc_hashes = [_sketch_hashes(gene, k, scale) for gene in gene_sequences]
+            acc_hashes = np.unique(
+                np.concatenate([np.empty(0, np.uint64)] + acc_hashes)
+            )
+
+            all_hashes.append(acc_hashes)
+            all_accession_ids.append(np.full(len(acc_hashes), acc_idx, np.int32))
+
+        hashes = np.concatenate(all_hashes)
+        accession_ids = np.concatenate(all_accession_ids)
+        order = np.argsort(hashes, kind="stable")
+
+        return cls(
+            k=k,
+            scale=scale,
+            hashes=hashes[order],
+            accession_ids=accession_ids[order],
+            accessions=catalog.accessions,
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays: dict):
+        """Rebuilds sketches from the arrays returned by to_arrays
+
+        Parameters
+        ----------
+        arrays : dict
+            arrays returned by to_arrays
+
+        Returns
+        -------
+        AccessionSketches
+            sketches backed by the given arrays
+        """
+        return cls(
+            k=int(arrays["k"]),
+            scale=int(arrays["scale"]),
+            hashes=arrays["hashes"],
+            accession_ids=arrays["accession_ids"],
+            accessions=arrays["accessions"].tolist(),
+        )
+
+    def to_arrays(self) -> dict:
+        """Returns the sketches as plain numpy arrays
+
+        Returns
+        -------
+        dict
+            array names and numpy arrays as key value pairs
+        """
+        return {
+            "k": np.array(self.k),
+            "scale": np.array(self.scale),
+            "hashes": self.hashes,
+            "accession_ids": self.accession_ids,
+            "accessions": np.array(self.accessions),
+        }
+
+    @classmethod
+    def load(cls, file_path: str):
+        """Loads sketches saved with AccessionSketches.save
+
+        Parameters
+        ----------
+        file_path : str
+            path to the sketches file
+
+        Returns
+        -------
+        AccessionSketches
+            loaded sketches
+        """
+        with np.load(file_path) as sketch_file:
+            return cls.from_arrays(dict(sketch_file))
+
+    def save(self, file_path: str) -> None:
+        """Saves the sketches into a numpy .npz file
+
+        Parameters
+        ----------
+        file_path : str
+            path where the sketches are saved
+        """
+        with open(Path(file_path), "wb") as outfile:
+            np.savez(outfile, **self.to_arrays())
+
+    def containment(self, reads: list) -> np.ndarray:
+        """Estimates the fraction of each read's k-mers contained in each
+        accession, for a whole batch of reads at once
+
+        Parameters
+        ----------
+        reads : list
+            uint8 encoded meta-genomic reads
+
+        Returns
+        -------
+        np.ndarray
+            (n_reads, n_accessions) estimated containment
+        """
+        read_hashes = [_sketch_hashes(read, self.k, self.scale) for read in reads]
+        return self._containment(read_hashes)
+
+    def screen(self, reads: list, floor: float, stats=None) -> list[list[str]]:
+        """Selects, per read, the accessions whose estimated containment
+        passes the floor
+
+        Parameters
+        ----------
+        reads : list
+            uint8 encoded meta-genomic reads
+        floor : float
+            minimum estimated containment
+        stats : collections.Counter, optional
+            counter updated with the number of read and accession
+            containments estimated
+
+        Returns
+        -------
+        list[list[str]]
+            accession ids to score for each read, None for the reads
+            without any sampled k-mer (shorter than k or ambiguous), which
+            cannot be screened and are scored against all accessions
+        """
+        read_hashes = [_sketch_hashes(read, self.k, self.scale) for read in reads]
+        passing = self._containment(read_hashes) >= floor
+        accessions = np.array(self.accessions)
+        if stats is not None:
+            stats["screen_comparisons"] += passing.size
+
+        return [
+            accessions[read_passing].tolist() if len(hashes) > 0 else None
+            for read_passing, hashes in zip(passing, read_hashes)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def _containment(self, read_hashes: list) -> np.ndarray:
+        """Estimates the containment of sampled read hashes in each accession
+
+        Parameters
+        ----------
+        read_hashes : list
+            unique sampled uint64 hashes of each read
+
+        Returns
+        -------
+        np.ndarray
+            (n_reads, n_accessions) estimated containment
+        """
+        n_reads = len(read_hashes)
+        n_hashes = np.array([len(hashes) for hashes in read_hashes])
+        read_ids = np.repeat(np.arange(n_reads), n_hashes)
+        read_hashes = np.concatenate([np.empty(0, np.uint64)] + read_hashes)
+
+        # all (read, accession) pairs sharing a hash
+        starts = np.searchsorted(self.hashes, read_hashes, side="left")
+        ends = np.searchsorted(self.hashes, read_hashes, side="right")
+        n_hits = ends - starts
+        hit_read_ids = np.repeat(read_ids, n_hits)
+        hits = np.repeat(starts - np.cumsum(n_hits) + n_hits, n_hits)
+        hits += np.arange(len(hits))
+
+        n_accessions = len(self.accessions)
+        shared = np.bincount(
+            hit_read_ids * n_accessions + self.accession_ids[hits],
+            minlength=n_reads * n_accessions,
+        ).reshape(n_reads, n_accessions)
+
+        # reads without any sampled k-mer cannot be screened
+        return shared / np.maximum(n_hashes, 1)[:, None]
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+def _hash_kmers(kmers: np.ndarray) -> np.ndarray:
+    """Scrambles k-mer codes with the splitmix64 finalizer
+
+    Parameters
+    ----------
+    kmers : np.ndarray
+        uint64 k-mer codes
+
+    Returns
+    -------
+    np.ndarray
+        uint64 hashes
+    """
+    hashes = kmers + np.uint64(0x9E3779B97F4A7C15)
+    hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def _sketch_hashes(sequence: np.ndarray, k: int, scale: int) -> np.ndarray:
+    """Returns the unique k-mer hashes of a sequence kept by the sketch
+
+    Parameters
+    ----------
+    sequence : np.ndarray
+        uint8 encoded sequence
+    k : int
+        k-mer size
+    scale : int
+        sampling rate
+
+    Returns
+    -------
+    np.ndarray
+        unique sampled uint64 hashes
+    """
+    kmers, positions = kmer_codes(sequence, k)
+    hashes = _hash_kmers(kmers)
+    max_hash = np.uint64(_MAX_HASH // scale - 1)
+
+    return np.unique(hashes[hashes <= max_hash])
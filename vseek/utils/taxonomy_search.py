@@ -0,0 +1,331 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# vseek imports
+import vseek.common.loader as vloader
+from vseek.utils.reference_catalog import ReferenceCatalog
+from vseek.utils.sketches import (
+    DEFAULT_SKETCH_KMER_SIZE,
+    DEFAULT_SKETCH_SCALE,
+    _sketch_hashes,
+)
+
+# levels of the search, from the coarsest to the accessions themselves
+TAXONOMY_LEVELS = ("family", "genus", "accession")
+
+# taxon name given to accessions without a family or genus
+UNCLASSIFIED_TAXON = "Unclassified"
+
+
+class TaxonomySearch:
+    """Coarse-to-fine screening of reads along the viral taxonomy. Every
+    family, genus and accession has a scaled MinHash (FracMinHash) sketch,
+    the sketch of a taxon being the union of the sketches below it. A read
+    is first screened against the families, then only against the genera of
+    the families it passes and finally only against the accessions of the
+    genera it passes.
+
+    The containment of a read in a taxon is never lower than in any of its
+    accessions, so pruning a family or genus never removes an accession
+    that passes the floor: the screened accessions are the same as with
+    AccessionSketches.screen, for a fraction of the comparisons.
+
+    Each level is an inverted index of the sketches of its taxa:
+    hashes: sorted uint64 hashes of all sketches of the level
+    taxon_ids: index of the taxon each hash belongs to
+    parents: index of the parent taxon in the level above
+    names: taxon names (accession ids for the last level)
+    """
+
+    def __init__(self, k: int, scale: int, levels: dict):
+        """
+        Parameters
+        ----------
+        k : int
+            k-mer size
+        scale : int
+            sampling rate, 1 out of `scale` hashes is kept
+        levels : dict
+            level name (see TAXONOMY_LEVELS) and dict of its hashes,
+            taxon_ids, parents and names arrays as key value pairs
+        """
+        self.k = k
+        self.scale = scale
+        self.levels = levels
+        self.accessions = levels["accession"]["names"].tolist()
+
+    @classmethod
+    def build(
+        cls,
+        catalog: ReferenceCatalog,
+        taxa=None,
+        k: int = DEFAULT_SKETCH_KMER_SIZE,
+        scale: int = DEFAULT_SKETCH_SCALE,
+    ):
+        """Sketches every accession of the catalog and its family and genus
+
+        Parameters
+        ----------
+        catalog : ReferenceCatalog
+            encoded reference gene sequences
+        taxa : dict, optional
+            accession id and (family, genus) as key value pairs. Default
+            None reads them from the bat virus table (see accession_taxa)
+        k : int, optional
+            k-mer size, default is 16
+        scale : int, optional
+            sampling rate, default is 4
+
+        Returns
+        -------
+        TaxonomySearch
+            taxonomy sketches of all accessions
+        """
+        if taxa is None:
+            taxa = accession_taxa(vloader.load_bat_virus_data())
+
+        # taxon path of every accession, genera are told apart by family
+        paths = []
+        for acc_id in catalog.accessions:
+            family, genus = taxa.get(acc_id, (UNCLASSIFIED_TAXON, UNCLASSIFIED_TAXON))
+            paths.append((family, (family, genus), acc_id))
+
+        accession_hashes = []
+        for acc_id, gene_sequences in catalog.items():
+            gene_hashes = [_sketch_hashes(gene, k, scale) for gene in gene_sequences]
+            accession_hashes.append(
+                np.unique(np.concatenate([np.empty(0, np.uint64)] + gene_hashes))
+            )
+
+        levels = {}
+        parent_ids = {None: 0}
+        for depth, level in enumerate(TAXONOMY_LEVELS):
+            taxon_ids = {}
+            members = []
+            parents = []
+            for acc_idx, path in enumerate(paths):
+                taxon = path[depth]
+                if taxon not in taxon_ids:
+                    taxon_ids[taxon] = len(members)
+                    members.append([])
+                    parents.append(parent_ids[path[depth - 1] if depth else None])
+                members[taxon_ids[taxon]].append(acc_idx)
+
+            taxon_hashes = [
+                np.unique(
+                    np.concatenate([accession_hashes[acc_idx] for acc_idx in acc_ids])
+                )
+                for acc_ids in members
+            ]
+            hashes = np.concatenate([np.empty(0, np.uint64)] + taxon_hashes)
+            hash_taxon_ids = np.repeat(
+                np.arange(len(members), dtype=np.int32),
+                [len(taxon_sketch) for taxon_sketch in taxon_hashes],
+            )
+            order = np.argsort(hashes, kind="stable")
+
+            names = [taxon[-1] if depth == 1 else taxon for taxon in taxon_ids]
+            levels[level] = {
+                "hashes": hashes[order],
+                "taxon_ids": hash_taxon_ids[order],
+                "parents": np.array(parents, dtype=np.int64),
+                "names": np.array(names),
+            }
+            parent_ids = taxon_ids
+
+        return cls(k=k, scale=scale, levels=levels)
+
+    @classmethod
+    def from_arrays(cls, arrays: dict):
+        """Rebuilds the taxonomy sketches from the arrays returned by
+        to_arrays
+
+        Parameters
+        ----------
+        arrays : dict
+            arrays returned by to_arrays
+
+        Returns
+        -------
+        TaxonomySearch
+            taxonomy sketches backed by the given arrays
+        """
+        levels = {
+            level: {
+                name: arrays[f"{level}_{name}"]
+                for name in ["hashes", "taxon_ids", "parents", "names"]
+            }
+            for level in TAXONOMY_LEVELS
+        }
+
+        return cls(k=int(arrays["k"]), scale=int(arrays["scale"]), levels=levels)
+
+    def to_arrays(self) -> dict:
+        """Returns the taxonomy sketches as plain numpy arrays
+
+        Returns
+        -------
+        dict
+            array names and numpy arrays as key value pairs
+        """
+        arrays = {"k": np.array(self.k), "scale": np.array(self.scale)}
+        for level, level_arrays in self.levels.items():
+            for name, array in level_arrays.items():
+                arrays[f"{level}_{name}"] = array
+
+        return arrays
+
+    @classmethod
+    def load(cls, file_path: str):
+        """Loads taxonomy sketches saved with TaxonomySearch.save
+
+        Parameters
+        ----------
+        file_path : str
+            path to the sketches file
+
+        Returns
+        -------
+        TaxonomySearch
+            loaded taxonomy sketches
+        """
+        with np.load(file_path) as sketch_file:
+            return cls.from_arrays(dict(sketch_file))
+
+    def save(self, file_path: str) -> None:
+        """Saves the taxonomy sketches into a numpy .npz file
+
+        Parameters
+        ----------
+        file_path : str
+            path where the sketches are saved
+        """
+        with open(Path(file_path), "wb") as outfile:
+            np.savez(outfile, **self.to_arrays())
+
+    def screen(self, reads: list, floor: float, stats=None) -> list[list[str]]:
+        """Selects, per read, the accessions whose estimated containment
+        passes the floor, descending only into the families and genera
+        whose containment passes it too
+
+        Parameters
+        ----------
+        reads : list
+            uint8 encoded meta-genomic reads
+        floor : float
+            minimum estimated containment
+        stats : collections.Counter, optional
+            counter updated with the number of read and taxon containments
+            estimated
+
+        Returns
+        -------
+        list[list[str]]
+            accession ids to score for each read, in catalog order, None for
+            the reads without any sampled k-mer (shorter than k or
+            ambiguous), which cannot be screened and are scored against all
+            accessions
+        """
+        read_hashes = [_sketch_hashes(read, self.k, self.scale) for read in reads]
+        n_hashes = np.array([len(hashes) for hashes in read_hashes], dtype=np.int64)
+        read_ids = np.repeat(np.arange(len(reads)), n_hashes)
+        read_hashes = np.concatenate([np.empty(0, np.uint64)] + read_hashes)
+
+        # (read, taxon) pairs passing the floor, the root passes for all reads
+        passing = np.ones((len(reads), 1), dtype=bool)
+        for level in TAXONOMY_LEVELS:
+            level_arrays = self.levels[level]
+            parents = level_arrays["parents"]
+            if stats is not None:
+                stats["screen_comparisons"] += int(
+                    passing.sum(axis=0)
+                    @ np.bincount(parents, minlength=passing.shape[1])
+                )
+
+            # only reads passing a parent taxon are looked up
+            alive = passing.any(axis=1)[read_ids]
+            shared = _shared_hashes(
+                level_arrays, read_hashes[alive], read_ids[alive], len(reads)
+            )
+
+            # reads without any sampled k-mer cannot be screened
+            containment = shared / np.maximum(n_hashes, 1)[:, None]
+            passing = (containment >= floor) & passing[:, parents]
+
+        accessions = np.array(self.accessions)
+
+        return [
+            accessions[read_passing].tolist() if read_n_hashes > 0 else None
+            for read_passing, read_n_hashes in zip(passing, n_hashes)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.levels["accession"]["hashes"])
+
+
+def accession_taxa(bat_virus_df: pd.DataFrame) -> dict:
+    """Family and genus of every representative accession of the bat virus
+    table, missing taxa are reported as unclassified
+
+    Parameters
+    ----------
+    bat_virus_df : pd.DataFrame
+        bat virus table (see loader.load_bat_virus_data)
+
+    Returns
+    -------
+    dict
+        accession id and (family, genus) as key value pairs
+    """
+    taxa_df = bat_virus_df[["Representative", "family", "genus"]].fillna(
+        UNCLASSIFIED_TAXON
+    )
+
+    return {
+        acc_id: (family, genus)
+        for acc_id, family, genus in taxa_df.itertuples(index=False, name=None)
+    }
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+def _shared_hashes(
+    level_arrays: dict, read_hashes: np.ndarray, read_ids: np.ndarray, n_reads: int
+) -> np.ndarray:
+    """Counts the sampled hashes every read shares with every taxon of a
+    level
+
+    Parameters
+    ----------
+    level_arrays : dict
+        hashes and taxon_ids of the taxa of a level
+    read_hashes : np.ndarray
+        sampled hashes of the reads, concatenated
+    read_ids : np.ndarray
+        read number of each hash
+    n_reads : int
+        number of reads
+
+    Returns
+    -------
+    np.ndarray
+        (n_reads, n_taxa) number of shared hashes
+    """
+    hashes = level_arrays["hashes"]
+    n_taxa = len(level_arrays["parents"])
+
+    # all (read, taxon) pairs sharing a hash
+    starts = np.searchsorted(hashes, read_hashes, side="left")
+    ends = np.searchsorted(hashes, read_hashes, side="right")
+    n_hits = ends - starts
+    hit_read_ids = np.repeat(read_ids, n_hits)
+    hits = np.repeat(starts - np.cumsum(n_hits) + n_hits, n_hits)
+    hits += np.arange(len(hits))
+
+    return np.bincount(
+        hit_read_ids * n_taxa + level_arrays["taxon_ids"][hits],
+        minlength=n_reads * n_taxa,
+    ).reshape(n_reads, n_taxa)
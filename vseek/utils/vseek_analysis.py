@@ -1,7 +1,48 @@
+import os
+import json
+import time
+import platform
+from functools import partial
+from pathlib import Path
+
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# vseek imports
+from vseek.utils.jit_kernels import NUMBA_AVAILABLE, window_min_mismatches
+from vseek.utils.nucleotide_codec import (
+    pack_sequence,
+    packed_mismatches,
+    packed_window_mismatches,
+)
+
+# number of windows compared per vectorized block, keeps the boolean
+# (windows x read length) intermediate at a few megabytes for long genes
+WINDOW_BLOCK_SIZE = 8192
+
+# number of read positions compared before checking the mismatch budget of
+# the remaining windows during threshold-aware scans
+ABANDON_BLOCK_SIZE = 16
+
+# cost of one FFT butterfly relative to one byte comparison of a sliding
+# scan, used to decide when correlating with FFTs is cheaper
+FFT_COST_RATIO = 1.5
 
+# number of one-hot windows multiplied per matrix product, keeps the float32
+# window block at a few megabytes for 150 bp reads
+GEMM_BLOCK_SIZE = 2048
 
-def dynamic_hamming(read: str, reference: str):
+# largest distance between the read positions compared by the sampled
+# estimate of sampled_hamming
+SAMPLE_STRIDE = 8
+
+# synthetic reference length and number of timed rounds used when
+# benchmarking the scoring backends and threshold-aware scans
+AUTOTUNE_REFERENCE_LENGTH = 2000
+AUTOTUNE_REPEATS = 3
+
+
+def dynamic_hamming(read: str, reference: str, backend: str = "python"):
     """Scoring is callculated per each step the read walks on the reference
 
     Parameters
@@ -10,12 +51,21 @@ def dynamic_hamming(read: str, reference: str):
         meta-genomic read
     reference : str
         reference sequence
+    backend : str, optional
+        scoring backend registered in SCORING_BACKENDS. "python" walks the
+        read one step at a time and is the reference implementation,
+        "numpy" compares strided windows, "packed" uses the 2-bit
+        XOR/popcount kernel, "fft" counts the matches of all offsets with
+        FFT correlations, "jit" runs the numba compiled loop (only
+        registered if numba is installed). Default is "python"
 
     Returns
     -------
     int, float
         score
     """
+    if backend != "python":
+        return get_scoring_backend(backend)(read, reference)
 
     start_idx = 0
     end_idx = len(read)
@@ -67,14 +117,14 @@ def dynamic_hamming(read: str, reference: str):
             scores.append(score)
 
     if top_score == 1.0:
-        return 1.0 - top_score
+        return float(top_score)
     elif isinstance(scores, float):
-        return 1.0 - scores
+        return float(1.0 - scores)
     elif len(scores) > 0:
-        return 1.0 - min(scores)
+        return float(1.0 - min(scores))
 
 
-def hamming_distance_score(read: str, reference: str):
+def hamming_distance_score(read: str, reference: str, backend: str = "python"):
     """Calculates dissimilarity scores using hamming distance calculations
 
     Parameters
@@ -83,12 +133,20 @@ def hamming_distance_score(read: str, reference: str):
         meta-genomic read
     reference : str
         reference sequence
+    backend : str, optional
+        "python" compares character arrays, "packed" uses the 2-bit
+        XOR/popcount kernel. Default is "python"
 
     Returns
     -------
     int, float
         hamming score
     """
+    if backend == "packed":
+        read = pack_sequence(read)
+        return packed_mismatches(read, pack_sequence(reference)) / read.length
+    elif backend != "python":
+        raise ValueError(f"{backend} is not a supported backend")
 
     # converting into numpy arrays
     if isinstance(read, str):
@@ -99,3 +157,928 @@ def hamming_distance_score(read: str, reference: str):
     read_ne_ref = read != reference
     score = np.average(read_ne_ref)
     return score
+
+
+def encode_sequence(sequence) -> np.ndarray:
+    """Encodes a nucleotide sequence into a uint8 array of its ASCII codes.
+    Character comparisons are preserved, so scores computed on the encoded
+    arrays are identical to the ones computed on the strings.
+
+    Parameters
+    ----------
+    sequence : str, bytes, np.ndarray
+        nucleotide sequence. Already encoded arrays are returned as is
+
+    Returns
+    -------
+    np.ndarray
+        uint8 encoded sequence
+    """
+    if isinstance(sequence, np.ndarray):
+        return sequence
+    if isinstance(sequence, str):
+        sequence = sequence.encode("ascii")
+
+    return np.frombuffer(sequence, dtype=np.uint8)
+
+
+def window_mismatches(read: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """Counts the mismatches of every window the read walks on the reference
+    in a single vectorized pass. If the read is larger than the reference,
+    the reference walks on the read instead (same as dynamic_hamming).
+    Long references are correlated with FFTs when that is cheaper.
+
+    Parameters
+    ----------
+    read : np.ndarray
+        uint8 encoded meta-genomic read
+    reference : np.ndarray
+        uint8 encoded reference sequence
+
+    Returns
+    -------
+    np.ndarray
+        number of mismatches at each window offset
+    """
+    if len(reference) > len(read):
+        pattern, text = read, reference
+    else:
+        pattern, text = reference, read
+
+    if _prefers_fft(pattern, len(text)):
+        return fft_window_mismatches(read, reference)
+
+    return strided_window_mismatches(read, reference)
+
+
+def strided_window_mismatches(read: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """Counts the mismatches of every window by comparing strided views of
+    the windows, without switching to FFT correlations
+
+    Parameters
+    ----------
+    read : np.ndarray
+        uint8 encoded meta-genomic read
+    reference : np.ndarray
+        uint8 encoded reference sequence
+
+    Returns
+    -------
+    np.ndarray
+        number of mismatches at each window offset (window_mismatches
+        convention)
+    """
+    if len(reference) > len(read):
+        pattern, text = read, reference
+    else:
+        pattern, text = reference, read
+
+    windows = sliding_window_view(text, len(pattern))
+    mismatches = np.empty(len(windows), dtype=np.int64)
+    for start in range(0, len(windows), WINDOW_BLOCK_SIZE):
+        block = windows[start : start + WINDOW_BLOCK_SIZE]
+        mismatches[start : start + len(block)] = np.count_nonzero(
+            block != pattern, axis=1
+        )
+
+    return mismatches
+
+
+def offset_mismatches(read: np.ndarray, reference: np.ndarray, offsets) -> np.ndarray:
+    """Counts the mismatches of selected windows only. Offsets follow the
+    same convention as window_mismatches: positions on the reference, or
+    positions on the read if the read is larger than the reference.
+
+    Parameters
+    ----------
+    read : np.ndarray
+        uint8 encoded meta-genomic read
+    reference : np.ndarray
+        uint8 encoded reference sequence
+    offsets : np.ndarray
+        window offsets to score
+
+    Returns
+    -------
+    np.ndarray
+        number of mismatches at each selected offset
+    """
+    if len(reference) > len(read):
+        pattern, text = read, reference
+    else:
+        pattern, text = reference, read
+
+    windows = sliding_window_view(text, len(pattern))
+    offsets = np.asarray(offsets, dtype=np.int64)
+    mismatches = np.empty(len(offsets), dtype=np.int64)
+    for start in range(0, len(offsets), WINDOW_BLOCK_SIZE):
+        block = windows[offsets[start : start + WINDOW_BLOCK_SIZE]]
+        mismatches[start : start + len(block)] = np.count_nonzero(
+            block != pattern, axis=1
+        )
+
+    return mismatches
+
+
+def vectorized_hamming(read, reference) -> float:
+    """Vectorized version of dynamic_hamming. Both sequences are encoded once
+    and all window offsets are scored at the same time.
+
+    Parameters
+    ----------
+    read : str, np.ndarray
+        meta-genomic read
+    reference : str, np.ndarray
+        reference sequence
+
+    Returns
+    -------
+    float
+        top similarity score
+    """
+    read = encode_sequence(read)
+    reference = encode_sequence(reference)
+    if len(read) == 0 or len(reference) == 0:
+        return 0.0
+
+    mismatches = window_mismatches(read, reference)
+    window_size = min(len(read), len(reference))
+
+    return 1.0 - int(mismatches.min()) / window_size
+
+
+def strided_hamming(read, reference) -> float:
+    """dynamic_hamming scores computed on strided window views only
+
+    Parameters
+    ----------
+    read : str, np.ndarray
+        meta-genomic read
+    reference : str, np.ndarray
+        reference sequence
+
+    Returns
+    -------
+    float
+        top similarity score
+    """
+    read = encode_sequence(read)
+    reference = encode_sequence(reference)
+    if len(read) == 0 or len(reference) == 0:
+        return 0.0
+
+    mismatches = strided_window_mismatches(read, reference)
+    window_size = min(len(read), len(reference))
+
+    return 1.0 - int(mismatches.min()) / window_size
+
+
+def packed_hamming(read, reference) -> float:
+    """dynamic_hamming scores computed on 2-bit packed sequences, 32 bases
+    are compared per XOR/popcount operation.
+
+    Parameters
+    ----------
+    read : str, np.ndarray, PackedSequence
+        meta-genomic read
+    reference : str, np.ndarray, PackedSequence
+        reference sequence
+
+    Returns
+    -------
+    float
+        top similarity score
+    """
+    read = pack_sequence(read)
+    reference = pack_sequence(reference)
+    if read.length == 0 or reference.length == 0:
+        return 0.0
+
+    mismatches = packed_window_mismatches(read, reference)
+    window_size = min(read.length, reference.length)
+
+    return 1.0 - int(mismatches.min()) / window_size
+
+
+def fft_window_mismatches(read: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """Counts the mismatches of every window with FFT cross-correlations.
+    Each symbol of the pattern is one-hot encoded into its own channel, the
+    channel correlations are summed in the frequency domain and inverted
+    once, which gives the number of matches at every offset. Counts are
+    rounded back to integers, so results are identical to window_mismatches.
+
+    Parameters
+    ----------
+    read : np.ndarray
+        uint8 encoded meta-genomic read
+    reference : np.ndarray
+        uint8 encoded reference sequence
+
+    Returns
+    -------
+    np.ndarray
+        number of mismatches at each window offset (window_mismatches
+        convention)
+    """
+    if len(reference) > len(read):
+        pattern, text = read, reference
+    else:
+        pattern, text = reference, read
+
+    # offsets never wrap around as long as the size covers the text
+    fft_size = _fft_size(len(text))
+    spectrum = np.zeros(fft_size // 2 + 1, dtype=np.complex128)
+    for symbol in np.unique(pattern):
+        text_channel = np.fft.rfft(text == symbol, fft_size)
+        pattern_channel = np.fft.rfft(pattern == symbol, fft_size)
+        spectrum += text_channel * np.conj(pattern_channel)
+
+    n_windows = len(text) - len(pattern) + 1
+    matches = np.rint(np.fft.irfft(spectrum, fft_size)[:n_windows])
+
+    return len(pattern) - matches.astype(np.int64)
+
+
+def fft_hamming(read, reference) -> float:
+    """dynamic_hamming scores computed with FFT correlations, efficient for
+    long references such as the large DNA virus genes
+
+    Parameters
+    ----------
+    read : str, np.ndarray
+        meta-genomic read
+    reference : str, np.ndarray
+        reference sequence
+
+    Returns
+    -------
+    float
+        top similarity score
+    """
+    read = encode_sequence(read)
+    reference = encode_sequence(reference)
+    if len(read) == 0 or len(reference) == 0:
+        return 0.0
+
+    mismatches = fft_window_mismatches(read, reference)
+    window_size = min(len(read), len(reference))
+
+    return 1.0 - int(mismatches.min()) / window_size
+
+
+def jit_hamming(read, reference) -> float:
+    """dynamic_hamming scores computed with the compiled early exit loop of
+    jit_kernels (numpy scan when numba is not installed)
+
+    Parameters
+    ----------
+    read : str, np.ndarray
+        meta-genomic read
+    reference : str, np.ndarray
+        reference sequence
+
+    Returns
+    -------
+    float
+        top similarity score
+    """
+    read = encode_sequence(read)
+    reference = encode_sequence(reference)
+    window_size = min(len(read), len(reference))
+    if window_size == 0:
+        return 0.0
+
+    min_mismatches = window_min_mismatches(read, reference, budget=window_size)
+
+    return 1.0 - min_mismatches / window_size
+
+
+def one_hot_encode(sequences: np.ndarray, symbols: np.ndarray) -> np.ndarray:
+    """One-hot encodes the last axis of encoded sequences. The dot product of
+    two encoded sequences is their number of matching positions.
+
+    Parameters
+    ----------
+    sequences : np.ndarray
+        uint8 encoded sequences, sequence positions on the last axis
+    symbols : np.ndarray
+        uint8 symbols with their own channel, other symbols never match
+
+    Returns
+    -------
+    np.ndarray
+        float32 array, the last axis holds (position, symbol) channels
+    """
+    one_hot = sequences[..., None] == symbols
+    return one_hot.reshape(*sequences.shape[:-1], -1).astype(np.float32)
+
+
+def batch_hamming(reads, reference) -> np.ndarray:
+    """dynamic_hamming scores of a batch of same-length reads against one
+    reference. Reads and windows are one-hot encoded and all read-window
+    match counts are computed as matrix products (BLAS GEMM), one block of
+    windows at a time.
+
+    Parameters
+    ----------
+    reads : list, np.ndarray
+        meta-genomic reads of the same length, or a (reads, length) uint8
+        array
+    reference : str, np.ndarray
+        reference sequence
+
+    Returns
+    -------
+    np.ndarray
+        top similarity score of each read
+    """
+    if not isinstance(reads, np.ndarray):
+        reads = [encode_sequence(read) for read in reads]
+        if len({len(read) for read in reads}) > 1:
+            raise ValueError("All reads of a batch must have the same length")
+        reads = np.stack(reads) if reads else np.empty((0, 0), np.uint8)
+    reference = encode_sequence(reference)
+
+    n_reads, read_length = reads.shape
+    window_size = min(read_length, len(reference))
+    if n_reads == 0 or window_size == 0:
+        return np.zeros(n_reads)
+
+    # symbols absent from the reads can not produce matches
+    symbols = np.unique(reads)
+    n_channels = len(symbols)
+    max_matches = np.zeros(n_reads, dtype=np.int64)
+    if len(reference) > read_length:
+        read_rows = one_hot_encode(reads, symbols)
+
+        # windows of the one-hot reference are strided views, never copied
+        reference_one_hot = one_hot_encode(reference[:, None], symbols)
+        windows = sliding_window_view(reference_one_hot, (read_length, n_channels))
+        windows = windows.reshape(-1, read_length * n_channels)
+        for start in range(0, len(windows), GEMM_BLOCK_SIZE):
+            block = windows[start : start + GEMM_BLOCK_SIZE]
+            matches = np.rint(read_rows @ block.T).astype(np.int64)
+            np.maximum(max_matches, matches.max(axis=1), out=max_matches)
+
+    # the reference walks on the reads instead
+    else:
+        gene_column = one_hot_encode(reference, symbols)
+        reads_one_hot = one_hot_encode(reads[..., None], symbols)
+        windows = sliding_window_view(
+            reads_one_hot, (len(reference), n_channels), axis=(1, 2)
+        )
+        windows = windows.reshape(n_reads, -1, len(reference) * n_channels)
+        reads_per_block = max(1, GEMM_BLOCK_SIZE // windows.shape[1])
+        for start in range(0, n_reads, reads_per_block):
+            block = windows[start : start + reads_per_block]
+            matches = np.rint(block @ gene_column).astype(np.int64)
+            max_matches[start : start + reads_per_block] = matches.max(axis=1)
+
+    return 1.0 - (window_size - max_matches) / window_size
+
+
+def mismatch_budget(length: int, threshold: float, best: float = 0.0) -> int:
+    """Maximum number of mismatches a window of a given length can have while
+    still reaching the threshold and beating the current best score
+
+    Parameters
+    ----------
+    length : int
+        window length
+    threshold : float
+        minimum similarity score
+    best : float, optional
+        current best score, the window must score strictly higher.
+        Default is 0.0
+
+    Returns
+    -------
+    int
+        mismatch budget, negative if no window can qualify
+    """
+    # estimate corrected with the same expression used for scoring
+    budget = min(int((1.0 - threshold) * length), int((1.0 - best) * length)) + 1
+    while budget >= 0 and not (
+        1.0 - budget / length >= threshold and 1.0 - budget / length > best
+    ):
+        budget -= 1
+
+    return budget
+
+
+def thresholded_hamming(
+    read,
+    reference,
+    threshold: float,
+    best: float = 0.0,
+    offsets=None,
+    stats=None,
+    window_ranges=None,
+    compiled: bool = True,
+):
+    """Threshold-aware version of vectorized_hamming. Windows are compared
+    a few positions at a time and abandoned as soon as their mismatches
+    exceed the budget allowed by the threshold and the current best score.
+    Full scans run the compiled loop of jit_kernels when numba is installed,
+    unless compiled is False.
+
+    Parameters
+    ----------
+    read : str, np.ndarray
+        meta-genomic read
+    reference : str, np.ndarray
+        reference sequence
+    threshold : float
+        minimum similarity score
+    best : float, optional
+        current best score, only windows scoring strictly higher are
+        considered. Default is 0.0
+    offsets : np.ndarray, optional
+        window offsets to scan (window_mismatches convention). Default None
+        scans all windows
+    stats : collections.Counter, optional
+        counters updated with the number of genes skipped and windows
+        scanned and abandoned
+    window_ranges : np.ndarray, optional
+        (n, 2) array of [start, stop) window offsets scanned when offsets
+        is None, e.g. the windows lying inside a single gene of a
+        concatenated accession buffer. Default None scans all windows
+    compiled : bool, optional
+        runs full scans with the compiled loop when numba is installed,
+        False always uses the numpy scan. Default is True
+
+    Returns
+    -------
+    float, None
+        top similarity score, None if no window reaches the threshold and
+        beats the current best score
+    """
+    read = encode_sequence(read)
+    reference = encode_sequence(reference)
+    window_size = min(len(read), len(reference))
+    if window_size == 0:
+        return None
+
+    budget = mismatch_budget(window_size, threshold, best)
+    if budget < 0:
+        if stats is not None:
+            stats["genes_skipped"] += 1
+        return None
+
+    if offsets is None:
+        if window_ranges is None:
+            window_ranges = [(0, abs(len(read) - len(reference)) + 1)]
+        window_ranges = np.asarray(window_ranges, dtype=np.int64).reshape(-1, 2)
+        n_windows = int(np.sum(window_ranges[:, 1] - window_ranges[:, 0]))
+    else:
+        n_windows = len(offsets)
+
+    if offsets is None and compiled and NUMBA_AVAILABLE:
+        min_mismatches = window_min_mismatches(
+            read, reference, budget, stats, window_ranges
+        )
+        if stats is not None:
+            stats["genes_scored"] += 1
+            stats["windows_scanned"] += n_windows
+        if min_mismatches > budget:
+            return None
+        return 1.0 - min_mismatches / window_size
+
+    if len(reference) > len(read):
+        pattern, text = read, reference
+    else:
+        pattern, text = reference, read
+
+    windows = sliding_window_view(text, len(pattern))
+
+    # the first block is large enough for random windows to go over budget
+    first_cols = min(len(pattern), max(ABANDON_BLOCK_SIZE, 3 * (budget + 1) // 2))
+
+    if offsets is None and _prefers_fft(pattern, len(text), first_cols):
+        all_mismatches = fft_window_mismatches(read, reference)
+        min_mismatches = min(
+            [budget + 1]
+            + [
+                int(all_mismatches[start:stop].min())
+                for start, stop in window_ranges.tolist()
+                if stop > start
+            ]
+        )
+        if stats is not None:
+            stats["genes_scored"] += 1
+            stats["windows_scanned"] += n_windows
+        if min_mismatches > budget:
+            return None
+        return 1.0 - min_mismatches / window_size
+
+    # blocks of window offsets, never crossing the end of a range
+    if offsets is None:
+        blocks = [
+            (start, min(start + WINDOW_BLOCK_SIZE, stop))
+            for range_start, stop in window_ranges.tolist()
+            for start in range(range_start, stop, WINDOW_BLOCK_SIZE)
+        ]
+    else:
+        blocks = [
+            (start, start + WINDOW_BLOCK_SIZE)
+            for start in range(0, n_windows, WINDOW_BLOCK_SIZE)
+        ]
+
+    min_mismatches = budget + 1
+    n_abandoned = 0
+    for start, stop in blocks:
+        if offsets is None:
+            alive = np.arange(start, stop)
+            block = windows[start:stop, :first_cols]
+        else:
+            alive = offsets[start:stop]
+            block = windows[alive, :first_cols]
+        mismatches = np.count_nonzero(block != pattern[:first_cols], axis=1)
+
+        col = first_cols
+        while True:
+            # dropping windows that went over the budget
+            keep = mismatches <= budget
+            if col < len(pattern):
+                n_abandoned += len(keep) - np.count_nonzero(keep)
+            alive = alive[keep]
+            mismatches = mismatches[keep]
+            if len(alive) == 0 or col >= len(pattern):
+                break
+
+            end_col = col + ABANDON_BLOCK_SIZE
+            mismatches += np.count_nonzero(
+                windows[alive, col:end_col] != pattern[col:end_col], axis=1
+            )
+            col = end_col
+
+        if len(mismatches) > 0:
+            min_mismatches = min(min_mismatches, int(mismatches.min()))
+
+    if stats is not None:
+        stats["genes_scored"] += 1
+        stats["windows_scanned"] += n_windows
+        stats["windows_abandoned"] += int(n_abandoned)
+
+    if min_mismatches > budget:
+        return None
+
+    return 1.0 - min_mismatches / window_size
+
+
+def sampled_hamming(
+    read,
+    reference,
+    threshold: float,
+    best: float = 0.0,
+    stride: int = SAMPLE_STRIDE,
+    stats=None,
+    window_ranges=None,
+):
+    """Two-stage version of thresholded_hamming. Every window is first
+    compared on evenly spaced positions only. The mismatches found there
+    are a lower bound of the window mismatches, so a window whose sampled
+    mismatches exceed the budget can never reach the threshold, and the
+    remaining windows are scored exactly. No window passing the exact
+    scoring is dropped and the top score is the one of thresholded_hamming.
+
+    The positions are spaced at most `stride` apart and are dense enough
+    for random windows to exceed the mismatch budget, sparser samples could
+    not drop any window.
+
+    Parameters
+    ----------
+    read : str, np.ndarray
+        meta-genomic read
+    reference : str, np.ndarray
+        reference sequence
+    threshold : float
+        minimum similarity score
+    best : float, optional
+        current best score, only windows scoring strictly higher are
+        considered. Default is 0.0
+    stride : int, optional
+        largest distance between the sampled positions, default is 8
+    stats : collections.Counter, optional
+        counters updated with the number of windows estimated and passing
+        the estimate, plus the thresholded_hamming counters
+    window_ranges : np.ndarray, optional
+        (n, 2) array of [start, stop) window offsets to scan. Default None
+        scans all windows
+
+    Returns
+    -------
+    float, None
+        top similarity score, None if no window reaches the threshold and
+        beats the current best score
+    """
+    read = encode_sequence(read)
+    reference = encode_sequence(reference)
+    window_size = min(len(read), len(reference))
+    if window_size == 0:
+        return None
+
+    budget = mismatch_budget(window_size, threshold, best)
+    if budget < 0:
+        if stats is not None:
+            stats["genes_skipped"] += 1
+        return None
+
+    if len(reference) > len(read):
+        pattern, text = read, reference
+    else:
+        pattern, text = reference, read
+
+    windows = sliding_window_view(text, len(pattern))
+    if window_ranges is None:
+        window_ranges = [(0, len(windows))]
+    blocks = [
+        (start, min(start + WINDOW_BLOCK_SIZE, stop))
+        for range_start, stop in np.asarray(window_ranges).reshape(-1, 2).tolist()
+        for start in range(range_start, stop, WINDOW_BLOCK_SIZE)
+    ]
+
+    # same sample size as the first block of thresholded_hamming
+    n_sampled = max(ABANDON_BLOCK_SIZE, 3 * (budget + 1) // 2)
+    stride = max(1, min(stride, len(pattern) // n_sampled))
+    sampled_pattern = pattern[::stride]
+    unsampled = np.ones(len(pattern), dtype=bool)
+    unsampled[::stride] = False
+
+    min_mismatches = budget + 1
+    n_windows = 0
+    n_passed = 0
+    for start, stop in blocks:
+        # windows must beat the best one found so far, within the budget
+        sampled_mismatches = np.count_nonzero(
+            windows[start:stop, ::stride] != sampled_pattern, axis=1
+        )
+        alive = start + np.flatnonzero(sampled_mismatches < min_mismatches)
+        n_windows += stop - start
+        n_passed += len(alive)
+        if len(alive) == 0:
+            continue
+
+        # the other positions are added a few at a time, abandoning windows
+        # that can no longer beat the best one
+        mismatches = sampled_mismatches[alive - start]
+        for col in range(0, len(pattern), ABANDON_BLOCK_SIZE):
+            end_col = col + ABANDON_BLOCK_SIZE
+            mismatches += np.count_nonzero(
+                (windows[alive, col:end_col] != pattern[col:end_col])
+                & unsampled[col:end_col],
+                axis=1,
+            )
+            keep = mismatches < min_mismatches
+            alive = alive[keep]
+            mismatches = mismatches[keep]
+            if len(alive) == 0:
+                break
+
+        if len(mismatches) > 0:
+            min_mismatches = int(mismatches.min())
+            if min_mismatches == 0:
+                break
+
+    if stats is not None:
+        stats["genes_scored"] += 1
+        stats["windows_scanned"] += n_windows
+        stats["windows_sampled"] += n_windows
+        stats["windows_sample_passed"] += n_passed
+
+    if min_mismatches > budget:
+        return None
+
+    return 1.0 - min_mismatches / window_size
+
+
+# scoring backends sharing the dynamic_hamming contract:
+# scorer(read, reference) -> top similarity score
+SCORING_BACKENDS = {
+    "python": dynamic_hamming,
+    "numpy": strided_hamming,
+    "packed": packed_hamming,
+    "fft": fft_hamming,
+}
+if NUMBA_AVAILABLE:
+    SCORING_BACKENDS["jit"] = jit_hamming
+
+# threshold-aware scans sharing the thresholded_hamming contract:
+# scan(read, reference, threshold, best, stats=, window_ranges=) -> top
+# similarity score or None
+THRESHOLD_SCANS = {
+    "threshold_numpy": partial(thresholded_hamming, compiled=False),
+}
+if NUMBA_AVAILABLE:
+    THRESHOLD_SCANS["threshold_jit"] = thresholded_hamming
+
+
+def register_scoring_backend(name: str, scorer) -> None:
+    """Adds a scoring backend to SCORING_BACKENDS
+
+    Parameters
+    ----------
+    name : str
+        backend name
+    scorer : callable
+        scorer(read, reference) returning the top similarity score, must
+        give the same results as dynamic_hamming
+    """
+    SCORING_BACKENDS[name] = scorer
+
+
+def get_scoring_backend(name: str):
+    """Returns the scorer of a registered backend
+
+    Parameters
+    ----------
+    name : str
+        backend name
+
+    Returns
+    -------
+    callable
+        scorer(read, reference) returning the top similarity score
+    """
+    if name not in SCORING_BACKENDS:
+        raise ValueError(f"{name} is not a supported backend")
+
+    return SCORING_BACKENDS[name]
+
+
+def autotune_backend(read_lengths, candidates=None, cache_path=None) -> str:
+    """Benchmarks the scoring backends on synthetic reads and returns the
+    fastest one. Results are cached per CPU and read length distribution.
+
+    Parameters
+    ----------
+    read_lengths : list[int]
+        lengths of a sample of the reads to classify
+    candidates : list[str], optional
+        backends to benchmark. Default None benchmarks every registered
+        backend except the "python" reference implementation
+    cache_path : str, optional
+        JSON file caching the benchmark results, default None does not cache
+
+    Returns
+    -------
+    str
+        name of the fastest backend
+    """
+    if candidates is None:
+        candidates = [name for name in SCORING_BACKENDS if name != "python"]
+
+    scorers = {name: get_scoring_backend(name) for name in candidates}
+    return _fastest_scorer(scorers, read_lengths, cache_path)
+
+
+def autotune_threshold_scan(read_lengths, threshold: float, cache_path=None) -> str:
+    """Benchmarks the threshold-aware scans (see THRESHOLD_SCANS) on
+    synthetic reads and returns the fastest one. Results are cached per CPU,
+    read length distribution and threshold.
+
+    Parameters
+    ----------
+    read_lengths : list[int]
+        lengths of a sample of the reads to classify
+    threshold : float
+        minimum similarity score of the classification
+    cache_path : str, optional
+        JSON file caching the benchmark results, default None does not cache
+
+    Returns
+    -------
+    str
+        name of the fastest threshold-aware scan
+    """
+    scorers = {
+        name: partial(scan, threshold=threshold)
+        for name, scan in THRESHOLD_SCANS.items()
+    }
+    if len(scorers) == 1:
+        return next(iter(scorers))
+
+    return _fastest_scorer(scorers, read_lengths, cache_path, [str(threshold)])
+
+
+# -----------------------------
+# Private functions
+# -----------------------------
+def _fastest_scorer(
+    scorers: dict, read_lengths, cache_path=None, cache_fields=()
+) -> str:
+    """Times scorers on synthetic reads against a synthetic reference
+
+    Parameters
+    ----------
+    scorers : dict
+        name and scorer(read, reference) as key value pairs
+    read_lengths : list[int]
+        lengths of a sample of the reads to classify
+    cache_path : str, optional
+        JSON file caching the benchmark results, default None does not cache
+    cache_fields : list[str], optional
+        other settings the timings depend on, added to the cache key
+
+    Returns
+    -------
+    str
+        name of the fastest scorer
+    """
+    # a few representative read lengths of the distribution
+    lengths = sorted({int(q) for q in np.quantile(read_lengths, [0.25, 0.5, 0.75])})
+    cache_key = "|".join(
+        [
+            platform.machine(),
+            platform.processor(),
+            str(os.cpu_count()),
+            np.__version__,
+            ",".join(map(str, lengths)),
+            ",".join(sorted(scorers)),
+        ]
+        + list(cache_fields)
+    )
+
+    cache = {}
+    if cache_path is not None and Path(cache_path).is_file():
+        with open(cache_path, "r") as infile:
+            cache = json.load(infile)
+        if cache.get(cache_key) in scorers:
+            return cache[cache_key]
+
+    rng = np.random.default_rng(0)
+    bases = np.frombuffer(b"ACGT", dtype=np.uint8)
+    reference = bases[rng.integers(0, 4, AUTOTUNE_REFERENCE_LENGTH)]
+    reads = [bases[rng.integers(0, 4, length)] for length in lengths]
+
+    timings = {}
+    for name, scorer in scorers.items():
+        rounds = []
+        for _ in range(AUTOTUNE_REPEATS):
+            start = time.perf_counter()
+            for read in reads:
+                scorer(read, reference)
+            rounds.append(time.perf_counter() - start)
+        timings[name] = min(rounds)
+
+    fastest = min(timings, key=timings.get)
+    if cache_path is not None:
+        cache[cache_key] = fastest
+        with open(cache_path, "w") as outfile:
+            json.dump(cache, outfile, indent=4)
+
+    return fastest
+
+
+def _fft_size(length: int) -> int:
+    """Smallest FFT size of the form 2^n or 3 * 2^n covering the length
+
+    Parameters
+    ----------
+    length : int
+        minimum size
+
+    Returns
+    -------
+    int
+        FFT size
+    """
+    size = 1 << max(length - 1, 0).bit_length()
+    if 3 * size // 4 >= length and size >= 4:
+        return 3 * size // 4
+
+    return size
+
+
+def _prefers_fft(pattern: np.ndarray, text_length: int, n_columns=None) -> bool:
+    """Compares the cost of a sliding scan with the cost of FFT correlations
+
+    Parameters
+    ----------
+    pattern : np.ndarray
+        uint8 encoded sequence walking on the text
+    text_length : int
+        length of the sequence the pattern walks on
+    n_columns : int, optional
+        number of pattern positions compared per window by the sliding scan,
+        default None compares the whole pattern
+
+    Returns
+    -------
+    bool
+        True if FFT correlations are expected to be cheaper
+    """
+    if n_columns is None:
+        n_columns = len(pattern)
+
+    scan_cost = (text_length - len(pattern) + 1) * n_columns
+    fft_size = _fft_size(text_length)
+    # quick bound before counting the pattern symbols: at least one channel
+    if scan_cost <= FFT_COST_RATIO * 3 * fft_size * np.log2(fft_size):
+        return False
+
+    # two forward transforms per channel and one inverse transform
+    n_transforms = 2 * len(np.unique(pattern)) + 1
+    fft_cost = FFT_COST_RATIO * n_transforms * fft_size * np.log2(fft_size)
+
+    return scan_cost > fft_cost